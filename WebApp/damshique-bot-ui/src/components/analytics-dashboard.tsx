@@ -33,27 +33,38 @@ export default function AnalyticsDashboard() {
         setLoading(true);
         try {
             const token = getAdminToken();
-            const headers = { 'X-API-Token': token };
+            const headers = { 'X-API-Token': token, 'Content-Type': 'application/json' };
+            const start_date = dateRange.start.toISOString().split('T')[0];
+            const end_date = dateRange.end.toISOString().split('T')[0];
 
-            const [trendsRes, categoriesRes, merchantsRes, anomaliesRes, predictiveRes, budgetRes, topRes, recurRes] = await Promise.all([
-                fetch(`/api/analytics/spend-trends?period=${period}&interval=${interval}`, { headers }),
-                fetch(`/api/analytics/category-breakdown?start_date=${dateRange.start.toISOString().split('T')[0]}&end_date=${dateRange.end.toISOString().split('T')[0]}`, { headers }),
-                fetch(`/api/analytics/merchant-comparison?limit=10&start_date=${dateRange.start.toISOString().split('T')[0]}&end_date=${dateRange.end.toISOString().split('T')[0]}`, { headers }),
-                fetch('/api/analytics/anomalies', { headers }),
-                fetch('/api/analytics/predictive-spend', { headers }),
-                fetch('/api/analytics/budget-vs-actual', { headers }),
-                fetch('/api/analytics/top-expenses?limit=5', { headers }),
-                fetch('/api/analytics/recurring-costs', { headers })
-            ]);
+            // All widgets in one round-trip
+            const res = await fetch('/api/analytics/overview', {
+                method: 'POST',
+                headers,
+                body: JSON.stringify({
+                    widgets: [
+                        { id: 'trends', type: 'spend-trends', params: { period, interval } },
+                        { id: 'categories', type: 'category-breakdown', params: { start_date, end_date } },
+                        { id: 'merchants', type: 'merchant-comparison', params: { limit: 10, start_date, end_date } },
+                        { id: 'anomalies', type: 'anomalies' },
+                        { id: 'predictive', type: 'predictive-spend' },
+                        { id: 'budgets', type: 'budget-vs-actual' },
+                        { id: 'tops', type: 'top-expenses', params: { limit: 5 } },
+                        { id: 'recurring', type: 'recurring-costs' }
+                    ]
+                })
+            });
+            const overview = await res.json();
+            const widgets = overview.widgets || {};
 
-            const trends = await trendsRes.json();
-            const categories = await categoriesRes.json();
-            const merchants = await merchantsRes.json();
-            const anomaliesData = await anomaliesRes.json();
-            const predictiveData = await predictiveRes.json();
-            const budgets = await budgetRes.json();
-            const tops = await topRes.json();
-            const recurring = await recurRes.json();
+            const trends = widgets.trends || {};
+            const categories = widgets.categories || {};
+            const merchants = widgets.merchants || {};
+            const anomaliesData = widgets.anomalies || {};
+            const predictiveData = widgets.predictive || null;
+            const budgets = widgets.budgets;
+            const tops = widgets.tops;
+            const recurring = widgets.recurring;
 
             setTrendData(Array.isArray(trends.data) ? trends.data : []);
             setCategoryData(Array.isArray(categories.categories) ? categories.categories : []);
@@ -9,6 +9,7 @@ import "react-datepicker/dist/react-datepicker.css";
 
 import toast, { Toaster } from 'react-hot-toast';
 import { getAdminToken } from "../utils/auth";
+import { runExportJob, downloadExportJob } from "../utils/exportJobs";
 
 export default function InvoicesDashboard() {
   const [invoices, setInvoices] = useState<any[]>([]);
@@ -84,9 +85,18 @@ export default function InvoicesDashboard() {
   const handleExport = async () => {
     const startStr = dateRange.start ? dateRange.start.toISOString().split('T')[0] : "";
     const endStr = dateRange.end ? dateRange.end.toISOString().split('T')[0] : "";
-    const url = `/api/admin/export?start_date=${startStr}&end_date=${endStr}&token=${getAdminToken()}`;
-    window.open(url, '_blank');
     setShowExportModal(false);
+
+    const toastId = toast.loading("Preparing export...");
+    try {
+      const job = await runExportJob("invoices", { start_date: startStr, end_date: endStr }, "xlsx", (j) => {
+        toast.loading(`Exporting... ${j.rows_written.toLocaleString()} rows`, { id: toastId });
+      });
+      toast.success(`Export ready (${job.rows_written.toLocaleString()} rows)`, { id: toastId });
+      downloadExportJob(job);
+    } catch (err: any) {
+      toast.error(err.message || "Export failed", { id: toastId });
+    }
   };
 
   const handleBulkAction = async (action: 'approve' | 'reject' | 'delete') => {
@@ -2,12 +2,27 @@ import React, { useState, useEffect } from "react";
 import { BarChart3, TrendingUp, DollarSign, Users, Package, Download, Calendar, Filter, FileText, PieChart, Activity, ArrowUpRight, ArrowDownRight, User } from "lucide-react";
 
 import { getAdminToken } from "../utils/auth";
+import { runExportJob, downloadExportJob } from "../utils/exportJobs";
 
 export default function ReportsDashboard() {
   const [data, setData] = useState<any>(null);
   const [loading, setLoading] = useState(true);
   const [selectedPeriod, setSelectedPeriod] = useState("Last 6 Months");
 
+  const [exporting, setExporting] = useState<string | null>(null);
+
+  const handleExportReport = async () => {
+    setExporting("Preparing...");
+    try {
+      const job = await runExportJob("advanced-report", {}, "xlsx", (j) => setExporting(`${j.rows_written.toLocaleString()} rows...`));
+      downloadExportJob(job);
+    } catch (err: any) {
+      alert(err.message || "Export failed");
+    } finally {
+      setExporting(null);
+    }
+  };
+
   const periods = ["Last 7 Days", "Last 30 Days", "Last 3 Months", "Last 6 Months", "This Year", "Custom"];
 
   useEffect(() => {
@@ -53,10 +68,11 @@ export default function ReportsDashboard() {
                 {periods.map(p => <option key={p}>{p}</option>)}
               </select>
               <button
-                onClick={() => window.open(`/api/admin/export-advanced-report?token=${getAdminToken()}`, '_blank')}
+                onClick={handleExportReport}
+                disabled={!!exporting}
                 style={{ padding: "12px 20px", borderRadius: 12, border: "none", background: "linear-gradient(135deg, #3b82f6, #2563eb)", color: "#fff", fontSize: 14, fontWeight: 600, cursor: "pointer", display: "flex", alignItems: "center", gap: 8 }}
               >
-                <Download size={18} /> Export Full Report
+                <Download size={18} /> {exporting ? `Exporting ${exporting}` : "Export Full Report"}
               </button>
             </div>
           </div>
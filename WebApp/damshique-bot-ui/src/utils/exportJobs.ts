@@ -0,0 +1,50 @@
+import { getAdminToken } from "./auth";
+
+export interface ExportJob {
+    job_id: string;
+    kind: string;
+    format: string;
+    status: "queued" | "running" | "done" | "failed";
+    rows_written: number;
+    filename: string | null;
+    error: string | null;
+    download_url: string | null;
+}
+
+/**
+ * Queue a background export and resolve once its file is ready.
+ * Identical requests reuse the server's existing job, so double clicks are cheap.
+ * @param onProgress Called with each polled job state (rows_written grows while running)
+ */
+export async function runExportJob(
+    kind: string,
+    params: Record<string, any> = {},
+    format: string = "xlsx",
+    onProgress?: (job: ExportJob) => void
+): Promise<ExportJob> {
+    const headers = { "Content-Type": "application/json", "X-API-Token": getAdminToken() };
+    const res = await fetch("/api/admin/export-jobs", {
+        method: "POST",
+        headers,
+        body: JSON.stringify({ kind, format, params })
+    });
+    if (!res.ok) throw new Error((await res.json()).detail || "Failed to start export");
+
+    let job: ExportJob = await res.json();
+    while (job.status === "queued" || job.status === "running") {
+        onProgress?.(job);
+        await new Promise(resolve => setTimeout(resolve, 1500));
+        const poll = await fetch(`/api/admin/export-jobs/${job.job_id}`, { headers });
+        if (!poll.ok) throw new Error("Export job disappeared");
+        job = await poll.json();
+    }
+    if (job.status === "failed") throw new Error(job.error || "Export failed");
+    return job;
+}
+
+/**
+ * Open a finished job's file in a new tab (token in the URL, like the other export links).
+ */
+export function downloadExportJob(job: ExportJob): void {
+    if (job.download_url) window.open(`${job.download_url}?token=${getAdminToken()}`, "_blank");
+}
@@ -0,0 +1,320 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from typing import Dict, Any, Optional
+from storage.postgres_repository import get_db_connection
+from agent_orchestrator.keyed_scheduler import agent_scheduler
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKER_CONCURRENCY = int(os.getenv("INGEST_WORKER_CONCURRENCY", 4))
+# Claimed-but-unfinished jobs held in memory (running + waiting in a user lane)
+INGEST_MAX_INFLIGHT = int(os.getenv("INGEST_MAX_INFLIGHT", INGEST_WORKER_CONCURRENCY * 4))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", 5))
+INGEST_POLL_INTERVAL = float(os.getenv("INGEST_POLL_INTERVAL", 2))
+INGEST_JOB_TIMEOUT = float(os.getenv("INGEST_JOB_TIMEOUT", 600))
+INGEST_BACKOFF_BASE = float(os.getenv("INGEST_BACKOFF_BASE", 5))
+INGEST_BACKOFF_MAX = float(os.getenv("INGEST_BACKOFF_MAX", 600))
+INGEST_RETENTION_DAYS = int(os.getenv("INGEST_RETENTION_DAYS", 7))
+
+class IngestQueue:
+    """
+    Postgres-backed job queue between /webhook and run_agent_loop.
+    The webhook only enqueues; workers claim jobs with FOR UPDATE SKIP LOCKED,
+    retry failures with exponential backoff and dead-letter after max attempts.
+    Jobs survive restarts: a 'running' job whose worker died is reclaimed once
+    its lock is older than INGEST_JOB_TIMEOUT.
+
+    Jobs are claimed in arrival order by a single dispatcher and handed to the
+    keyed scheduler, which keeps strict FIFO per user_phone and runs different
+    users in parallel. A user's next message is only claimed once this
+    process has finished their previous one, and the claim query refuses to
+    start a message while an earlier one from the same user is waiting for a
+    retry or is held by another process, so ordering holds across restarts
+    and multiple workers. locked_at is refreshed when a job actually starts
+    (it may wait for a scheduler slot), and the stale-lock reclaim never
+    takes back a job this process still holds.
+    """
+
+    def __init__(self):
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._capacity = asyncio.Event()
+        self._running = False
+        self._inflight = 0
+        self._busy_users: Dict[str, int] = {}  # user_phone -> claimed, unfinished jobs in this process
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stats = {"enqueued": 0, "duplicates": 0, "completed": 0, "retried": 0, "dead": 0, "running": 0}
+
+    async def enqueue_message(self, msg: Dict[str, Any]) -> Optional[str]:
+        """
+        Records the message as processed and enqueues it in one statement.
+        Returns the job id, "" for a duplicate delivery, or None if the DB is unavailable.
+        """
+        conn = await get_db_connection()
+        if not conn:
+            return None
+
+        msg_id = msg.get("id", "TEST_ID")
+        try:
+            job_id = await conn.fetchval("""
+                WITH marked AS (
+                    INSERT INTO processed_messages (message_id, user_phone, message_type)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT DO NOTHING
+                    RETURNING message_id
+                )
+                INSERT INTO ingest_jobs (message_id, user_phone, payload, max_attempts)
+                SELECT message_id, $2, $4::jsonb, $5 FROM marked
+                ON CONFLICT (message_id) DO NOTHING
+                RETURNING job_id
+            """, msg_id, msg.get("from"), msg.get("type", "unknown"), json.dumps(msg), INGEST_MAX_ATTEMPTS)
+        finally:
+            await conn.close()
+
+        if not job_id:
+            self.stats["duplicates"] += 1
+            return ""
+
+        self.stats["enqueued"] += 1
+        self._wakeup.set()
+        return str(job_id)
+
+    async def _claim_job(self) -> Optional[Dict[str, Any]]:
+        conn = await get_db_connection()
+        if not conn:
+            return None
+        try:
+            row = await conn.fetchrow("""
+                UPDATE ingest_jobs
+                SET status = 'running', attempts = attempts + 1, locked_at = NOW(),
+                    claimed_by = $2, updated_at = NOW()
+                WHERE job_id = (
+                    SELECT j.job_id FROM ingest_jobs j
+                    WHERE ((j.status = 'queued' AND j.run_after <= NOW())
+                       OR (j.status = 'running' AND j.claimed_by IS DISTINCT FROM $2
+                           AND j.locked_at < NOW() - make_interval(secs => $1)))
+                      AND j.user_phone <> ALL($3::text[])
+                      AND NOT EXISTS (
+                          SELECT 1 FROM ingest_jobs e
+                          WHERE e.user_phone = j.user_phone
+                            AND e.created_at < j.created_at
+                            AND (e.status = 'queued'
+                                 OR (e.status = 'running' AND e.claimed_by IS DISTINCT FROM $2
+                                     AND e.locked_at >= NOW() - make_interval(secs => $1)))
+                      )
+                    ORDER BY j.created_at
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING job_id, message_id, user_phone, payload, attempts, max_attempts
+            """, INGEST_JOB_TIMEOUT, self.worker_id, list(self._busy_users))
+            if not row:
+                return None
+            job = dict(row)
+            job["payload"] = json.loads(job["payload"]) if isinstance(job["payload"], str) else job["payload"]
+            return job
+        finally:
+            await conn.close()
+
+    async def _mark_started(self, job_id):
+        """ Restarts the lock clock: the job may have waited for a scheduler slot since it was claimed. """
+        conn = await get_db_connection()
+        if not conn: return
+        try:
+            await conn.execute("""
+                UPDATE ingest_jobs SET locked_at = NOW(), updated_at = NOW()
+                WHERE job_id = $1 AND claimed_by = $2
+            """, job_id, self.worker_id)
+        finally:
+            await conn.close()
+
+    async def _complete_job(self, job_id):
+        conn = await get_db_connection()
+        if not conn: return
+        try:
+            await conn.execute("""
+                UPDATE ingest_jobs
+                SET status = 'done', last_error = NULL, locked_at = NULL, finished_at = NOW(), updated_at = NOW()
+                WHERE job_id = $1
+            """, job_id)
+        finally:
+            await conn.close()
+
+    async def _fail_job(self, job: Dict[str, Any], error: str):
+        is_dead = job["attempts"] >= job["max_attempts"]
+        backoff = min(INGEST_BACKOFF_MAX, INGEST_BACKOFF_BASE * (2 ** (job["attempts"] - 1)))
+
+        conn = await get_db_connection()
+        if not conn: return
+        try:
+            if is_dead:
+                await conn.execute("""
+                    UPDATE ingest_jobs
+                    SET status = 'dead', last_error = $2, locked_at = NULL, finished_at = NOW(), updated_at = NOW()
+                    WHERE job_id = $1
+                """, job["job_id"], error)
+            else:
+                await conn.execute("""
+                    UPDATE ingest_jobs
+                    SET status = 'queued', last_error = $2, locked_at = NULL,
+                        run_after = NOW() + make_interval(secs => $3), updated_at = NOW()
+                    WHERE job_id = $1
+                """, job["job_id"], error, backoff)
+        finally:
+            await conn.close()
+
+        if is_dead:
+            self.stats["dead"] += 1
+            logger.error(f"☠️ Ingest job {job['job_id']} (message {job['message_id']}) dead-lettered after {job['attempts']} attempts: {error}")
+        else:
+            self.stats["retried"] += 1
+            logger.warning(f"🔁 Ingest job {job['job_id']} failed (attempt {job['attempts']}/{job['max_attempts']}), retrying in {backoff:.0f}s: {error}")
+
+    async def process_job(self, job: Dict[str, Any]):
+        """ Media download + agent hand-off for one WhatsApp message (formerly done inline in /webhook). """
+        from agent_orchestrator.orchestrator import run_agent_loop
+        from tools.messaging_tools.whatsapp import send_whatsapp, download_wa_media
+
+        msg = job["payload"]
+        user_phone = job["user_phone"]
+        msg_id = job["message_id"]
+
+        # Handle Media
+        media_path = None
+        mime_type = None
+        document_id = None
+        media = None
+
+        if "image" in msg:
+            media = msg["image"]
+            mime_type = media.get("mime_type", "image/jpeg")
+            ack = "📸 I've received your receipt. Processing it now... ⏳"
+        elif "document" in msg:
+            media = msg["document"]
+            mime_type = media.get("mime_type", "application/pdf")
+            ack = "📄 I've received your document. Reading the details... ⏳"
+        elif "audio" in msg:
+            print(f"🔊 Audio detected (not supported yet) in {msg_id}")
+
+        if media:
+            document_id = media["id"]
+            # Immediate feedback only on the first attempt
+            if job["attempts"] == 1:
+                await send_whatsapp(user_phone, ack)
+            media_path = await download_wa_media(document_id, mime_type)
+            if not media_path and os.getenv("WA_TOKEN"):
+                raise RuntimeError(f"Media download failed for {document_id}")
+
+        text_body = msg.get("text", {}).get("body", "") if "text" in msg else None
+
+        # For images/docs with captions
+        if not text_body and media:
+            text_body = media.get("caption")
+
+        print(f"🏃 Handing off to Agent: user={user_phone}, text='{text_body}', media={bool(media_path)}")
+        await run_agent_loop(user_phone, text_body, media_path, mime_type, document_id)
+
+    async def _run_job(self, job: Dict[str, Any]):
+        started = time.monotonic()
+        self.stats["running"] += 1
+        try:
+            await self._mark_started(job["job_id"])
+            await asyncio.wait_for(self.process_job(job), timeout=INGEST_JOB_TIMEOUT)
+            await self._complete_job(job["job_id"])
+            self.stats["completed"] += 1
+            logger.info(f"✅ Ingest job {job['job_id']} done in {time.monotonic() - started:.2f}s")
+        except asyncio.CancelledError:
+            # Shutdown: leave the row 'running'; it is reclaimed after INGEST_JOB_TIMEOUT
+            raise
+        except Exception as e:
+            await self._fail_job(job, f"{type(e).__name__}: {e}")
+        finally:
+            self.stats["running"] -= 1
+
+    def _release_slot(self, user_phone: str):
+        def release(_future):
+            self._inflight -= 1
+            self._busy_users[user_phone] -= 1
+            if not self._busy_users[user_phone]:
+                del self._busy_users[user_phone]
+                # The user's next message can be claimed now
+                self._wakeup.set()
+            self._capacity.set()
+        return release
+
+    async def _dispatch(self):
+        while self._running:
+            if self._inflight >= INGEST_MAX_INFLIGHT:
+                self._capacity.clear()
+                await self._capacity.wait()
+                continue
+
+            try:
+                job = await self._claim_job()
+            except Exception as e:
+                logger.error(f"Ingest dispatcher claim failed: {e}")
+                job = None
+
+            if not job:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=INGEST_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._inflight += 1
+            self._busy_users[job["user_phone"]] = self._busy_users.get(job["user_phone"], 0) + 1
+            future = agent_scheduler.submit(job["user_phone"], self._run_job, job)
+            future.add_done_callback(self._release_slot(job["user_phone"]))
+
+    def start(self, concurrency: int = INGEST_WORKER_CONCURRENCY):
+        if self._running:
+            return
+        self._running = True
+        agent_scheduler.set_max_concurrency(concurrency)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        print(f"📥 Ingest queue started ({concurrency} parallel users, FIFO per user)")
+
+    async def stop(self):
+        self._running = False
+        self._wakeup.set()
+        self._capacity.set()
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+        await agent_scheduler.shutdown()
+
+    async def get_depth(self) -> Dict[str, int]:
+        conn = await get_db_connection(retries=1)
+        if not conn: return {}
+        try:
+            rows = await conn.fetch("""
+                SELECT status, COUNT(*) AS count FROM ingest_jobs
+                WHERE status IN ('queued', 'running', 'dead')
+                GROUP BY status
+            """)
+            return {r["status"]: r["count"] for r in rows}
+        except Exception as e:
+            logger.error(f"Failed to read ingest queue depth: {e}")
+            return {}
+        finally:
+            await conn.close()
+
+    async def purge_finished(self, older_than_days: int = INGEST_RETENTION_DAYS):
+        conn = await get_db_connection()
+        if not conn: return
+        try:
+            await conn.execute("""
+                DELETE FROM ingest_jobs
+                WHERE status = 'done' AND finished_at < NOW() - make_interval(days => $1)
+            """, older_than_days)
+        finally:
+            await conn.close()
+
+ingest_queue = IngestQueue()
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", 8))
+AGENT_LANE_IDLE_SECONDS = float(os.getenv("AGENT_LANE_IDLE_SECONDS", 60))
+
+class KeyedScheduler:
+    """
+    Runs submitted work strictly in FIFO order per key (e.g. user_phone) while
+    different keys run in parallel, bounded by a global concurrency limit.
+    Each key gets a lane (queue + task) that is reclaimed after it stays idle.
+    """
+
+    def __init__(self, max_concurrency: int = AGENT_MAX_CONCURRENCY, idle_timeout: float = AGENT_LANE_IDLE_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.idle_timeout = idle_timeout
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._lanes: Dict[Hashable, asyncio.Queue] = {}
+        self._lane_tasks: Dict[Hashable, asyncio.Task] = {}
+        self._pending = 0
+        self._running = 0
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "lanes_reclaimed": 0}
+
+    def set_max_concurrency(self, max_concurrency: int):
+        """ Resize the global limit. Only safe before any work has been submitted. """
+        if self._pending:
+            raise RuntimeError("Cannot resize a scheduler with pending work")
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def pending(self) -> int:
+        """ Items submitted but not yet finished (queued in a lane or running). """
+        return self._pending
+
+    def submit(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> asyncio.Future:
+        """
+        Queues func(*args, **kwargs) behind earlier work for the same key.
+        Returns a future resolved with the result (or exception) of the call.
+        """
+        future = asyncio.get_running_loop().create_future()
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = asyncio.Queue()
+            self._lanes[key] = lane
+            self._lane_tasks[key] = asyncio.create_task(self._run_lane(key, lane))
+        lane.put_nowait((func, args, kwargs, future, time.monotonic()))
+        self._pending += 1
+        self.stats["submitted"] += 1
+        return future
+
+    async def _run_lane(self, key: Hashable, lane: asyncio.Queue):
+        while True:
+            try:
+                func, args, kwargs, future, queued_at = await asyncio.wait_for(lane.get(), timeout=self.idle_timeout)
+            except asyncio.TimeoutError:
+                # No await between the emptiness check and removal, so a
+                # concurrent submit() either sees this lane or creates a new one.
+                if lane.empty():
+                    self._lanes.pop(key, None)
+                    self._lane_tasks.pop(key, None)
+                    self.stats["lanes_reclaimed"] += 1
+                    return
+                continue
+
+            try:
+                async with self._slots:
+                    self._running += 1
+                    try:
+                        if not future.cancelled():
+                            result = await func(*args, **kwargs)
+                            if not future.done():
+                                future.set_result(result)
+                        self.stats["completed"] += 1
+                    finally:
+                        self._running -= 1
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                if not future.done():
+                    future.set_exception(e)
+                else:
+                    logger.error(f"Lane {key} task failed after its future was resolved: {e}")
+            finally:
+                self._pending -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "active_lanes": len(self._lanes),
+            "running": self._running,
+            "pending": self._pending,
+            "max_concurrency": self.max_concurrency
+        }
+
+    async def shutdown(self):
+        tasks = list(self._lane_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._lanes.clear()
+        self._lane_tasks.clear()
+
+agent_scheduler = KeyedScheduler()
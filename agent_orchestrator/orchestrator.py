@@ -1,8 +1,13 @@
+import asyncio
 import json
+import time
 import os
 import logging
 from tools.document_tools.llama_cloud_parser import llama_cloud_extract
-from tools.document_tools.ocr_tools import render_pdf_to_images, preprocess_image, ocr_paddle
+from tools.document_tools.ocr_service import ocr_service
+from tools.document_tools.ocr_tools import read_pdf_text_layer
+from tools.document_tools.extraction_cache import extraction_cache, hash_file
+from agent_orchestrator.pipeline import Pipeline, pipeline_metrics
 from tools.document_tools.extraction_tools import (
     extract_candidates, 
     gemini_structured_extract, 
@@ -11,6 +16,7 @@ from tools.document_tools.extraction_tools import (
     normalize_extraction
 )
 from tools.messaging_tools.whatsapp import send_whatsapp, upload_media, send_whatsapp_document
+from tools.messaging_tools.outbound_queue import outbound_queue
 from tools.export_tools import generate_custom_export
 from storage.postgres_repository import (
     persist_invoice_intelligence, 
@@ -136,21 +142,43 @@ async def run_agent_loop(user_phone, text_message=None, media_path=None, mime_ty
         # 7. Log Activity
         await log_bot_interaction(user_phone, text_message, response, intent, 1.0, "whatsapp")
 
-async def handle_media_extraction(user_phone, user_name, file_path, mime_type, document_id=None):
-    # 0. Try Premium Extraction
-    print(f"💎 Attempting Llama Cloud extraction for {user_phone}...")
-    llama_res = await llama_cloud_extract(file_path)
-    
+async def _extract_document(user_phone, file_path, mime_type):
+    """
+    Text extraction and structured extraction for one uploaded file.
+    The extraction carries extraction_meta ({"source", "pages"}), stored with the invoice.
+    """
     full_text = ""
-    if llama_res and llama_res.get("raw_text"):
+    llama_res = None
+    layer = None
+    extraction_meta = {"source": None, "pages": None}
+
+    # 0. Born-digital PDFs: the embedded text layer is exact and takes milliseconds
+    if mime_type == "application/pdf" or file_path.lower().endswith(".pdf"):
+        try:
+            layer = await asyncio.to_thread(read_pdf_text_layer, file_path)
+            if layer["page_texts"] and not layer["needs_ocr"]:
+                full_text = "\n".join(layer["page_texts"][p] for p in sorted(layer["page_texts"]))
+                extraction_meta = {"source": "text_layer", "pages": layer["pages"]}
+                print(f"📑 Using PDF text layer for all {len(layer['pages'])} page(s), skipping OCR")
+        except Exception as e:
+            print(f"⚠️ PDF text layer read failed, falling back to OCR: {e}")
+
+    # 1. Try Premium Extraction
+    if not full_text:
+        print(f"💎 Attempting Llama Cloud extraction for {user_phone}...")
+        llama_res = await llama_cloud_extract(file_path)
+
+    if full_text:
+        pass
+    elif llama_res and llama_res.get("raw_text"):
         full_text = llama_res["raw_text"]
+        extraction_meta = {"source": "llama_cloud", "pages": None}
     else:
-        # Fallback to standard OCR
-        images = render_pdf_to_images(file_path) if mime_type == "application/pdf" else [file_path]
-        for img in images:
-            proc = preprocess_image(img)
-            ocr_res = ocr_paddle(proc)
-            full_text += ocr_res["raw_text"] + "\n"
+        # Fallback to standard OCR (runs in the OCR process pool, off the event loop);
+        # mixed PDFs only rasterize the pages without a usable text layer, reusing the layer read above
+        ocr_res = await ocr_service.ocr_document(file_path, mime_type, text_layer=layer)
+        full_text = ocr_res["raw_text"] + "\n"
+        extraction_meta = {"source": "ocr", "pages": ocr_res["pages"]}
         
     candidates = extract_candidates(full_text)
     extraction_res = await gemini_structured_extract(full_text, candidates, doc_path=file_path)
@@ -159,71 +187,135 @@ async def handle_media_extraction(user_phone, user_name, file_path, mime_type, d
         extraction_res = deterministic_parse(full_text, candidates)
         
     invoice_intelligence = normalize_extraction(extraction_res)
-    compliance_results = ValidationEngine.validate_invoice(invoice_intelligence)
+    if invoice_intelligence:
+        invoice_intelligence["extraction_meta"] = extraction_meta
+    return full_text, invoice_intelligence
+
+async def _detect_recurring(user_phone, invoice_intelligence):
+    from tools.finance_tools.recurring_detector import RecurringDetector
+    potentials = await RecurringDetector.find_potential_recurring(user_phone)
+    just_uploaded_vendor = invoice_intelligence.get("vendor_name", "").lower()
+
+    for pot in potentials:
+        if pot['vendor_name'].lower() == just_uploaded_vendor:
+            # We found a match for the just-uploaded invoice
+            msg = f"🔄 Patterns detected: You've been charged for *{pot['vendor_name']}* regularly ({pot['frequency']}). Would you like me to track this as a subscription?"
+            # Queued behind the "received" notification so it arrives after it
+            outbound_queue.enqueue(user_phone, msg)
+            await RecurringDetector.record_detected_subscription(user_phone, pot)
 
-    # 4.5. Generate Embedding for Semantic Search
+async def _check_budget_forecast(user_phone):
+    from tools.finance_tools.predictive_analytics import PredictiveAnalytics
+    forecast = await PredictiveAnalytics.get_spend_forecast(user_phone)
+    if forecast.get("warning_needed"):
+        warn_msg = f"⚠️ *Budget Warning*: Based on your current spending, you are on track to spend *{round(forecast['projected_spend'])} AED* this month, which exceeds your budget of {round(forecast['budget_amount'])} AED."
+        outbound_queue.enqueue(user_phone, warn_msg)
+
+async def handle_media_extraction(user_phone, user_name, file_path, mime_type, document_id=None):
     from tools.document_tools.extraction_tools import generate_embedding
-    embedding_text = f"{invoice_intelligence.get('vendor_name', '')} {full_text[:2000]}"
-    embedding = await generate_embedding(embedding_text)
+    from agent_orchestrator.workflow_service import workflow_service
 
-    # 5. Store & Reply
-    if invoice_intelligence.get("total_amount"):
-        file_url = await save_raw_invoice(file_path, user_phone)
-        
+    pipeline = Pipeline("media")
+
+    # 1. Extraction. Re-sent receipts / forwarded PDFs are answered from the
+    # content-hash cache before paying for LlamaParse, Gemini and embeddings again
+    started = time.monotonic()
+    content_hash = None
+    cached = None
+    try:
+        content_hash = await asyncio.to_thread(hash_file, file_path)
+        cached = extraction_cache.get(content_hash)
+    except OSError as e:
+        logger.warning(f"Could not hash {file_path} for the extraction cache: {e}")
+
+    if cached:
+        print(f"⚡ Extraction cache hit for {user_phone} ({content_hash[:12]})")
+        full_text = cached["raw_text"]
+        invoice_intelligence = cached["extraction"]
+    else:
+        full_text, invoice_intelligence = await _extract_document(user_phone, file_path, mime_type)
+    pipeline.record("extract", invoice_intelligence, started)
+
+    if not invoice_intelligence.get("total_amount"):
+        await send_whatsapp(user_phone, "❌ Sorry, I couldn't extract any expense data from that file. Please make sure the image is clear.")
+        return
+
+    compliance_results = ValidationEngine.validate_invoice(invoice_intelligence)
+
+    # 2. Store & Reply, as a dependency graph:
+    #    embedding ‖ upload -> persist -> (notify ‖ context), notify -> workflow
+    #    Sheets sync, recurring detection and forecast are deferred off the critical path.
+    #    Stages that message the user (workflow, recurring, forecast) run after notify,
+    #    so the extraction confirmation is always the first reply.
+    async def embed(r):
+        if cached:
+            return cached["embedding"]
+        embedding = await generate_embedding(f"{invoice_intelligence.get('vendor_name', '')} {full_text[:2000]}")
+        if content_hash:
+            extraction_cache.put(content_hash, full_text, invoice_intelligence, embedding)
+        return embedding
+
+    async def upload(r):
+        return await save_raw_invoice(file_path, user_phone)
+
+    async def persist(r):
         # Persist to Postgres with embedding and raw text
-        invoice_uuid = await persist_invoice_intelligence(
+        return await persist_invoice_intelligence(
             user_id=user_phone,
             invoice_data=invoice_intelligence,
-            file_url=file_url,
+            file_url=r["upload"],
             whatsapp_media_id=document_id,
             compliance_results=compliance_results,
-            embedding=embedding if embedding else None,
+            embedding=r["embed"] if r["embed"] else None,
             raw_text=full_text
         )
 
-        if invoice_uuid:
-            # SYNC TO GOOGLE SHEETS
-            sheet_data = {**invoice_intelligence, "file_url": file_url, "status": "pending"}
-            await append_invoice_to_sheet(sheet_data)
-            
-            # Notifications
-            await NotificationEngine.trigger_event(user_phone, "invoice_received", invoice_intelligence)
-            
-            # Compliance issues
-            for flag in compliance_results.get("compliance_flags", []):
-                if flag["severity"] == "error":
-                    await NotificationEngine.trigger_event(user_phone, "invoice_rejected", {"vendor_name": invoice_intelligence['vendor_name'], "reason": flag['message']})
-            
-            await update_conversation_context(user_phone, last_invoice_id=str(invoice_uuid), last_query_type="invoice_upload")
-
-            # 6. Smart Finance & Business Automation
-            try:
-                # 6.0 Workflow Automation (Approvals, PO Reconciliation)
-                from agent_orchestrator.workflow_service import workflow_service
-                await workflow_service.process_invoice_automation(str(invoice_uuid))
-
-                # 6.1 Recurring Detection
-                from tools.finance_tools.recurring_detector import RecurringDetector
-                potentials = await RecurringDetector.find_potential_recurring(user_phone)
-                just_uploaded_vendor = invoice_intelligence.get("vendor_name", "").lower()
-                
-                for pot in potentials:
-                    if pot['vendor_name'].lower() == just_uploaded_vendor:
-                        # We found a match for the just-uploaded invoice
-                        msg = f"🔄 Patterns detected: You've been charged for *{pot['vendor_name']}* regularly ({pot['frequency']}). Would you like me to track this as a subscription?"
-                        await send_whatsapp(user_phone, msg)
-                        await RecurringDetector.record_detected_subscription(user_phone, pot)
-                
-                # 6.2 Predictive Budget Alerts
-                from tools.finance_tools.predictive_analytics import PredictiveAnalytics
-                forecast = await PredictiveAnalytics.get_spend_forecast(user_phone)
-                if forecast.get("warning_needed"):
-                    warn_msg = f"⚠️ *Budget Warning*: Based on your current spending, you are on track to spend *{round(forecast['projected_spend'])} AED* this month, which exceeds your budget of {round(forecast['budget_amount'])} AED."
-                    await send_whatsapp(user_phone, warn_msg)
-            except Exception as e:
-                logger.error(f"Post-processing smart features failed: {e}")
-            
-        else:
-             await NotificationEngine.trigger_event(user_phone, "duplicate_detected", invoice_intelligence)
-    else:
-        await send_whatsapp(user_phone, "❌ Sorry, I couldn't extract any expense data from that file. Please make sure the image is clear.")
+    async def notify(r):
+        if not r["persist"]:
+            await NotificationEngine.trigger_event(user_phone, "duplicate_detected", invoice_intelligence)
+            return
+        await NotificationEngine.trigger_event(user_phone, "invoice_received", invoice_intelligence)
+        # End-to-end latency as the user sees it: upload to "✅ received"
+        pipeline_metrics.record("media.time_to_received", pipeline.elapsed())
+        # Compliance issues
+        for flag in compliance_results.get("compliance_flags", []):
+            if flag["severity"] == "error":
+                await NotificationEngine.trigger_event(user_phone, "invoice_rejected", {"vendor_name": invoice_intelligence['vendor_name'], "reason": flag['message']})
+
+    async def context(r):
+        if r["persist"]:
+            await update_conversation_context(user_phone, last_invoice_id=str(r["persist"]), last_query_type="invoice_upload")
+
+    async def workflow(r):
+        # Workflow Automation (Approvals, PO Reconciliation)
+        if not r["persist"]:
+            return
+        try:
+            await workflow_service.process_invoice_automation(str(r["persist"]))
+        except Exception as e:
+            logger.error(f"Post-processing workflow automation failed: {e}")
+
+    async def sheets(r):
+        if r["persist"]:
+            await append_invoice_to_sheet({**invoice_intelligence, "file_url": r["upload"], "status": "pending"})
+
+    async def recurring(r):
+        if r["persist"]:
+            await _detect_recurring(user_phone, invoice_intelligence)
+
+    async def forecast(r):
+        if r["persist"]:
+            await _check_budget_forecast(user_phone)
+
+    pipeline.stage("embed", embed)
+    pipeline.stage("upload", upload)
+    pipeline.stage("persist", persist, after=["embed", "upload"])
+    pipeline.stage("notify", notify, after=["persist"])
+    pipeline.stage("context", context, after=["persist"])
+    pipeline.stage("workflow", workflow, after=["notify"])
+    pipeline.stage("sheets", sheets, after=["persist"], deferred=True)
+    pipeline.stage("recurring", recurring, after=["notify"], deferred=True)
+    pipeline.stage("forecast", forecast, after=["notify"], deferred=True)
+
+    await pipeline.run()
+    logger.info(f"⏱️ Media pipeline for {user_phone}: {pipeline.summary()} (critical path {pipeline.elapsed():.2f}s)")
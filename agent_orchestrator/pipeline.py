@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Set
+
+logger = logging.getLogger(__name__)
+
+StageFunc = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+class PipelineMetrics:
+    """ Per-stage latency aggregates across pipeline runs (reported on /health). """
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    def record(self, stage: str, seconds: float):
+        s = self.stages.setdefault(stage, {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0})
+        s["count"] += 1
+        s["total"] += seconds
+        s["max"] = max(s["max"], seconds)
+        s["last"] = seconds
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            name: {**s, "avg": round(s["total"] / s["count"], 3) if s["count"] else 0.0}
+            for name, s in self.stages.items()
+        }
+
+pipeline_metrics = PipelineMetrics()
+
+# Deferred stages run after the caller has returned; keep references so they aren't GC'd
+_background: Set[asyncio.Task] = set()
+
+class Pipeline:
+    """
+    A small dependency graph of async stages. Each stage starts as soon as the
+    stages it depends on have finished, so independent stages run concurrently.
+    Stage functions receive the dict of results produced so far.
+
+    Deferred stages are off the critical path: run() returns without waiting
+    for them and they finish in the background (failures are only logged).
+    """
+
+    def __init__(self, name: str, metrics: PipelineMetrics = pipeline_metrics):
+        self.name = name
+        self.metrics = metrics
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._started = time.monotonic()
+
+    def stage(self, name: str, func: StageFunc, after: Iterable[str] = (), deferred: bool = False):
+        after = tuple(after)
+        for dep in after:
+            if dep not in self._stages and dep not in self.results:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+        self._stages[name] = {"func": func, "after": after, "deferred": deferred}
+        return self
+
+    def record(self, name: str, result: Any, started: float):
+        """ Records a stage that was run outside the graph (e.g. before it was built). """
+        self.results[name] = result
+        self._observe(name, started)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    def _observe(self, name: str, started: float):
+        seconds = time.monotonic() - started
+        self.timings[name] = seconds
+        self.metrics.record(f"{self.name}.{name}", seconds)
+
+    async def _run_stage(self, name: str):
+        spec = self._stages[name]
+        if spec["after"]:
+            await asyncio.gather(*(self._tasks[dep] for dep in spec["after"] if dep in self._tasks))
+        started = time.monotonic()
+        result = await spec["func"](self.results)
+        self.results[name] = result
+        self._observe(name, started)
+        return result
+
+    async def run(self) -> Dict[str, Any]:
+        for name in self._stages:
+            self._tasks[name] = asyncio.create_task(self._run_stage(name), name=f"{self.name}.{name}")
+
+        critical = [t for n, t in self._tasks.items() if not self._stages[n]["deferred"]]
+        deferred = [t for n, t in self._tasks.items() if self._stages[n]["deferred"]]
+
+        try:
+            await asyncio.gather(*critical)
+        except BaseException:
+            for task in self._tasks.values():
+                task.cancel()
+            raise
+        finally:
+            self.metrics.record(f"{self.name}.critical_path", self.elapsed())
+
+        if deferred:
+            waiter = asyncio.create_task(self._finish_deferred(deferred))
+            _background.add(waiter)
+            waiter.add_done_callback(_background.discard)
+        return self.results
+
+    async def _finish_deferred(self, tasks):
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        for task, outcome in zip(tasks, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Deferred stage {task.get_name()} failed: {outcome}")
+        self.metrics.record(f"{self.name}.total", self.elapsed())
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items())
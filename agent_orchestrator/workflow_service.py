@@ -3,6 +3,8 @@ import json
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
 from storage.postgres_repository import get_db_connection
+from storage.invoice_repository import fetch_invoice, select_sql
+from storage.response_cache import bump_data_version
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +22,7 @@ class WorkflowService:
         
         try:
             # Fetch invoice details
-            invoice = await conn.fetchrow("SELECT * FROM invoices WHERE invoice_id = $1", invoice_id)
+            invoice = await fetch_invoice(conn, invoice_id, "detail")
             if not invoice: return
             
             # 1. Approval Workflow
@@ -38,6 +40,8 @@ class WorkflowService:
             logger.error(f"Workflow automation failed for {invoice_id}: {e}")
         finally:
             await conn.close()
+            # Approval flags, PO links and due dates feed cached analytics
+            bump_data_version()
 
     @staticmethod
     async def _apply_approval_rules(conn, invoice):
@@ -70,18 +74,18 @@ class WorkflowService:
     @staticmethod
     async def _reconcile_with_po(conn, invoice):
         """Tries to find a matching Purchase Order."""
-        if not invoice['vendor_name'] or not invoice['total_amount']:
+        if not invoice['vendor_id'] or not invoice['total_amount']:
             return
 
-        # Simple match by vendor and amount (+/- 1% tolerance)
+        # Simple match by canonical vendor and amount (+/- 1% tolerance)
         po = await conn.fetchrow("""
             SELECT po_id, po_number 
             FROM purchase_orders 
             WHERE status = 'open' 
-              AND vendor_name ILIKE $1 
+              AND vendor_id = $1 
               AND total_amount BETWEEN $2 * 0.99 AND $2 * 1.01
             LIMIT 1
-        """, invoice['vendor_name'], invoice['total_amount'])
+        """, invoice['vendor_id'], invoice['total_amount'])
         
         if po:
             logger.info(f"Reconciled invoice {invoice['invoice_id']} with PO {po['po_number']}")
@@ -104,14 +108,12 @@ class WorkflowService:
         
         try:
             # 1. Payment Reminders (Upcoming in 3 days or Overdue)
-            overdue = await conn.fetch("""
-                SELECT i.*, u.phone, u.name as user_name,
-                       (SELECT phone FROM system_users WHERE role = 'admin' LIMIT 1) as admin_phone
-                FROM invoices i
-                JOIN system_users u ON i.user_id = u.phone
+            admin_phone = await conn.fetchval("SELECT phone FROM system_users WHERE role = 'admin' LIMIT 1")
+            overdue = await conn.fetch(select_sql("detail") + """
                 WHERE i.payment_status IN ('unpaid', 'partially_paid')
                   AND (i.due_date = CURRENT_DATE + INTERVAL '3 days' OR i.due_date < CURRENT_DATE)
                   AND i.status = 'approved'
+                  AND u.phone IS NOT NULL
             """)
             
             for inv in overdue:
@@ -121,16 +123,16 @@ class WorkflowService:
                 # Logic to trigger WhatsApp notification
                 msg = f"🔔 *Payment Reminder*\n\nInvoice from *{inv['vendor_name']}* for *{inv['total_amount']} {inv['currency']}* is {status_label}.\n\n📅 Due Date: {inv['due_date']}\n👤 Employee: {inv['user_name']}"
                 
-                from tools.messaging_tools.whatsapp import send_whatsapp
+                from tools.messaging_tools.outbound_queue import outbound_queue
                 from tools.notification_engine import NotificationEngine
                 
-                # Notify User
-                await send_whatsapp(inv['user_id'], msg)
+                # Notify User (rate-limited; reminders for the same user are coalesced)
+                outbound_queue.enqueue(inv['user_id'], msg)
 
                 # Notify Admin if overdue or high value
-                if inv.get('admin_phone'):
+                if admin_phone:
                     admin_msg = f"🚨 *ADMIN ALERT: Payment {status_label}*\n\nVendor: {inv['vendor_name']}\nAmount: {inv['total_amount']} {inv['currency']}\nDue: {inv['due_date']}\nUser: {inv['user_name']}"
-                    await send_whatsapp(inv['admin_phone'], admin_msg)
+                    outbound_queue.enqueue(admin_phone, admin_msg)
                     
                 # Log to System Notifications (WebApp)
                 await NotificationEngine._log_and_send(
@@ -16,21 +16,34 @@ from storage.postgres_repository import (
     log_bot_interaction,
     get_merchants,
     get_notifications,
-    sanitize_file_url
+    sanitize_file_url,
+    validate_admin_session,
+    get_invoices_page,
+    get_users_page,
+    merchant_filter
 )
+from storage.invoice_repository import HEAVY_FIELDS, select_sql
+from storage.session_cache import session_cache
+from storage.response_cache import response_cache, bump_data_version
 from tools.conversation_tools.intent_classifier import classify_bot_intent
 from tools.query_engine import QueryEngine
 from tools.export_tools import (
-    generate_custom_export, 
-    generate_audit_export, 
-    generate_bot_export,
-    generate_merchants_export,
-    generate_employees_export,
-    generate_notifications_export,
+    EXPORT_FORMATS,
+    invoice_export_spec,
+    line_items_export_spec,
+    audit_export_spec,
+    bot_export_spec,
+    merchants_export_spec,
+    employees_export_spec,
+    notifications_export_spec,
+    stream_export,
+    export_filename,
     generate_advanced_report
 )
-from fastapi.responses import FileResponse
+from tools.export_jobs import export_jobs
+from fastapi.responses import FileResponse, StreamingResponse
 from tools.messaging_tools.whatsapp import send_whatsapp
+import asyncio
 import os
 import uuid
 
@@ -38,6 +51,9 @@ router = APIRouter(prefix="/api/admin", tags=["Admin"])
 
 ADMIN_TOKEN_ENV = os.getenv("ADMIN_TOKEN") or os.getenv("ADMIN_API_TOKEN") or "default_secret_token"
 
+# Keep references to fire-and-forget tasks so they aren't GC'd mid-run
+_snapshot_tasks = set()
+
 async def verify_admin(
     request: Request,
     x_api_token: Optional[str] = Header(None, alias="X-API-Token"),
@@ -45,8 +61,9 @@ async def verify_admin(
     token: Optional[str] = None
 ):
     """
-    Verify admin access by validating session token against database.
-    Falls back to environment tokens for backward compatibility.
+    Verify admin access by validating session token against database
+    (through the session cache). Environment tokens are still accepted
+    for backward compatibility.
     """
     # 1. Try X-API-Token (case-insensitive)
     incoming = x_api_token
@@ -61,26 +78,7 @@ async def verify_admin(
     if not incoming or incoming == "None" or incoming == "":
         raise HTTPException(status_code=403, detail="No authentication token provided")
     
-    # First, check if it's a valid session token from database
-    conn = await get_db_connection()
-    if conn:
-        try:
-            user = await conn.fetchrow("""
-                SELECT phone, name, role, is_approved 
-                FROM system_users 
-                WHERE session_token = $1 AND role = 'admin' AND is_approved = TRUE
-            """, incoming)
-            
-            if user:
-                await conn.close()
-                return incoming
-        except Exception as e:
-            print(f"Session token validation error: {e}")
-        finally:
-            if conn:
-                await conn.close()
-    
-    # Fallback: Check environment tokens for backward compatibility
+    # Environment tokens for backward compatibility (no DB needed)
     ALLOWED = {
         str(os.getenv("ADMIN_TOKEN")),
         str(os.getenv("ADMIN_API_TOKEN")),
@@ -90,6 +88,10 @@ async def verify_admin(
     if incoming in ALLOWED:
         return incoming
     
+    # Session token from database (cached in-process)
+    if await validate_admin_session(incoming):
+        return incoming
+    
     print(f"DEBUG: Auth DENIED for token: {incoming[:10] if incoming else 'NONE'}...")
     raise HTTPException(
         status_code=403, 
@@ -101,9 +103,39 @@ async def verify_admin(
 async def list_invoices(limit: int = 100, token: str = Depends(verify_admin)):
     return await get_all_invoices(limit)
 
+async def _invoice_page(**kwargs):
+    """ Keyset page for the /paged listings; bad fields or cursors are client errors. """
+    try:
+        return await get_invoices_page(**kwargs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/invoices/paged")
+async def page_invoices(
+    cursor: Optional[str] = None,
+    page_size: Optional[int] = None,
+    fields: Optional[str] = None,
+    user_id: Optional[str] = None,
+    merchant: Optional[str] = None,
+    status: Optional[str] = None,
+    token: str = Depends(verify_admin)
+):
+    """
+    Cursor-paginated invoices, newest invoice_date first.
+    Pass the returned next_cursor to get the following page; null means last page.
+    """
+    return await _invoice_page(user_id=user_id, merchant=merchant, status=status,
+                               cursor=cursor, page_size=page_size, fields=fields)
+
 @router.get("/invoices/{invoice_id}")
-async def get_invoice(invoice_id: str, token: str = Depends(verify_admin)):
-    invoice = await get_invoice_detail(invoice_id)
+async def get_invoice(invoice_id: str, include: Optional[str] = None, token: str = Depends(verify_admin)):
+    """ include=raw_text (and/or embedding) adds the heavy columns, which are left out by default. """
+    heavy = [f.strip() for f in include.split(",") if f.strip()] if include else []
+    if any(f not in HEAVY_FIELDS for f in heavy):
+        raise HTTPException(status_code=400, detail=f"include accepts: {', '.join(HEAVY_FIELDS)}")
+    invoice = await get_invoice_detail(invoice_id, include=heavy)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     return invoice
@@ -115,6 +147,7 @@ async def process_invoice(invoice_id: str, token: str = Depends(verify_admin)):
         raise HTTPException(status_code=500, detail="Database connection failed")
     try:
         await conn.execute("UPDATE invoices SET status = 'approved' WHERE invoice_id = $1", invoice_id)
+        bump_data_version()
         return {"status": "success"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -164,7 +197,8 @@ async def bulk_invoice_action(payload: Dict[str, Any] = Body(...), token: str =
                 await conn.execute("DELETE FROM invoices WHERE invoice_id = ANY($1::uuid[])", invoice_ids)
             else:
                 raise HTTPException(status_code=400, detail=f"Invalid action: {action}")
-                
+
+        bump_data_version()
         return {"status": "success", "count": len(invoice_ids), "action": action}
     except Exception as e:
         print(f"ERROR in bulk_invoice_action: {e}")
@@ -177,47 +211,141 @@ async def bulk_invoice_action(payload: Dict[str, Any] = Body(...), token: str =
 async def list_users(token: str = Depends(verify_admin)):
     return await get_all_users()
 
+@router.get("/users/paged")
+async def page_users(cursor: Optional[str] = None, page_size: Optional[int] = None,
+                     fields: Optional[str] = None, token: str = Depends(verify_admin)):
+    try:
+        return await get_users_page(fields=fields, page_size=page_size, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _stream_download(spec: Dict[str, Any], fmt: str, empty_detail: str):
+    """
+    Streams an export while it is generated. The first chunk is awaited before
+    responding so an empty result can still be answered with a 404.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}")
+    chunks = stream_export(spec, fmt)
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        raise HTTPException(status_code=404, detail=empty_detail)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def body():
+        yield first
+        async for data in chunks:
+            yield data
+
+    filename = export_filename(spec, fmt)
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.get("/export")
-async def export_data(start_date: Optional[str] = None, end_date: Optional[str] = None, token: str = Depends(verify_admin)):
-    file_path = await generate_custom_export(start_date, end_date)
-    if not file_path:
-        raise HTTPException(status_code=404, detail="No data found for the given range")
-    return FileResponse(file_path, filename=os.path.basename(file_path))
+async def export_data(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    format: str = "xlsx",
+    include: Optional[str] = None,
+    token: str = Depends(verify_admin)
+):
+    """ include: comma-separated heavy columns to add (raw_text, embedding). """
+    columns = [c.strip() for c in include.split(",")] if include else []
+    spec = invoice_export_spec(start_date, end_date, include=columns)
+    return await _stream_download(spec, format, "No data found for the given range")
+
+@router.get("/export-line-items")
+async def export_line_items(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    format: str = "xlsx",
+    token: str = Depends(verify_admin)
+):
+    spec = line_items_export_spec(start_date, end_date)
+    return await _stream_download(spec, format, "No line items found for the given range")
 
 @router.get("/export-audit")
-async def export_audit(token: str = Depends(verify_admin)):
-    file_path = await generate_audit_export()
-    if not file_path:
-        raise HTTPException(status_code=404, detail="No audit logs to export")
-    return FileResponse(file_path, filename=os.path.basename(file_path))
+async def export_audit(format: str = "xlsx", token: str = Depends(verify_admin)):
+    return await _stream_download(audit_export_spec(), format, "No audit logs to export")
 
 @router.get("/export-bot-activity")
-async def export_bot_activity(token: str = Depends(verify_admin)):
-    file_path = await generate_bot_export()
-    if not file_path:
-        raise HTTPException(status_code=404, detail="No bot activity to export")
-    return FileResponse(file_path, filename=os.path.basename(file_path))
+async def export_bot_activity(format: str = "xlsx", token: str = Depends(verify_admin)):
+    return await _stream_download(bot_export_spec(), format, "No bot activity to export")
 
 @router.get("/export-merchants")
-async def export_merchants(token: str = Depends(verify_admin)):
-    file_path = await generate_merchants_export()
-    if not file_path:
-        raise HTTPException(status_code=404, detail="No merchants to export")
-    return FileResponse(file_path, filename=os.path.basename(file_path))
+async def export_merchants(format: str = "xlsx", token: str = Depends(verify_admin)):
+    return await _stream_download(merchants_export_spec(), format, "No merchants to export")
 
 @router.get("/export-employees")
-async def export_employees(token: str = Depends(verify_admin)):
-    file_path = await generate_employees_export()
-    if not file_path:
-        raise HTTPException(status_code=404, detail="No employees to export")
-    return FileResponse(file_path, filename=os.path.basename(file_path))
+async def export_employees(format: str = "xlsx", token: str = Depends(verify_admin)):
+    return await _stream_download(employees_export_spec(), format, "No employees to export")
 
 @router.get("/export-notifications")
-async def export_notifications(token: str = Depends(verify_admin)):
-    file_path = await generate_notifications_export()
-    if not file_path:
-        raise HTTPException(status_code=404, detail="No notifications to export")
-    return FileResponse(file_path, filename=os.path.basename(file_path))
+async def export_notifications(format: str = "xlsx", token: str = Depends(verify_admin)):
+    return await _stream_download(notifications_export_spec(), format, "No notifications to export")
+
+# --- Columnar snapshot (month-partitioned Parquet for notebooks) ---
+@router.get("/export-snapshot")
+async def get_export_snapshot(token: str = Depends(verify_admin)):
+    from tools.columnar_export import snapshot_status
+    return snapshot_status()
+
+@router.post("/export-snapshot/refresh")
+async def refresh_export_snapshot(full: bool = False, token: str = Depends(verify_admin)):
+    """ Starts an incremental (or full) snapshot refresh in the background. """
+    from tools.columnar_export import refresh_snapshot, snapshot_status
+    if snapshot_status()["refreshing"]:
+        return {"status": "running"}
+
+    async def run():
+        try:
+            await refresh_snapshot(full=full)
+        except Exception as e:
+            print(f"❌ Snapshot refresh failed: {e}")
+
+    task = asyncio.create_task(run())
+    _snapshot_tasks.add(task)
+    task.add_done_callback(_snapshot_tasks.discard)
+    return {"status": "started", "full": full}
+
+# --- Background export jobs ---
+@router.post("/export-jobs")
+async def create_export_job(payload: Dict[str, Any] = Body(...), token: str = Depends(verify_admin)):
+    """
+    Queues an export: {"kind": "invoices", "format": "xlsx", "params": {"start_date": ..., "include": [...]}}.
+    Identical requests while the data is unchanged return the existing job.
+    """
+    try:
+        return export_jobs.create(payload.get("kind", "invoices"), payload.get("format", "xlsx"), payload.get("params") or {})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/export-jobs")
+async def list_export_jobs(token: str = Depends(verify_admin)):
+    return export_jobs.list_jobs()
+
+@router.get("/export-jobs/{job_id}")
+async def get_export_job(job_id: str, token: str = Depends(verify_admin)):
+    job = export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return export_jobs.public(job)
+
+@router.get("/export-jobs/{job_id}/download")
+async def download_export_job(job_id: str, token: str = Depends(verify_admin)):
+    job = export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job["status"] != "done" or not os.path.exists(job["file_path"]):
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    return FileResponse(job["file_path"], filename=job["filename"], media_type=EXPORT_FORMATS[job["format"]])
 
 @router.get("/export-advanced-report")
 async def export_advanced_report(token: str = Depends(verify_admin)):
@@ -284,6 +412,8 @@ async def create_user_direct(payload: Dict[str, Any] = Body(...), token: str = D
             VALUES ($1, $2, $3, TRUE)
             ON CONFLICT (phone) DO UPDATE SET name = EXCLUDED.name, role = EXCLUDED.role, is_approved = TRUE
         """, phone, name, role)
+        # Role may have changed
+        session_cache.invalidate_user(phone)
         
         # Notify user
         await send_whatsapp(phone, f"👋 Hi {name}! You have been added as a {role} to the Damshique system. You can start by sending an invoice.")
@@ -309,8 +439,13 @@ async def delete_user(phone: str, token: str = Depends(verify_admin)):
     return {"status": "success", "phone": phone}
 
 @router.get("/reports")
+@response_cache.cached("admin.reports")
 async def get_reports_data(token: str = Depends(verify_admin)):
-    return await get_report_stats()
+    try:
+        return await get_report_stats(raise_errors=True)
+    except Exception as e:
+        # Not cached: a transient failure mustn't be served as empty stats for the TTL
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/bot-activity")
 async def get_bot_activity(token: str = Depends(verify_admin)):
@@ -333,13 +468,12 @@ async def list_merchant_invoices(name: str, token: str = Depends(verify_admin)):
     conn = await get_db_connection()
     if not conn: return []
     try:
-        rows = await conn.fetch("""
-            SELECT i.*, u.name as user_name 
-            FROM invoices i
-            LEFT JOIN system_users u ON i.user_id = u.phone
-            WHERE i.vendor_name = $1
+        # Merchant names are canonical vendor names; unlinked invoices match by raw name
+        column, value = await merchant_filter(conn, name)
+        rows = await conn.fetch(select_sql("detail") + f"""
+            WHERE {column} = $1
             ORDER BY i.invoice_date DESC
-        """, name)
+        """, value)
         results = []
         for r in rows:
             d = dict(r)
@@ -349,15 +483,17 @@ async def list_merchant_invoices(name: str, token: str = Depends(verify_admin)):
     finally:
         await conn.close()
 
+@router.get("/merchants/{name}/invoices/paged")
+async def page_merchant_invoices(name: str, cursor: Optional[str] = None, page_size: Optional[int] = None,
+                                 fields: Optional[str] = None, token: str = Depends(verify_admin)):
+    return await _invoice_page(merchant=name, cursor=cursor, page_size=page_size, fields=fields)
+
 @router.get("/users/{phone}/invoices")
 async def list_user_invoices(phone: str, token: str = Depends(verify_admin)):
     conn = await get_db_connection()
     if not conn: return []
     try:
-        rows = await conn.fetch("""
-            SELECT i.*, u.name as user_name 
-            FROM invoices i
-            LEFT JOIN system_users u ON i.user_id = u.phone
+        rows = await conn.fetch(select_sql("detail") + f"""
             WHERE i.user_id = $1
             ORDER BY i.invoice_date DESC
         """, phone)
@@ -370,6 +506,11 @@ async def list_user_invoices(phone: str, token: str = Depends(verify_admin)):
     finally:
         await conn.close()
 
+@router.get("/users/{phone}/invoices/paged")
+async def page_user_invoices(phone: str, cursor: Optional[str] = None, page_size: Optional[int] = None,
+                             fields: Optional[str] = None, token: str = Depends(verify_admin)):
+    return await _invoice_page(user_id=phone, cursor=cursor, page_size=page_size, fields=fields)
+
 # --- Admin AI Chat API ---
 @router.post("/chat")
 async def admin_chat(payload: Dict[str, Any] = Body(...), token: str = Depends(verify_admin)):
@@ -499,7 +640,7 @@ async def get_stats(token: str = Depends(verify_admin)):
         # Count unique merchants
         merchant_count = 0
         try:
-            merchant_count = await conn.fetchval("SELECT COUNT(DISTINCT vendor_name) FROM invoices WHERE vendor_name IS NOT NULL") or 0
+            merchant_count = await conn.fetchval("SELECT COUNT(DISTINCT COALESCE(vendor_id::text, vendor_name)) FROM invoices WHERE vendor_id IS NOT NULL OR vendor_name IS NOT NULL") or 0
         except:
             pass
         
@@ -1,10 +1,14 @@
 """
 Analytics API Endpoints for Dashboard Charts and Insights
 """
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Body
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
-from storage.postgres_repository import get_db_connection
+import asyncio
+from collections import Counter
+import time
+from storage.postgres_repository import get_db_connection, validate_admin_session
+from storage.response_cache import response_cache
 import os
 
 router = APIRouter(prefix="/api/analytics", tags=["Analytics"])
@@ -19,8 +23,9 @@ async def verify_admin(
     token: Optional[str] = None
 ):
     """
-    Verify admin access by validating session token against database.
-    Falls back to environment tokens for backward compatibility.
+    Verify admin access by validating session token against database
+    (through the session cache). Environment tokens are still accepted
+    for backward compatibility.
     """
     # 1. Try X-API-Token (case-insensitive)
     incoming = x_api_token
@@ -35,24 +40,7 @@ async def verify_admin(
     if not incoming or incoming == "None" or incoming == "":
         raise HTTPException(status_code=403, detail="No authentication token provided")
     
-    # First, check if it's a valid session token from database
-    conn = await get_db_connection()
-    if conn:
-        try:
-            user = await conn.fetchrow("""
-                SELECT phone, name, role, is_approved 
-                FROM system_users 
-                WHERE session_token = $1 AND role = 'admin' AND is_approved = TRUE
-            """, incoming)
-            
-            if user:
-                return incoming
-        except Exception as e:
-            print(f"Session token validation error (Analytics): {e}")
-        finally:
-            await conn.close()
-    
-    # Fallback: Check environment tokens for backward compatibility
+    # Environment tokens for backward compatibility (no DB needed)
     ALLOWED = {
         os.getenv("ADMIN_TOKEN"),
         os.getenv("ADMIN_API_TOKEN"),
@@ -63,6 +51,10 @@ async def verify_admin(
     if incoming in ALLOWED:
         return incoming
     
+    # Session token from database (cached in-process)
+    if await validate_admin_session(incoming):
+        return incoming
+    
     print(f"DEBUG: Auth DENIED (Analytics) for token: {incoming[:10] if incoming else 'NONE'}...")
     raise HTTPException(
         status_code=403, 
@@ -70,6 +62,7 @@ async def verify_admin(
     )
 
 @router.get("/spend-trends")
+@response_cache.cached("analytics.spend-trends")
 async def get_spend_trends(
     period: str = "6months",
     interval: str = "month", # week, month, quarter
@@ -96,15 +89,16 @@ async def get_spend_trends(
         
         start_date = datetime.now() - timedelta(days=months_back * 30)
         
+        # Re-bucket the daily rollup into weeks/months/quarters
         query = f"""
             SELECT 
-                DATE_TRUNC('{pg_interval}', invoice_date) as interval_date,
+                DATE_TRUNC('{pg_interval}', day) as interval_date,
                 SUM(total_amount) as total_spend,
-                COUNT(*) as invoice_count,
-                currency
-            FROM invoices
-            WHERE invoice_date >= $1 AND status != 'rejected'
-            GROUP BY DATE_TRUNC('{pg_interval}', invoice_date), currency
+                SUM(invoice_count) as invoice_count,
+                NULLIF(currency, '') as currency
+            FROM daily_spend_rollup
+            WHERE day >= $1 AND status != 'rejected'
+            GROUP BY DATE_TRUNC('{pg_interval}', day), currency
             ORDER BY interval_date ASC
         """
         
@@ -142,6 +136,7 @@ async def get_spend_trends(
         await conn.close()
 
 @router.get("/category-breakdown")
+@response_cache.cached("analytics.category-breakdown")
 async def get_category_breakdown(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -168,39 +163,43 @@ async def get_category_breakdown(
         
         query = """
             SELECT 
-                COALESCE(category, 'Uncategorized') as category,
+                COALESCE(NULLIF(category, ''), 'Uncategorized') as category,
                 SUM(total_amount) as total_spend,
-                COUNT(*) as invoice_count,
-                ROUND(AVG(total_amount), 2) as avg_amount
-            FROM invoices
-            WHERE invoice_date >= $1 AND invoice_date <= $2 AND status != 'rejected'
+                SUM(invoice_count) as invoice_count,
+                ROUND(SUM(total_amount) / NULLIF(SUM(invoice_count), 0), 2) as avg_amount
+            FROM daily_spend_rollup
+            WHERE day >= $1 AND day <= $2 AND status != 'rejected'
             GROUP BY category
             ORDER BY total_spend DESC
         """
         
         rows = await conn.fetch(query, sd_obj.date() if hasattr(sd_obj, 'date') else sd_obj, ed_obj.date() if hasattr(ed_obj, 'date') else ed_obj)
         
-        total = sum(float(row['total_spend']) for row in rows)
-        
-        return {
-            "start_date": start_date,
-            "end_date": end_date,
-            "total_spend": total,
-            "categories": [
-                {
-                    "name": row['category'],
-                    "value": float(row['total_spend']),
-                    "count": row['invoice_count'],
-                    "avg": float(row['avg_amount']),
-                    "percentage": round((float(row['total_spend']) / total * 100), 2) if total > 0 else 0
-                }
-                for row in rows
-            ]
-        }
+        return _category_breakdown_payload(start_date, end_date, rows)
     finally:
         await conn.close()
 
+def _category_breakdown_payload(start_date, end_date, rows):
+    total = sum(float(row['total_spend']) for row in rows)
+    
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "total_spend": total,
+        "categories": [
+            {
+                "name": row['category'],
+                "value": float(row['total_spend']),
+                "count": row['invoice_count'],
+                "avg": float(row['avg_amount']),
+                "percentage": round((float(row['total_spend']) / total * 100), 2) if total > 0 else 0
+            }
+            for row in rows
+        ]
+    }
+
 @router.get("/merchant-comparison")
+@response_cache.cached("analytics.merchant-comparison")
 async def get_merchant_comparison(
     limit: int = 10,
     start_date: Optional[str] = None,
@@ -228,38 +227,44 @@ async def get_merchant_comparison(
 
         query = """
             SELECT 
-                vendor_name,
-                SUM(total_amount) as total_spend,
-                COUNT(*) as invoice_count,
-                MAX(invoice_date) as last_transaction
-            FROM invoices
-            WHERE invoice_date >= $1 AND invoice_date <= $2 
-                AND status != 'rejected'
-                AND vendor_name IS NOT NULL
-            GROUP BY vendor_name
+                v.vendor_id,
+                COALESCE(v.canonical_name, r.vendor_name) as vendor_name,
+                SUM(r.total_amount) as total_spend,
+                SUM(r.invoice_count) as invoice_count,
+                MAX(r.day) as last_transaction
+            FROM daily_spend_rollup r
+            LEFT JOIN vendors v ON v.vendor_id = NULLIF(r.vendor_id, '')::uuid
+            WHERE r.day >= $1 AND r.day <= $2 
+                AND r.status != 'rejected'
+                AND (r.vendor_id != '' OR r.vendor_name != '')
+            GROUP BY v.vendor_id, COALESCE(v.canonical_name, r.vendor_name)
             ORDER BY total_spend DESC
             LIMIT $3
         """
         
         rows = await conn.fetch(query, sd_obj.date() if hasattr(sd_obj, 'date') else sd_obj, ed_obj.date() if hasattr(ed_obj, 'date') else ed_obj, limit)
         
-        return {
-            "start_date": start_date,
-            "end_date": end_date,
-            "merchants": [
-                {
-                    "name": row['vendor_name'],
-                    "total_spend": float(row['total_spend']),
-                    "invoice_count": row['invoice_count'],
-                    "last_transaction": row['last_transaction'].isoformat() if row['last_transaction'] else None
-                }
-                for row in rows
-            ]
-        }
+        return _merchant_comparison_payload(start_date, end_date, rows)
     finally:
         await conn.close()
 
+def _merchant_comparison_payload(start_date, end_date, rows):
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "merchants": [
+            {
+                "name": row['vendor_name'],
+                "total_spend": float(row['total_spend']),
+                "invoice_count": row['invoice_count'],
+                "last_transaction": row['last_transaction'].isoformat() if row['last_transaction'] else None
+            }
+            for row in rows
+        ]
+    }
+
 @router.get("/department-spending")
+@response_cache.cached("analytics.department-spending")
 async def get_department_spending(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -285,15 +290,20 @@ async def get_department_spending(
             ed_obj = datetime.strptime(end_date, '%Y-%m-%d')
         
         query = """
+            WITH per_user AS (
+                SELECT user_id, SUM(invoice_count) as invoice_count, SUM(total_amount) as total_spend
+                FROM daily_spend_rollup
+                WHERE day >= $1 AND day <= $2 AND status != 'rejected'
+                GROUP BY user_id
+            )
             SELECT 
                 u.name as employee_name,
                 u.role,
-                COUNT(i.invoice_id) as invoice_count,
-                SUM(i.total_amount) as total_spend,
-                AVG(i.total_amount) as avg_spend
-            FROM invoices i
-            LEFT JOIN system_users u ON i.user_id = u.phone
-            WHERE i.invoice_date >= $1 AND i.invoice_date <= $2 AND i.status != 'rejected'
+                SUM(p.invoice_count) as invoice_count,
+                SUM(p.total_spend) as total_spend,
+                SUM(p.total_spend) / NULLIF(SUM(p.invoice_count), 0) as avg_spend
+            FROM per_user p
+            LEFT JOIN system_users u ON p.user_id = u.phone
             GROUP BY u.name, u.role
             ORDER BY total_spend DESC
         """
@@ -318,6 +328,7 @@ async def get_department_spending(
         await conn.close()
 
 @router.get("/anomalies")
+@response_cache.cached("analytics.anomalies")
 async def detect_anomalies(
     threshold_multiplier: float = 3.0,
     token: str = Depends(verify_admin)
@@ -387,6 +398,7 @@ async def detect_anomalies(
         await conn.close()
 
 @router.get("/predictive-spend")
+@response_cache.cached("analytics.predictive-spend")
 async def get_predictive_spend(
     token: str = Depends(verify_admin)
 ):
@@ -406,9 +418,9 @@ async def get_predictive_spend(
         query = """
             SELECT 
                 SUM(total_amount) as current_spend,
-                COUNT(*) as invoice_count
-            FROM invoices
-            WHERE invoice_date >= $1 AND status != 'rejected'
+                COALESCE(SUM(invoice_count), 0) as invoice_count
+            FROM daily_spend_rollup
+            WHERE day >= $1 AND status != 'rejected'
         """
         
         row = await conn.fetchrow(query, current_month_start.date())
@@ -426,8 +438,8 @@ async def get_predictive_spend(
         
         last_month_query = """
             SELECT SUM(total_amount) as last_month_spend
-            FROM invoices
-            WHERE invoice_date >= $1 AND invoice_date <= $2 AND status != 'rejected'
+            FROM daily_spend_rollup
+            WHERE day >= $1 AND day <= $2 AND status != 'rejected'
         """
         
         last_row = await conn.fetchrow(last_month_query, last_month_start.date(), last_month_end.date())
@@ -449,6 +461,7 @@ async def get_predictive_spend(
         await conn.close()
         
 @router.get("/budget-vs-actual")
+@response_cache.cached("analytics.budget-vs-actual")
 async def get_budget_vs_actual(token: str = Depends(verify_admin)):
     """
     Compare current month spending against budgets.
@@ -461,12 +474,13 @@ async def get_budget_vs_actual(token: str = Depends(verify_admin)):
         query = """
             WITH current_spend AS (
                 SELECT 
-                    COALESCE(category, 'General') as category,
+                    COALESCE(NULLIF(category, ''), 'General') as category,
                     SUM(total_amount) as actual_spend
-                FROM invoices
-                WHERE DATE_TRUNC('month', invoice_date) = DATE_TRUNC('month', CURRENT_DATE)
+                FROM daily_spend_rollup
+                WHERE day >= DATE_TRUNC('month', CURRENT_DATE)
+                    AND day < DATE_TRUNC('month', CURRENT_DATE) + INTERVAL '1 month'
                     AND status != 'rejected'
-                GROUP BY category
+                GROUP BY 1
             )
             SELECT 
                 b.cost_center as name,
@@ -483,13 +497,13 @@ async def get_budget_vs_actual(token: str = Depends(verify_admin)):
         if not rows:
             fallback_query = """
                 SELECT 
-                    COALESCE(category, 'General') as name,
+                    COALESCE(NULLIF(category, ''), 'General') as name,
                     SUM(total_amount) as actual,
                     SUM(total_amount) * 1.2 as budget,
                     'AED' as currency
-                FROM invoices
-                WHERE invoice_date >= CURRENT_DATE - INTERVAL '30 days'
-                GROUP BY category
+                FROM daily_spend_rollup
+                WHERE day >= CURRENT_DATE - INTERVAL '30 days'
+                GROUP BY 1
             """
             rows = await conn.fetch(fallback_query)
 
@@ -508,9 +522,10 @@ async def get_budget_vs_actual(token: str = Depends(verify_admin)):
         await conn.close()
 
 @router.get("/top-expenses")
+@response_cache.cached("analytics.top-expenses")
 async def get_top_expenses(limit: int = 5, token: str = Depends(verify_admin)):
     conn = await get_db_connection()
-    if not conn: return []
+    if not conn: raise HTTPException(status_code=500, detail="Database connection failed")
     try:
         rows = await conn.fetch("""
             SELECT i.invoice_id, i.vendor_name, i.total_amount, i.invoice_date, i.category, u.name as user_name
@@ -525,26 +540,199 @@ async def get_top_expenses(limit: int = 5, token: str = Depends(verify_admin)):
         await conn.close()
 
 @router.get("/recurring-costs")
+@response_cache.cached("analytics.recurring-costs")
 async def get_recurring_costs(token: str = Depends(verify_admin)):
     """
     Identifies vendors with frequent, similar-amount transactions.
     """
     conn = await get_db_connection()
-    if not conn: return []
+    if not conn: raise HTTPException(status_code=500, detail="Database connection failed")
     try:
         # Simplified recurring detection: vendors seen in at least 3 distinct months
         rows = await conn.fetch("""
             SELECT 
-                vendor_name,
+                COALESCE(v.canonical_name, i.vendor_name) as vendor_name,
                 COUNT(*) as frequency,
-                ROUND(AVG(total_amount), 2) as avg_amount,
-                COUNT(DISTINCT DATE_TRUNC('month', invoice_date)) as month_count
-            FROM invoices
-            WHERE vendor_name IS NOT NULL AND status != 'rejected'
-            GROUP BY vendor_name
-            HAVING COUNT(DISTINCT DATE_TRUNC('month', invoice_date)) >= 2
+                ROUND(AVG(i.total_amount), 2) as avg_amount,
+                COUNT(DISTINCT DATE_TRUNC('month', i.invoice_date)) as month_count
+            FROM invoices i
+            LEFT JOIN vendors v ON v.vendor_id = i.vendor_id
+            WHERE (i.vendor_id IS NOT NULL OR i.vendor_name IS NOT NULL) AND i.status != 'rejected'
+            GROUP BY v.vendor_id, COALESCE(v.canonical_name, i.vendor_name)
+            HAVING COUNT(DISTINCT DATE_TRUNC('month', i.invoice_date)) >= 2
             ORDER BY avg_amount DESC
         """)
         return [dict(r) for r in rows]
     finally:
         await conn.close()
+
+# --- Dashboard batch endpoint ---
+
+OVERVIEW_MAX_WIDGETS = int(os.getenv("OVERVIEW_MAX_WIDGETS", 20))
+
+async def _admin_stats(token: str = None):
+    from api.admin_api import get_stats
+    return await get_stats(token=token)
+
+# widget type -> (handler, accepted params)
+OVERVIEW_WIDGETS = {
+    "spend-trends": (get_spend_trends, {"period", "interval"}),
+    "category-breakdown": (get_category_breakdown, {"start_date", "end_date"}),
+    "merchant-comparison": (get_merchant_comparison, {"limit", "start_date", "end_date"}),
+    "department-spending": (get_department_spending, {"start_date", "end_date"}),
+    "anomalies": (detect_anomalies, {"threshold_multiplier"}),
+    "predictive-spend": (get_predictive_spend, set()),
+    "budget-vs-actual": (get_budget_vs_actual, set()),
+    "top-expenses": (get_top_expenses, {"limit"}),
+    "recurring-costs": (get_recurring_costs, set()),
+    "admin-stats": (_admin_stats, set()),
+}
+
+PARAM_TYPES = {"limit": int, "threshold_multiplier": float}
+
+# Widgets that can be answered together from one scan of the rollup
+SHARED_SCAN_WIDGETS = {"category-breakdown", "merchant-comparison"}
+
+DEFAULT_OVERVIEW = [{"type": t} for t in (
+    "spend-trends", "category-breakdown", "merchant-comparison", "anomalies",
+    "predictive-spend", "budget-vs-actual", "top-expenses", "recurring-costs", "admin-stats"
+)]
+
+def _date_range(start_date: Optional[str], end_date: Optional[str]):
+    sd = datetime.strptime(start_date, '%Y-%m-%d') if start_date else datetime.now() - timedelta(days=90)
+    ed = datetime.strptime(end_date, '%Y-%m-%d') if end_date else datetime.now()
+    return sd.date(), ed.date()
+
+async def _shared_rollup_scan(start_date: Optional[str], end_date: Optional[str], widgets: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Answers category-breakdown and merchant-comparison widgets over the same
+    date range with one filtered CTE and GROUPING SETS instead of one scan each.
+    """
+    sd, ed = _date_range(start_date, end_date)
+    conn = await get_db_connection()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    try:
+        rows = await conn.fetch("""
+            WITH base AS (
+                SELECT r.category, v.vendor_id, COALESCE(v.canonical_name, r.vendor_name) as vendor_name,
+                       r.day, r.invoice_count, r.total_amount
+                FROM daily_spend_rollup r
+                LEFT JOIN vendors v ON v.vendor_id = NULLIF(r.vendor_id, '')::uuid
+                WHERE r.day >= $1 AND r.day <= $2 AND r.status != 'rejected'
+            )
+            SELECT 
+                GROUPING(category) = 0 as by_category,
+                COALESCE(NULLIF(category, ''), 'Uncategorized') as category,
+                vendor_name,
+                SUM(total_amount) as total_spend,
+                SUM(invoice_count) as invoice_count,
+                ROUND(SUM(total_amount) / NULLIF(SUM(invoice_count), 0), 2) as avg_amount,
+                MAX(day) as last_transaction
+            FROM base
+            GROUP BY GROUPING SETS ((category), (vendor_id, vendor_name))
+            ORDER BY total_spend DESC
+        """, sd, ed)
+    finally:
+        await conn.close()
+
+    categories = [r for r in rows if r['by_category']]
+    merchants = [r for r in rows if not r['by_category'] and r['vendor_name']]
+
+    results = {}
+    for widget in widgets:
+        if widget["type"] == "category-breakdown":
+            results[widget["id"]] = _category_breakdown_payload(start_date, end_date, categories)
+        else:
+            limit = int(widget["params"].get("limit", 10))
+            results[widget["id"]] = _merchant_comparison_payload(start_date, end_date, merchants[:limit])
+    return results
+
+@router.post("/overview")
+async def get_overview(payload: Dict[str, Any] = Body(default={}), token: str = Depends(verify_admin)):
+    """
+    Computes several dashboard widgets in one request.
+    Body: {"widgets": [{"id": "trends", "type": "spend-trends", "params": {"period": "6months"}}, ...]}
+    (defaults to the full dashboard). Widgets run concurrently on pooled
+    connections; one failing widget is reported under "errors" without
+    failing the others.
+    """
+    specs = payload.get("widgets") or DEFAULT_OVERVIEW
+    if len(specs) > OVERVIEW_MAX_WIDGETS:
+        raise HTTPException(status_code=400, detail=f"At most {OVERVIEW_MAX_WIDGETS} widgets per request")
+
+    widgets = []
+    errors = {}
+    id_counts = Counter(spec.get("id") or spec.get("type") for spec in specs)
+    for spec in specs:
+        widget_type = spec.get("type")
+        widget_id = spec.get("id") or widget_type
+        if id_counts[widget_id] > 1:
+            # Results are keyed by id: none of the clashing widgets can be reported unambiguously
+            errors[widget_id] = f"Duplicate widget id: {widget_id}"
+            continue
+        if widget_type not in OVERVIEW_WIDGETS:
+            errors[widget_id] = f"Unknown widget type: {widget_type}"
+            continue
+        accepted = OVERVIEW_WIDGETS[widget_type][1]
+        params = spec.get("params") or {}
+        unknown = set(params) - accepted
+        if unknown:
+            errors[widget_id] = f"Unsupported params for {widget_type}: {sorted(unknown)}"
+            continue
+        try:
+            # null means "use the default", not the string "None"
+            params = {k: PARAM_TYPES.get(k, str)(v) for k, v in params.items() if v is not None}
+        except (TypeError, ValueError) as e:
+            errors[widget_id] = f"Invalid params for {widget_type}: {e}"
+            continue
+        widgets.append({"id": widget_id, "type": widget_type, "params": params})
+
+    # Group widgets that can share one rollup scan (same date range)
+    shared_groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for widget in widgets:
+        if widget["type"] in SHARED_SCAN_WIDGETS:
+            key = (widget["params"].get("start_date"), widget["params"].get("end_date"))
+            shared_groups.setdefault(key, []).append(widget)
+
+    jobs = []
+    for (start_date, end_date), group in shared_groups.items():
+        if len(group) > 1:
+            jobs.append(([w["id"] for w in group], _shared_rollup_scan(start_date, end_date, group)))
+    shared_ids = {wid for ids, _ in jobs for wid in ids}
+
+    for widget in widgets:
+        if widget["id"] in shared_ids:
+            continue
+        handler = OVERVIEW_WIDGETS[widget["type"]][0]
+        jobs.append(([widget["id"]], handler(**widget["params"], token=token)))
+
+    async def timed(coro):
+        started = time.monotonic()
+        try:
+            return await coro, None, time.monotonic() - started
+        except HTTPException as e:
+            return None, e.detail, time.monotonic() - started
+        except Exception as e:
+            return None, str(e), time.monotonic() - started
+
+    outcomes = await asyncio.gather(*(timed(coro) for _, coro in jobs))
+
+    results = {}
+    timings = {}
+    for (ids, _), (result, error, seconds) in zip(jobs, outcomes):
+        for widget_id in ids:
+            timings[widget_id] = round(seconds * 1000, 1)
+            if error is not None:
+                errors[widget_id] = error
+            elif len(ids) > 1:
+                results[widget_id] = result[widget_id]
+            else:
+                results[widget_id] = result
+
+    return {
+        "generated_at": datetime.now().isoformat(),
+        "widgets": results,
+        "errors": errors,
+        "timings_ms": timings
+    }
@@ -4,6 +4,7 @@ import secrets
 from fastapi import APIRouter, HTTPException, Body
 from typing import Dict, Any
 from storage.postgres_repository import get_db_connection
+from storage.session_cache import session_cache
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
@@ -85,6 +86,7 @@ async def logout(payload: Dict[str, Any] = Body(...)):
     if not token:
         return {"success": True}
     
+    session_cache.invalidate_token(token)
     conn = await get_db_connection()
     if not conn:
         return {"success": True}
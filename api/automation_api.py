@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
 from typing import Optional, List, Dict, Any
 from storage.postgres_repository import get_db_connection
+from storage.vendor_registry import vendor_registry
+from storage.invoice_repository import select_sql
 from api.analytics_api import verify_admin
 import json
 
@@ -54,11 +56,13 @@ async def create_purchase_order(po: Dict[str, Any] = Body(...), token: str = Dep
     conn = await get_db_connection()
     if not conn: raise HTTPException(status_code=500)
     try:
-        await conn.execute("""
-            INSERT INTO purchase_orders (po_number, vendor_name, total_amount, currency, status, description)
-            VALUES ($1, $2, $3, $4, $5, $6)
-        """, po['po_number'], po.get('vendor_name'), po.get('total_amount'), 
-           po.get('currency', 'AED'), po.get('status', 'open'), po.get('description'))
+        async with conn.transaction():
+            vendor_id = await vendor_registry.resolve(conn, po.get('vendor_name'))
+            await conn.execute("""
+                INSERT INTO purchase_orders (po_number, vendor_name, total_amount, currency, status, description, vendor_id)
+                VALUES ($1, $2, $3, $4, $5, $6, $7)
+            """, po['po_number'], po.get('vendor_name'), po.get('total_amount'), 
+               po.get('currency', 'AED'), po.get('status', 'open'), po.get('description'), vendor_id)
         return {"success": True}
     finally:
         await conn.close()
@@ -99,12 +103,10 @@ async def get_pending_approvals(token: str = Depends(verify_admin)):
     conn = await get_db_connection()
     if not conn: return []
     try:
-        rows = await conn.fetch("""
-            SELECT i.*, u.name as user_name
-            FROM invoices i
-            JOIN system_users u ON i.user_id = u.phone
+        rows = await conn.fetch(select_sql("detail") + """
             WHERE i.status = 'pending' 
               AND i.compliance_flags ? 'required_approver'
+              AND u.phone IS NOT NULL
             ORDER BY i.created_at DESC
         """)
         return [dict(r) for r in rows]
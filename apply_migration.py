@@ -1,10 +1,11 @@
 import asyncio
-from storage.postgres_repository import run_pg_migrations
+from storage.postgres_repository import run_pg_migrations, close_db_pool
 from dotenv import load_dotenv
 
 async def run():
     load_dotenv()
     await run_pg_migrations()
+    await close_db_pool()
 
 if __name__ == "__main__":
     asyncio.run(run())
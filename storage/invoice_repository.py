@@ -0,0 +1,102 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+# --- Invoice read projections ---
+# Invoice reads name the columns they need instead of SELECT *. The heavy
+# columns (raw_text: multi-KB OCR text; embedding: 768 floats, ~3 KB as
+# text) are never part of a projection and load only when asked for by
+# name (include=... or load_heavy).
+# Queries alias invoices as i and LEFT JOIN system_users as u (for user_name).
+
+INVOICE_FIELDS: Dict[str, str] = {
+    name: f"i.{name}" for name in (
+        "invoice_id", "user_id", "vendor_id", "vendor_name", "invoice_date", "due_date", "currency",
+        "subtotal", "tax_amount", "vat_rate", "is_vat_reclaimable", "total_amount", "confidence_score",
+        "line_items_status", "status", "payment_status", "file_url", "file_hash", "whatsapp_media_id",
+        "category", "cost_center", "project_id", "po_id", "version", "is_latest", "parent_invoice_id",
+        "compliance_flags", "extraction_meta", "created_at", "updated_at"
+    )
+}
+INVOICE_FIELDS["user_name"] = "u.name"
+
+HEAVY_FIELDS: Dict[str, str] = {
+    "raw_text": "i.raw_text",
+    "embedding": "i.embedding::text"
+}
+
+PROJECTIONS: Dict[str, List[str]] = {
+    # Lists, search results, chat summaries
+    "summary": [
+        "invoice_id", "user_id", "user_name", "vendor_id", "vendor_name", "invoice_date", "total_amount",
+        "currency", "category", "status", "payment_status", "file_url", "created_at"
+    ],
+    # Single-invoice views and workflow automation: every light column
+    "detail": [n for n in INVOICE_FIELDS if n != "file_hash"],
+    # Provenance and review trail
+    "audit": [
+        "invoice_id", "user_id", "status", "version", "is_latest", "parent_invoice_id", "file_url", "file_hash",
+        "whatsapp_media_id", "confidence_score", "line_items_status", "compliance_flags", "extraction_meta",
+        "created_at", "updated_at"
+    ],
+    # Columns of the invoice exports; matches ARROW_SCHEMAS["invoices"] in tools/columnar_export.py
+    "export": [
+        "invoice_id", "user_id", "user_name", "vendor_name", "invoice_date", "due_date", "currency",
+        "subtotal", "tax_amount", "vat_rate", "is_vat_reclaimable", "total_amount", "confidence_score",
+        "line_items_status", "status", "payment_status", "category", "cost_center", "project_id", "po_id",
+        "file_url", "file_hash", "whatsapp_media_id", "version", "is_latest", "parent_invoice_id",
+        "compliance_flags", "created_at", "updated_at"
+    ]
+}
+
+def projection_columns(projection: str = "summary", include: Iterable[str] = ()) -> List[str]:
+    """ ["i.invoice_id AS invoice_id", ...] for a named projection plus requested heavy fields. """
+    if projection not in PROJECTIONS:
+        raise ValueError(f"Unknown invoice projection: {projection}")
+    unknown = [name for name in include or () if name not in HEAVY_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown heavy fields: {', '.join(unknown)}")
+    names = PROJECTIONS[projection]
+    columns = [f"{INVOICE_FIELDS[n]} AS {n}" for n in names]
+    return columns + [f"{HEAVY_FIELDS[n]} AS {n}" for n in dict.fromkeys(include or ())]
+
+def select_sql(projection: str = "summary", include: Iterable[str] = ()) -> str:
+    """ SELECT ... FROM invoices i LEFT JOIN system_users u (append WHERE/ORDER BY). """
+    return f"""
+        SELECT {", ".join(projection_columns(projection, include))}
+        FROM invoices i
+        LEFT JOIN system_users u ON i.user_id = u.phone
+    """
+
+async def fetch_invoice(conn, invoice_id, projection: str = "detail",
+                        include: Iterable[str] = ()) -> Optional[Dict[str, Any]]:
+    row = await conn.fetchrow(select_sql(projection, include) + " WHERE i.invoice_id = $1", invoice_id)
+    return dict(row) if row else None
+
+async def fetch_invoices(conn, invoice_ids: List[Any], projection: str = "summary",
+                         include: Iterable[str] = ()) -> List[Dict[str, Any]]:
+    """ Several invoices by id, in the order of invoice_ids (missing ids are skipped). """
+    rows = await conn.fetch(select_sql(projection, include) + " WHERE i.invoice_id = ANY($1::uuid[])", invoice_ids)
+    by_id = {str(r["invoice_id"]): dict(r) for r in rows}
+    return [by_id[str(i)] for i in invoice_ids if str(i) in by_id]
+
+async def load_heavy(conn, invoice_id, fields: Iterable[str] = ("raw_text",)) -> Dict[str, Any]:
+    """ Lazily loads heavy columns for one invoice: {"raw_text": ..., ...}. """
+    fields = list(dict.fromkeys(fields))
+    unknown = [name for name in fields if name not in HEAVY_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown heavy fields: {', '.join(unknown)}")
+    if not fields:
+        return {}
+    row = await conn.fetchrow(
+        f"SELECT {', '.join(f'{HEAVY_FIELDS[n]} AS {n}' for n in fields)} FROM invoices i WHERE i.invoice_id = $1",
+        invoice_id
+    )
+    return dict(row) if row else {}
+
+async def fetch_line_items(conn, invoice_id) -> List[Dict[str, Any]]:
+    rows = await conn.fetch("""
+        SELECT line_item_id, invoice_id, description, quantity, unit_price, tax, line_total, created_at
+        FROM invoice_line_items
+        WHERE invoice_id = $1
+        ORDER BY created_at, line_item_id
+    """, invoice_id)
+    return [dict(r) for r in rows]
@@ -0,0 +1,13 @@
+-- Bot interaction log (previously applied as an inline patch on every boot)
+CREATE TABLE IF NOT EXISTS bot_interactions (
+    interaction_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id TEXT NOT NULL,
+    query TEXT NOT NULL,
+    response TEXT NOT NULL,
+    intent TEXT,
+    confidence NUMERIC(5, 4),
+    channel TEXT DEFAULT 'whatsapp',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE invoices ADD COLUMN IF NOT EXISTS category TEXT;
@@ -0,0 +1,21 @@
+-- Durable ingest queue between the WhatsApp webhook and the agent loop.
+-- Workers claim rows with SELECT ... FOR UPDATE SKIP LOCKED.
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    job_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    message_id TEXT NOT NULL UNIQUE,
+    user_phone TEXT NOT NULL,
+    payload JSONB NOT NULL, -- Raw WhatsApp message object
+    status TEXT NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'done', 'dead'
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    last_error TEXT,
+    run_after TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    locked_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Claim path only ever looks at queued/running rows
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_claim ON ingest_jobs(created_at) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_finished ON ingest_jobs(finished_at) WHERE status = 'done';
@@ -0,0 +1,5 @@
+-- Per-user ordering for the ingest queue: remember which process claimed a
+-- job so other processes don't start a later message from the same user.
+ALTER TABLE ingest_jobs ADD COLUMN IF NOT EXISTS claimed_by TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_user_lane ON ingest_jobs(user_phone, created_at) WHERE status IN ('queued', 'running');
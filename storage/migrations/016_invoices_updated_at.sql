@@ -0,0 +1,17 @@
+-- Keep invoices.updated_at current on every UPDATE so incremental consumers
+-- (the month-partitioned Parquet snapshot) can pick up changed rows by it.
+-- Status changes from the admin API previously left it untouched.
+
+CREATE OR REPLACE FUNCTION invoices_touch_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_invoices_touch_updated_at ON invoices;
+CREATE TRIGGER trg_invoices_touch_updated_at
+    BEFORE UPDATE ON invoices
+    FOR EACH ROW EXECUTE FUNCTION invoices_touch_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_invoices_updated_at ON invoices(updated_at);
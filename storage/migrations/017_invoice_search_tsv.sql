@@ -0,0 +1,13 @@
+-- Full-text side of hybrid (keyword + vector) invoice search.
+-- 'simple' config: no stemming or stop words, so invoice numbers, TRNs and
+-- vendor names match token-for-token and Arabic/English text is treated alike.
+-- Vendor name is weighted above the OCR text.
+-- Adding a STORED generated column rewrites invoices once.
+
+ALTER TABLE invoices ADD COLUMN IF NOT EXISTS search_tsv tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', COALESCE(vendor_name, '')), 'A') ||
+        setweight(to_tsvector('simple', COALESCE(raw_text, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_invoices_search_tsv ON invoices USING GIN (search_tsv);
@@ -0,0 +1,8 @@
+-- Supports the exact-scan path of tools/search_tools/vector_search.py:
+-- tenants below VECTOR_EXACT_SCAN_THRESHOLD are ranked by scanning only their
+-- own embedded rows, and the same index answers their row count.
+-- Per-tenant partial HNSW indexes for large users are built separately
+-- (python tools/build_vector_indexes.py) because they depend on the data.
+
+CREATE INDEX IF NOT EXISTS idx_invoices_user_embedded
+    ON invoices(user_id) WHERE embedding IS NOT NULL;
@@ -0,0 +1,33 @@
+-- Canonical vendor registry.
+-- vendors holds one row per real-world merchant; vendor_aliases maps every
+-- normalized spelling seen at ingest ("carrefour", "carrefour hypermarket")
+-- to it. Trigram GIN indexes back fuzzy lookups (similarity / %), so
+-- search no longer needs ILIKE '%x%' scans over invoices.
+-- Existing invoices and purchase orders are linked by
+-- python tools/backfill_vendors.py (normalization lives in storage/vendor_registry.py).
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TABLE IF NOT EXISTS vendors (
+    vendor_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    canonical_name TEXT NOT NULL,
+    normalized_name TEXT NOT NULL UNIQUE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS vendor_aliases (
+    alias_normalized TEXT PRIMARY KEY,
+    vendor_id UUID NOT NULL REFERENCES vendors(vendor_id) ON DELETE CASCADE,
+    alias TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_vendors_name_trgm ON vendors USING GIN (normalized_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_vendor_aliases_trgm ON vendor_aliases USING GIN (alias_normalized gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_vendor_aliases_vendor ON vendor_aliases(vendor_id);
+
+ALTER TABLE invoices ADD COLUMN IF NOT EXISTS vendor_id UUID REFERENCES vendors(vendor_id);
+ALTER TABLE purchase_orders ADD COLUMN IF NOT EXISTS vendor_id UUID REFERENCES vendors(vendor_id);
+
+CREATE INDEX IF NOT EXISTS idx_invoices_vendor_id ON invoices(vendor_id, invoice_date DESC);
+CREATE INDEX IF NOT EXISTS idx_purchase_orders_open_vendor ON purchase_orders(vendor_id, total_amount) WHERE status = 'open';
@@ -0,0 +1,20 @@
+-- Keyset pagination of invoice listings on (invoice_date DESC NULLS LAST, invoice_id DESC).
+-- Each listing scope (all / per user / per vendor) gets a composite index in
+-- exactly that order, so every page is a short index range scan whatever its depth.
+-- The single-column user and vendor indexes are prefixes of the new ones.
+
+CREATE INDEX IF NOT EXISTS idx_invoices_date_keyset
+    ON invoices(invoice_date DESC NULLS LAST, invoice_id DESC);
+CREATE INDEX IF NOT EXISTS idx_invoices_user_date_keyset
+    ON invoices(user_id, invoice_date DESC NULLS LAST, invoice_id DESC);
+CREATE INDEX IF NOT EXISTS idx_invoices_vendor_date_keyset
+    ON invoices(vendor_id, invoice_date DESC NULLS LAST, invoice_id DESC);
+-- Invoices not yet linked to a vendor are listed by their raw name
+CREATE INDEX IF NOT EXISTS idx_invoices_vendor_name_date_keyset
+    ON invoices(vendor_name, invoice_date DESC NULLS LAST, invoice_id DESC) WHERE vendor_id IS NULL;
+
+DROP INDEX IF EXISTS idx_invoices_user_id;
+DROP INDEX IF EXISTS idx_invoices_vendor_id;
+
+-- Users listing: keyset on (created_at DESC, phone DESC), the order of GET /users
+CREATE INDEX IF NOT EXISTS idx_system_users_created_keyset ON system_users(created_at DESC NULLS LAST, phone DESC);
@@ -0,0 +1,3 @@
+-- How each invoice's text was obtained: {"source": "text_layer" | "llama_cloud" | "ocr",
+-- "pages": [{"page", "method": "text_layer" | "ocr", "chars"}]} for PDFs read page by page.
+ALTER TABLE invoices ADD COLUMN IF NOT EXISTS extraction_meta JSONB;
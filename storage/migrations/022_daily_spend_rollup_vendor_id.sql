@@ -0,0 +1,121 @@
+-- Adds the canonical vendor to the daily spend rollup key, so merchant analytics
+-- group "Carrefour", "CARREFOUR LLC" and "Carrefour Hypermarket" as one vendor.
+-- vendor_id is stored as text ('' for invoices not yet linked to a vendor) so it
+-- can be part of the primary key; vendor_name is kept for unlinked invoices.
+-- The row type is used positionally by the trigger functions, so the table and
+-- functions are recreated (vendor_id right after vendor_name) and rebuilt.
+
+DROP TRIGGER IF EXISTS trg_daily_spend_rollup_insert ON invoices;
+DROP TRIGGER IF EXISTS trg_daily_spend_rollup_update ON invoices;
+DROP TRIGGER IF EXISTS trg_daily_spend_rollup_delete ON invoices;
+DROP FUNCTION IF EXISTS daily_spend_rollup_sync();
+DROP FUNCTION IF EXISTS daily_spend_rollup_merge(daily_spend_rollup[]);
+DROP TABLE IF EXISTS daily_spend_rollup;
+
+CREATE TABLE daily_spend_rollup (
+    day DATE NOT NULL,
+    user_id TEXT NOT NULL,
+    category TEXT NOT NULL DEFAULT '',
+    vendor_name TEXT NOT NULL DEFAULT '',
+    vendor_id TEXT NOT NULL DEFAULT '',
+    cost_center TEXT NOT NULL DEFAULT '',
+    currency TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL,
+    invoice_count BIGINT NOT NULL DEFAULT 0,
+    total_amount NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (day, user_id, category, vendor_name, vendor_id, cost_center, currency, status)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_spend_rollup_vendor ON daily_spend_rollup(vendor_id, day);
+CREATE INDEX IF NOT EXISTS idx_daily_spend_rollup_category ON daily_spend_rollup(category, day);
+
+CREATE OR REPLACE FUNCTION daily_spend_rollup_merge(deltas daily_spend_rollup[]) RETURNS VOID AS $$
+BEGIN
+    INSERT INTO daily_spend_rollup AS r
+        (day, user_id, category, vendor_name, vendor_id, cost_center, currency, status, invoice_count, total_amount)
+    SELECT day, user_id, category, vendor_name, vendor_id, cost_center, currency, status,
+           SUM(invoice_count), SUM(total_amount)
+    FROM unnest(deltas)
+    GROUP BY day, user_id, category, vendor_name, vendor_id, cost_center, currency, status
+    HAVING SUM(invoice_count) <> 0 OR SUM(total_amount) <> 0
+    ORDER BY day, user_id, category, vendor_name, vendor_id, cost_center, currency, status
+    ON CONFLICT (day, user_id, category, vendor_name, vendor_id, cost_center, currency, status) DO UPDATE
+    SET invoice_count = r.invoice_count + EXCLUDED.invoice_count,
+        total_amount = r.total_amount + EXCLUDED.total_amount,
+        updated_at = NOW();
+
+    DELETE FROM daily_spend_rollup r
+    USING (SELECT DISTINCT day, user_id, category, vendor_name, vendor_id, cost_center, currency, status FROM unnest(deltas)) d
+    WHERE r.invoice_count <= 0
+      AND r.day = d.day AND r.user_id = d.user_id AND r.category = d.category
+      AND r.vendor_name = d.vendor_name AND r.vendor_id = d.vendor_id AND r.cost_center = d.cost_center
+      AND r.currency = d.currency AND r.status = d.status;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Linking an invoice to a vendor (ingest, tools/backfill_vendors.py) is an
+-- UPDATE of vendor_id, so the rollup row moves with it
+CREATE OR REPLACE FUNCTION daily_spend_rollup_sync() RETURNS TRIGGER AS $$
+DECLARE
+    added daily_spend_rollup[] := '{}';
+    removed daily_spend_rollup[] := '{}';
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        added := ARRAY(
+            SELECT ROW(invoice_date, user_id, COALESCE(category, ''), COALESCE(vendor_name, ''), COALESCE(vendor_id::text, ''),
+                       COALESCE(cost_center, ''), COALESCE(currency, ''), status::text, 1, COALESCE(total_amount, 0), NULL)::daily_spend_rollup
+            FROM new_rows WHERE invoice_date IS NOT NULL
+        );
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        removed := ARRAY(
+            SELECT ROW(invoice_date, user_id, COALESCE(category, ''), COALESCE(vendor_name, ''), COALESCE(vendor_id::text, ''),
+                       COALESCE(cost_center, ''), COALESCE(currency, ''), status::text, -1, -COALESCE(total_amount, 0), NULL)::daily_spend_rollup
+            FROM old_rows WHERE invoice_date IS NOT NULL
+        );
+    END IF;
+
+    PERFORM daily_spend_rollup_merge(added || removed);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rebuild_daily_spend_rollup() RETURNS BIGINT AS $$
+DECLARE
+    rebuilt BIGINT;
+BEGIN
+    LOCK TABLE invoices IN SHARE MODE;
+    DELETE FROM daily_spend_rollup;
+
+    INSERT INTO daily_spend_rollup
+        (day, user_id, category, vendor_name, vendor_id, cost_center, currency, status, invoice_count, total_amount)
+    SELECT invoice_date, user_id, COALESCE(category, ''), COALESCE(vendor_name, ''), COALESCE(vendor_id::text, ''),
+           COALESCE(cost_center, ''), COALESCE(currency, ''), status::text, COUNT(*), SUM(COALESCE(total_amount, 0))
+    FROM invoices
+    WHERE invoice_date IS NOT NULL
+    GROUP BY 1, 2, 3, 4, 5, 6, 7, 8;
+
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+    RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_daily_spend_rollup_insert
+    AFTER INSERT ON invoices
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION daily_spend_rollup_sync();
+
+CREATE TRIGGER trg_daily_spend_rollup_update
+    AFTER UPDATE ON invoices
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION daily_spend_rollup_sync();
+
+CREATE TRIGGER trg_daily_spend_rollup_delete
+    AFTER DELETE ON invoices
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION daily_spend_rollup_sync();
+
+-- Backfill
+SELECT rebuild_daily_spend_rollup();
@@ -0,0 +1,92 @@
+import base64
+import json
+import os
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", 50))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", 200))
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(sort_value: Any, row_id: Any) -> str:
+    """ Opaque, URL-safe token for the position after (sort_value, row_id). """
+    if isinstance(sort_value, datetime):
+        payload = {"t": "datetime", "v": sort_value.isoformat()}
+    elif isinstance(sort_value, date):
+        payload = {"t": "date", "v": sort_value.isoformat()}
+    else:
+        payload = {"t": "raw", "v": sort_value}
+    payload["id"] = str(row_id)
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        value, kind = payload["v"], payload["t"]
+        if value is not None and kind == "datetime":
+            value = datetime.fromisoformat(value)
+        elif value is not None and kind == "date":
+            value = date.fromisoformat(value)
+        return value, payload["id"]
+    except Exception:
+        raise InvalidCursor("Malformed pagination cursor")
+
+def clamp_page_size(page_size: Optional[int]) -> int:
+    return max(1, min(page_size or PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX))
+
+def select_fields(requested: Optional[str], allowed: Dict[str, str], default: Sequence[str],
+                  required: Sequence[str] = ()) -> List[str]:
+    """
+    Resolves a "a,b,c" field list against a whitelist of name -> SQL expression.
+    Unknown names raise ValueError; `required` fields (the keyset columns) are always included.
+    """
+    names = [f.strip() for f in requested.split(",") if f.strip()] if requested else list(default)
+    unknown = [n for n in names if n not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    names = list(dict.fromkeys(list(required) + names))
+    return [f"{allowed[n]} AS {n}" for n in names]
+
+async def keyset_page(conn, select: Sequence[str], from_sql: str, where: List[str], params: List[Any],
+                      sort_expr: str, id_expr: str, sort_key: str, id_key: str,
+                      page_size: Optional[int] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    One page ordered by (sort DESC NULLS LAST, id DESC), continuing after `cursor`.
+
+    Rows with a NULL sort value come last. A row-value comparison can't step
+    over NULLs, so a page that reaches them is topped up with a second query.
+    Both queries are plain range scans on an index in the same order.
+    Returns {"items": [...], "next_cursor": str | None}.
+    """
+    page_size = clamp_page_size(page_size)
+    after = decode_cursor(cursor) if cursor else None
+    columns = ", ".join(select)
+
+    async def fetch(extra: List[str], extra_params: List[Any], order: str, limit: int):
+        args = list(params) + extra_params
+        clauses = list(where) + [c.format(*[f"${len(params) + i + 1}" for i in range(len(extra_params))]) for c in extra]
+        sql = f"SELECT {columns} FROM {from_sql}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        args.append(limit)
+        sql += f" ORDER BY {order} LIMIT ${len(args)}"
+        return [dict(r) for r in await conn.fetch(sql, *args)]
+
+    want = page_size + 1
+    # Spelled exactly as the keyset indexes are (plain DESC means NULLS FIRST,
+    # which an index in this order can't supply without a sort)
+    order = f"{sort_expr} DESC NULLS LAST, {id_expr} DESC"
+    if after is None:
+        rows = await fetch([], [], order, want)
+    elif after[0] is not None:
+        rows = await fetch([f"({sort_expr}, {id_expr}) < ({{0}}, {{1}})"], list(after), order, want)
+        if len(rows) < want:
+            rows += await fetch([f"{sort_expr} IS NULL"], [], f"{id_expr} DESC", want - len(rows))
+    else:
+        rows = await fetch([f"{sort_expr} IS NULL", f"{id_expr} < {{0}}"], [after[1]], f"{id_expr} DESC", want)
+
+    items = rows[:page_size]
+    next_cursor = encode_cursor(items[-1][sort_key], items[-1][id_key]) if len(rows) > page_size else None
+    return {"items": items, "next_cursor": next_cursor, "page_size": page_size}
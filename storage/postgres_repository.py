@@ -4,29 +4,163 @@ import hashlib
 import logging
 import json
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, List, Optional
 
 logger = logging.getLogger(__name__)
 
 import asyncio
+from contextlib import asynccontextmanager
+from storage.session_cache import session_cache
+from storage.response_cache import bump_data_version
+from storage.vendor_registry import vendor_registry, normalize_vendor_name
+from storage.pagination import keyset_page, select_fields
+from storage.invoice_repository import (
+    INVOICE_FIELDS, PROJECTIONS, fetch_invoice, fetch_line_items, select_sql
+)
+
+# --- Connection Pool ---
+# A single process-wide asyncpg pool. get_db_connection() hands out pooled
+# connections whose close() releases them back to the pool, so existing
+# call sites keep working unchanged.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 20))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", 10))
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", 300))
+
+_pool: Optional[asyncpg.Pool] = None
+_pool_lock = asyncio.Lock()
+_pool_stats = {"acquired": 0, "released": 0, "waiting": 0, "timeouts": 0, "errors": 0}
+
+class PooledConnection:
+    """
+    Thin wrapper around a pooled asyncpg connection.
+    close() returns the connection to the pool instead of closing the socket
+    and is safe to call more than once.
+    """
+    def __init__(self, pool: asyncpg.Pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise asyncpg.InterfaceError("connection has been released back to the pool")
+        return getattr(self._conn, name)
+
+    @property
+    def raw(self):
+        return self._conn
+
+    def is_released(self) -> bool:
+        return self._conn is None
+
+    async def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            await self._pool.release(conn)
+        finally:
+            _pool_stats["released"] += 1
+
+async def init_db_pool(retries=5, delay=2) -> Optional[asyncpg.Pool]:
+    """ Creates the shared pool (idempotent). Called on app startup, or lazily on first use. """
+    global _pool
+    if _pool is not None:
+        return _pool
 
-async def get_db_connection(retries=5, delay=2):
     url = os.getenv("DATABASE_URL")
     if not url:
         logger.error("❌ DATABASE_URL not set in environment!")
         return None
-        
-    for i in range(retries):
-        try:
-            conn = await asyncpg.connect(url)
-            return conn
-        except Exception as e:
-            if i < retries - 1:
-                logger.warning(f"PostgreSQL connection attempt {i+1} failed: {e}. Retrying in {delay}s...")
-                await asyncio.sleep(delay)
-            else:
-                logger.error(f"PostgreSQL connection failed after {retries} attempts: {e}")
-                return None
+
+    async with _pool_lock:
+        if _pool is not None:
+            return _pool
+        for i in range(retries):
+            try:
+                _pool = await asyncpg.create_pool(
+                    url,
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+                )
+                logger.info(f"✅ PostgreSQL pool ready (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+                return _pool
+            except Exception as e:
+                if i < retries - 1:
+                    logger.warning(f"PostgreSQL pool creation attempt {i+1} failed: {e}. Retrying in {delay}s...")
+                    await asyncio.sleep(delay)
+                else:
+                    logger.error(f"PostgreSQL pool creation failed after {retries} attempts: {e}")
+                    return None
+
+async def close_db_pool():
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.close()
+        logger.info("🔌 PostgreSQL pool closed.")
+
+async def get_db_connection(retries=5, delay=2) -> Optional[PooledConnection]:
+    """
+    Acquires a connection from the shared pool.
+    Callers must call conn.close() (as before) to hand it back.
+    """
+    pool = await init_db_pool(retries=retries, delay=delay)
+    if pool is None:
+        return None
+
+    _pool_stats["waiting"] += 1
+    try:
+        conn = await pool.acquire(timeout=DB_POOL_ACQUIRE_TIMEOUT)
+        _pool_stats["acquired"] += 1
+        return PooledConnection(pool, conn)
+    except asyncio.TimeoutError:
+        _pool_stats["timeouts"] += 1
+        logger.error(f"PostgreSQL pool exhausted: no connection available within {DB_POOL_ACQUIRE_TIMEOUT}s")
+        return None
+    except Exception as e:
+        _pool_stats["errors"] += 1
+        logger.error(f"PostgreSQL connection acquire failed: {e}")
+        return None
+    finally:
+        _pool_stats["waiting"] -= 1
+
+@asynccontextmanager
+async def acquire(existing=None):
+    """
+    async with acquire() as conn: ...
+    Yields None when the database is unavailable, mirroring get_db_connection().
+    An existing connection is yielded as-is and left open, so repository
+    functions can join a caller's connection and transaction.
+    """
+    if existing is not None:
+        yield existing
+        return
+    conn = await get_db_connection()
+    try:
+        yield conn
+    finally:
+        if conn:
+            await conn.close()
+
+def get_pool_stats() -> Dict[str, Any]:
+    """ Pool saturation snapshot for /health. """
+    if _pool is None:
+        return {"status": "not_initialized", **_pool_stats}
+    size = _pool.get_size()
+    idle = _pool.get_idle_size()
+    max_size = _pool.get_max_size()
+    return {
+        "status": "ready",
+        "size": size,
+        "idle": idle,
+        "in_use": size - idle,
+        "min_size": _pool.get_min_size(),
+        "max_size": max_size,
+        "saturation": round((size - idle) / max_size, 3) if max_size else 0,
+        **_pool_stats
+    }
 
 async def check_db_health():
     """ Returns True if DB is reachable and migrations are likely applied. """
@@ -49,25 +183,28 @@ def generate_invoice_hash(data: Dict[str, Any]) -> str:
     raw_str = f"{data.get('vendor_name')}|{data.get('total_amount')}|{data.get('invoice_date')}"
     return hashlib.sha256(raw_str.encode()).hexdigest()
 
-async def log_activity(user_id: str, action: str, entity_type: str, entity_id: Optional[str] = None, before_state: Optional[Dict] = None, after_state: Optional[Dict] = None):
+async def log_activity(user_id: str, action: str, entity_type: str, entity_id: Optional[str] = None, before_state: Optional[Dict] = None, after_state: Optional[Dict] = None, conn=None):
     """
     Step 5: Audit Trail.
     Logs every action into activity_audit_log for Finance trust.
+    With conn, the row is written on that connection (inside its transaction,
+    committed or rolled back with it) and errors propagate to the caller.
     """
-    conn = await get_db_connection()
-    if not conn: return
-    
-    try:
-        await conn.execute("""
-            INSERT INTO activity_audit_log (user_id, action, entity_type, entity_id, before_state, after_state)
-            VALUES ($1, $2, $3, $4, $5, $6)
-        """, user_id, action, entity_type, entity_id if entity_id else None, 
-        json.dumps(before_state) if before_state else None,
-        json.dumps(after_state) if after_state else None)
-    except Exception as e:
-        logger.error(f"Audit logging failed: {e}")
-    finally:
-        await conn.close()
+    async with acquire(conn) as db:
+        if not db: return
+        try:
+            await db.execute("""
+                INSERT INTO activity_audit_log (user_id, action, entity_type, entity_id, before_state, after_state)
+                VALUES ($1, $2, $3, $4, $5, $6)
+            """, user_id, action, entity_type, entity_id if entity_id else None, 
+            json.dumps(before_state, default=str) if before_state else None,
+            json.dumps(after_state, default=str) if after_state else None)
+        except Exception as e:
+            if conn is not None:
+                raise
+            logger.error(f"Audit logging failed: {e}")
+
+LINE_ITEM_COPY_COLUMNS = ["invoice_id", "description", "quantity", "unit_price", "tax", "line_total"]
 
 async def persist_invoice_intelligence(
     user_id: str, 
@@ -76,92 +213,97 @@ async def persist_invoice_intelligence(
     whatsapp_media_id: Optional[str] = None,
     compliance_results: Optional[Dict[str, Any]] = None,
     embedding: Optional[List[float]] = None,
-    raw_text: Optional[str] = None
+    raw_text: Optional[str] = None,
+    conn=None
 ) -> Optional[str]:
     """
     Step 4: Persist Summary & Line Items with Transactional Integrity.
+    Idempotency check, invoice row, audit row and line items share one
+    connection and one transaction (a savepoint when conn is already in one).
+    Returns the new invoice_id, or the existing one for a duplicate.
     """
-    conn = await get_db_connection()
-    if not conn:
-        return None
-
     # Calculate hash for idempotency
     file_hash = generate_invoice_hash(invoice_data)
     
     invoice_id = None
-    try:
-        async with conn.transaction():
-            # 1. Check for duplicates
-            existing = await conn.fetchval(
-                "SELECT invoice_id FROM invoices WHERE file_hash = $1", 
-                file_hash
-            )
-            if existing:
-                logger.info(f"Duplicate invoice detected: {existing}")
-                return str(existing)
-
-            # 2. Insert Summary
-            invoice_id = await conn.fetchval("""
-                INSERT INTO invoices (
-                    user_id, vendor_name, invoice_date, currency, subtotal, 
-                    tax_amount, total_amount, category, confidence_score, line_items_status, 
-                    file_url, file_hash, whatsapp_media_id, status, version, is_latest,
-                    compliance_flags, cost_center, embedding, raw_text, updated_at
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, 1, TRUE, $15, $16, $17, $18, CURRENT_TIMESTAMP)
-                RETURNING invoice_id
-            """, 
-            user_id, 
-            invoice_data.get("vendor_name"),
-            datetime.strptime(invoice_data["invoice_date"], "%Y-%m-%d").date() if invoice_data.get("invoice_date") else None,
-            invoice_data.get("currency", "AED"),
-            invoice_data.get("subtotal"),
-            invoice_data.get("tax_amount"),
-            invoice_data.get("total_amount"),
-            invoice_data.get("category", "Other"),
-            invoice_data.get("confidence_score"),
-            invoice_data.get("line_items_status"),
-            file_url,
-            file_hash,
-            whatsapp_media_id,
-            'pending',
-            json.dumps(compliance_results.get("compliance_flags", [])) if compliance_results else None,
-            invoice_data.get("cost_center"),
-            str(embedding) if embedding else None,
-            raw_text
-            )
-
-            # 3. Log Activity
-            await log_activity(user_id, 'submit', 'invoice', str(invoice_id), after_state=invoice_data)
-
-            # 4. Insert Line Items
-            line_items = invoice_data.get("line_items", [])
-            if line_items:
-                item_data = [
-                    (
-                        invoice_id,
-                        item.get("description"),
-                        item.get("quantity"),
-                        item.get("unit_price"),
-                        item.get("tax"),
-                        item.get("line_total")
+    async with acquire(conn) as db:
+        if not db:
+            return None
+        try:
+            async with db.transaction():
+                # 1. Resolve the canonical vendor
+                vendor_id = await vendor_registry.resolve(db, invoice_data.get("vendor_name"))
+
+                # 2. Insert Summary; a file_hash conflict means a duplicate (no separate pre-check)
+                invoice_id = await db.fetchval("""
+                    INSERT INTO invoices (
+                        user_id, vendor_name, invoice_date, currency, subtotal, 
+                        tax_amount, total_amount, category, confidence_score, line_items_status, 
+                        file_url, file_hash, whatsapp_media_id, status, version, is_latest,
+                        compliance_flags, cost_center, embedding, raw_text, vendor_id, extraction_meta, updated_at
+                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, 1, TRUE, $15, $16, $17, $18, $19, $20, CURRENT_TIMESTAMP)
+                    ON CONFLICT (file_hash) DO NOTHING
+                    RETURNING invoice_id
+                """, 
+                user_id, 
+                invoice_data.get("vendor_name"),
+                datetime.strptime(invoice_data["invoice_date"], "%Y-%m-%d").date() if invoice_data.get("invoice_date") else None,
+                invoice_data.get("currency", "AED"),
+                invoice_data.get("subtotal"),
+                invoice_data.get("tax_amount"),
+                invoice_data.get("total_amount"),
+                invoice_data.get("category", "Other"),
+                invoice_data.get("confidence_score"),
+                invoice_data.get("line_items_status"),
+                file_url,
+                file_hash,
+                whatsapp_media_id,
+                'pending',
+                json.dumps(compliance_results.get("compliance_flags", [])) if compliance_results else None,
+                invoice_data.get("cost_center"),
+                str(embedding) if embedding else None,
+                raw_text,
+                vendor_id,
+                json.dumps(invoice_data["extraction_meta"]) if invoice_data.get("extraction_meta") else None
+                )
+
+                if invoice_id is None:
+                    existing = await db.fetchval("SELECT invoice_id FROM invoices WHERE file_hash = $1", file_hash)
+                    logger.info(f"Duplicate invoice detected: {existing}")
+                    return str(existing) if existing else None
+
+                # 3. Log Activity (same transaction: no audit row for a rolled-back invoice)
+                await log_activity(user_id, 'submit', 'invoice', str(invoice_id), after_state=invoice_data, conn=db)
+
+                # 4. Insert Line Items (binary COPY, one round-trip)
+                line_items = invoice_data.get("line_items", [])
+                if line_items:
+                    await db.copy_records_to_table(
+                        "invoice_line_items",
+                        records=[
+                            (
+                                invoice_id,
+                                item.get("description"),
+                                item.get("quantity"),
+                                item.get("unit_price"),
+                                item.get("tax"),
+                                item.get("line_total")
+                            )
+                            for item in line_items
+                        ],
+                        columns=LINE_ITEM_COPY_COLUMNS
                     )
-                    for item in line_items
-                ]
-                
-                await conn.executemany("""
-                    INSERT INTO invoice_line_items (
-                        invoice_id, description, quantity, unit_price, tax, line_total
-                    ) VALUES ($1, $2, $3, $4, $5, $6)
-                """, item_data)
-                logger.info(f"Inserted {len(line_items)} line items for invoice {invoice_id}")
-                
-        return str(invoice_id) if invoice_id else None
+                    logger.info(f"Inserted {len(line_items)} line items for invoice {invoice_id}")
 
-    except Exception as e:
-        logger.error(f"Persistence failed: {e}")
-        return None
-    finally:
-        await conn.close()
+            # After commit, so a concurrent recompute can't re-cache pre-insert data
+            bump_data_version()
+            return str(invoice_id)
+
+        except Exception as e:
+            logger.error(f"Persistence failed: {e}")
+            if conn is not None:
+                raise
+            return None
 
 def sanitize_file_url(url: str) -> str:
     if not url: return None
@@ -187,19 +329,90 @@ def sanitize_file_url(url: str) -> str:
          
     return url
 
+# --- Invoice listings ---
+USER_LIST_FIELDS = {
+    name: name for name in ("phone", "name", "email", "role", "is_approved", "dept", "username", "last_login", "created_at")
+}
+DEFAULT_USER_PAGE_FIELDS = ["phone", "name", "role", "is_approved", "dept", "created_at"]
+
+def _sanitize_urls(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for d in rows:
+        if "file_url" in d:
+            d["file_url"] = sanitize_file_url(d.get("file_url"))
+    return rows
+
+async def merchant_filter(conn, name: str):
+    """ (column, value) selecting a merchant's invoices: its vendor_id, or the raw name if unlinked. """
+    vendor_id = await conn.fetchval(
+        "SELECT vendor_id FROM vendor_aliases WHERE alias_normalized = $1", normalize_vendor_name(name)
+    )
+    return ("i.vendor_id", vendor_id) if vendor_id else ("i.vendor_name", name)
+
+async def get_invoices_page(user_id: Optional[str] = None, merchant: Optional[str] = None,
+                            status: Optional[str] = None, fields: Optional[str] = None,
+                            page_size: Optional[int] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Keyset page of invoices, newest invoice_date first (ties by invoice_id).
+    Slim default projection; `fields` ("vendor_name,total_amount,...") selects
+    from INVOICE_FIELDS. Raises ValueError / InvalidCursor on bad input.
+    """
+    select = select_fields(fields, INVOICE_FIELDS, PROJECTIONS["summary"], required=["invoice_id", "invoice_date"])
+    conn = await get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
+    try:
+        where, params = [], []
+        if user_id:
+            params.append(user_id)
+            where.append(f"i.user_id = ${len(params)}")
+        if merchant:
+            column, value = await merchant_filter(conn, merchant)
+            params.append(value)
+            where.append(f"{column} = ${len(params)}")
+            if column == "i.vendor_name":
+                where.append("i.vendor_id IS NULL")
+        if status:
+            params.append(status)
+            where.append(f"i.status = ${len(params)}")
+
+        page = await keyset_page(
+            conn, select, "invoices i LEFT JOIN system_users u ON i.user_id = u.phone", where, params,
+            sort_expr="i.invoice_date", id_expr="i.invoice_id", sort_key="invoice_date", id_key="invoice_id",
+            page_size=page_size, cursor=cursor
+        )
+    finally:
+        await conn.close()
+    _sanitize_urls(page["items"])
+    return page
+
+async def get_users_page(fields: Optional[str] = None, page_size: Optional[int] = None,
+                         cursor: Optional[str] = None) -> Dict[str, Any]:
+    """ Keyset page of system users, newest first; never exposes credentials. """
+    select = select_fields(fields, USER_LIST_FIELDS, DEFAULT_USER_PAGE_FIELDS, required=["phone", "created_at"])
+    conn = await get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
+    try:
+        return await keyset_page(
+            conn, select, "system_users", [], [],
+            sort_expr="created_at", id_expr="phone", sort_key="created_at", id_key="phone",
+            page_size=page_size, cursor=cursor
+        )
+    finally:
+        await conn.close()
+
 async def get_all_invoices(limit: int = 50):
     conn = await get_db_connection()
     if not conn: return []
     # Join with system_users to show names instead of just phone numbers
-    query = """
-        SELECT i.*, u.name as user_name 
-        FROM invoices i
-        LEFT JOIN system_users u ON i.user_id = u.phone
+    query = select_sql("detail") + """
         ORDER BY i.created_at DESC 
         LIMIT $1
     """
-    rows = await conn.fetch(query, limit)
-    await conn.close()
+    try:
+        rows = await conn.fetch(query, limit)
+    finally:
+        await conn.close()
     
     results = []
     for r in rows:
@@ -208,21 +421,21 @@ async def get_all_invoices(limit: int = 50):
         results.append(d)
     return results
 
-async def get_invoice_detail(invoice_id: str):
+async def get_invoice_detail(invoice_id: str, include: Iterable[str] = ()):
+    """ Detail projection plus line items; heavy columns (raw_text, embedding) only via include. """
     conn = await get_db_connection()
     if not conn: return None
     
-    invoice = await conn.fetchrow("SELECT * FROM invoices WHERE invoice_id = $1", invoice_id)
-    if not invoice:
+    try:
+        invoice = await fetch_invoice(conn, invoice_id, "detail", include)
+        if not invoice:
+            return None
+            
+        invoice["line_items"] = await fetch_line_items(conn, invoice_id)
+    finally:
         await conn.close()
-        return None
-        
-    items = await conn.fetch("SELECT * FROM invoice_line_items WHERE invoice_id = $1", invoice_id)
-    await conn.close()
     
-    res = dict(invoice)
-    res["line_items"] = [dict(i) for i in items]
-    return res
+    return invoice
 
 async def get_invoice_audit(invoice_id: str):
     """
@@ -232,14 +445,12 @@ async def get_invoice_audit(invoice_id: str):
     conn = await get_db_connection()
     if not conn: return None
     
-    invoice = await conn.fetchrow("""
-        SELECT invoice_id, confidence_score, status, line_items_status, whatsapp_media_id, created_at, version
-        FROM invoices WHERE invoice_id = $1
-    """, invoice_id)
-    await conn.close()
+    try:
+        d = await fetch_invoice(conn, invoice_id, "audit")
+    finally:
+        await conn.close()
     
-    if not invoice: return None
-    d = dict(invoice)
+    if not d: return None
     d["file_url"] = sanitize_file_url(d.get("file_url"))
     return d
 
@@ -248,8 +459,10 @@ async def get_invoice_audit(invoice_id: str):
 async def get_system_user(phone: str) -> Optional[Dict[str, Any]]:
     conn = await get_db_connection()
     if not conn: return None
-    row = await conn.fetchrow("SELECT * FROM system_users WHERE phone = $1", phone)
-    await conn.close()
+    try:
+        row = await conn.fetchrow("SELECT * FROM system_users WHERE phone = $1", phone)
+    finally:
+        await conn.close()
     return dict(row) if row else None
 
 async def create_user_request(phone: str, name: str, username: Optional[str] = None, password_hash: Optional[str] = None, details: Optional[str] = None):
@@ -273,11 +486,40 @@ async def create_user_request(phone: str, name: str, username: Optional[str] = N
     finally:
         await conn.close()
 
+async def validate_admin_session(token: str) -> bool:
+    """
+    True if token is the session token of an approved admin.
+    Served from the in-process session cache when possible.
+    """
+    if session_cache.get(token):
+        return True
+
+    conn = await get_db_connection()
+    if not conn: return False
+    try:
+        user = await conn.fetchrow("""
+            SELECT phone
+            FROM system_users 
+            WHERE session_token = $1 AND role = 'admin' AND is_approved = TRUE
+        """, token)
+    except Exception as e:
+        print(f"Session token validation error: {e}")
+        return False
+    finally:
+        await conn.close()
+
+    if not user:
+        return False
+    session_cache.put(token, user["phone"])
+    return True
+
 async def list_pending_requests():
     conn = await get_db_connection()
     if not conn: return []
-    rows = await conn.fetch("SELECT * FROM user_registration_requests WHERE status = 'pending' ORDER BY created_at DESC")
-    await conn.close()
+    try:
+        rows = await conn.fetch("SELECT * FROM user_registration_requests WHERE status = 'pending' ORDER BY created_at DESC")
+    finally:
+        await conn.close()
     return [dict(r) for r in rows]
 
 async def approve_user_request(phone: str, role: str = 'employee'):
@@ -302,6 +544,8 @@ async def approve_user_request(phone: str, role: str = 'employee'):
             
             # 3. Update request status
             await conn.execute("UPDATE user_registration_requests SET status = 'approved' WHERE phone = $1", phone)
+            # Role may have changed
+            session_cache.invalidate_user(phone)
             return True
     except Exception as e:
         logger.error(f"Approval failed: {e}")
@@ -313,8 +557,10 @@ async def approve_user_request(phone: str, role: str = 'employee'):
 async def get_all_users():
     conn = await get_db_connection()
     if not conn: return []
-    rows = await conn.fetch("SELECT * FROM system_users ORDER BY created_at DESC")
-    await conn.close()
+    try:
+        rows = await conn.fetch("SELECT * FROM system_users ORDER BY created_at DESC")
+    finally:
+        await conn.close()
     return [dict(r) for r in rows]
 
 async def delete_system_user(phone: str):
@@ -322,6 +568,7 @@ async def delete_system_user(phone: str):
     if not conn: return False
     try:
         await conn.execute("DELETE FROM system_users WHERE phone = $1", phone)
+        session_cache.invalidate_user(phone)
         # Also reject any pending request for them
         await conn.execute("UPDATE user_registration_requests SET status = 'rejected' WHERE phone = $1", phone)
         return True
@@ -343,8 +590,73 @@ async def reject_user_request(phone: str):
     finally:
         await conn.close()
 
+# --- Schema Migrations ---
+# Applied migrations are recorded in schema_migrations so a boot (or a uvicorn
+# reload) only runs files it has not seen before. A session-level advisory lock
+# serializes concurrent workers that boot at the same time.
+MIGRATION_LOCK_KEY = 7244011501
+
+def get_migration_dir() -> Optional[str]:
+    migration_dir = os.path.join(os.getcwd(), "storage", "migrations")
+    if not os.path.exists(migration_dir):
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        migration_dir = os.path.join(script_dir, "migrations")
+    return migration_dir if os.path.exists(migration_dir) else None
+
+def _migration_sort_key(filename: str):
+    # Files are numbered inconsistently (01_, 005_, 011_); order by the numeric
+    # prefix so 01_invoice_tables runs before 005_add_vector.
+    prefix = filename.split("_", 1)[0]
+    return (int(prefix) if prefix.isdigit() else float("inf"), filename)
+
+def list_migration_files(migration_dir: str) -> List[Dict[str, str]]:
+    files = sorted([f for f in os.listdir(migration_dir) if f.endswith(".sql")], key=_migration_sort_key)
+    migrations = []
+    for filename in files:
+        with open(os.path.join(migration_dir, filename), "r") as f:
+            content = f.read()
+        migrations.append({
+            "filename": filename,
+            "checksum": hashlib.sha256(content.encode()).hexdigest(),
+            "sql": content
+        })
+    return migrations
+
+async def _ensure_migration_ledger(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            filename TEXT PRIMARY KEY,
+            checksum TEXT NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+async def get_pending_migrations(conn, migration_dir: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    Returns migration files not yet recorded in schema_migrations.
+    Files whose checksum changed after being applied are logged but not re-run.
+    """
+    migration_dir = migration_dir or get_migration_dir()
+    if not migration_dir:
+        return []
+
+    applied = {}
+    ledger_exists = await conn.fetchval("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    if ledger_exists:
+        rows = await conn.fetch("SELECT filename, checksum FROM schema_migrations")
+        applied = {r["filename"]: r["checksum"] for r in rows}
+
+    pending = []
+    for migration in list_migration_files(migration_dir):
+        recorded = applied.get(migration["filename"])
+        if recorded is None:
+            pending.append(migration)
+        elif recorded != migration["checksum"]:
+            logger.warning(f"⚠️ Migration {migration['filename']} changed after it was applied (checksum mismatch). Add a new migration instead of editing it.")
+    return pending
+
 async def run_pg_migrations():
-    """ Runs all SQL migrations in the migrations directory. """
+    """ Applies pending SQL migrations from the migrations directory, each in its own transaction. """
     url = os.getenv("DATABASE_URL")
     if not url:
         logger.error("❌ DATABASE_URL not found in environment!")
@@ -355,57 +667,46 @@ async def run_pg_migrations():
         logger.error("❌ Failed to connect to PostgreSQL for migrations.")
         return
     
+    locked = False
     try:
-        # Get all .sql files in storage/migrations
-        migration_dir = os.path.join(os.getcwd(), "storage", "migrations")
-        if not os.path.exists(migration_dir):
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            migration_dir = os.path.join(script_dir, "migrations")
-            
-        if not os.path.exists(migration_dir):
-            logger.error(f"❌ Migration directory NOT FOUND: {migration_dir}")
+        migration_dir = get_migration_dir()
+        if not migration_dir:
+            logger.error("❌ Migration directory NOT FOUND under storage/migrations")
             return
 
-        migration_files = sorted([f for f in os.listdir(migration_dir) if f.endswith(".sql")])
-        
-        logger.info(f"🚀 Found {len(migration_files)} migration files. Starting migration...")
-        
+        await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_KEY)
+        locked = True
+
         # 1. Try to enable uuid-ossp separately
         try:
             await conn.execute('CREATE EXTENSION IF NOT EXISTS "uuid-ossp";')
-            logger.info("✅ uuid-ossp extension enabled.")
         except Exception as e:
             logger.warning(f"⚠️ Could not enable uuid-ossp: {e}")
 
-        for filename in migration_files:
-            file_path = os.path.join(migration_dir, filename)
+        await _ensure_migration_ledger(conn)
+        pending = await get_pending_migrations(conn, migration_dir)
+        if not pending:
+            logger.info("✅ Database schema is up to date.")
+            return
+
+        logger.info(f"🚀 {len(pending)} pending migration(s). Starting migration...")
+
+        for migration in pending:
+            filename = migration["filename"]
             logger.info(f"📜 Applying migration: {filename}...")
-            with open(file_path, "r") as f:
-                content = f.read()
-                try:
-                    await conn.execute(content)
-                    logger.info(f"✅ {filename} applied.")
-                except Exception as e:
-                    logger.error(f"❌ Error applying {filename}: {e}")
-
-        # --- CUSTOM PATCHES (Idempotent) ---
-        # Bot Interaction Table Patch
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS bot_interactions (
-                interaction_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-                user_id TEXT NOT NULL,
-                query TEXT NOT NULL,
-                response TEXT NOT NULL,
-                intent TEXT,
-                confidence NUMERIC(5, 4),
-                channel TEXT DEFAULT 'whatsapp',
-                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-            );
-            ALTER TABLE invoices ADD COLUMN IF NOT EXISTS category TEXT;
-        """)
-        logger.info("✅ Custom patches verified.")
+            try:
+                async with conn.transaction():
+                    await conn.execute(migration["sql"])
+                    await conn.execute(
+                        "INSERT INTO schema_migrations (filename, checksum) VALUES ($1, $2)",
+                        filename, migration["checksum"]
+                    )
+                logger.info(f"✅ {filename} applied.")
+            except Exception as e:
+                # Not recorded, so it is retried on the next boot
+                logger.error(f"❌ Error applying {filename}: {e}")
 
-        # 3. Final Verification
+        # Final Verification
         exists = await conn.fetchval("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'invoices')")
         if exists:
             logger.info("📊 Verification: 'invoices' table is PRESENT.")
@@ -415,6 +716,11 @@ async def run_pg_migrations():
     except Exception as e:
         logger.error(f"❌ Error during PostgreSQL migrations: {e}")
     finally:
+        if locked:
+            try:
+                await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_KEY)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not release migration lock: {e}")
         await conn.close()
 
 async def log_bot_interaction(user_id: str, query: str, response: str, intent: str = "unknown", confidence: float = 1.0, channel: str = "whatsapp"):
@@ -430,9 +736,13 @@ async def log_bot_interaction(user_id: str, query: str, response: str, intent: s
     finally:
         await conn.close()
 
-async def get_report_stats():
+async def get_report_stats(raise_errors: bool = False):
+    """ raise_errors: fail instead of returning zeroed stats (callers that cache the result). """
     conn = await get_db_connection()
-    if not conn: return {"stats": {"total_spend": 0, "total_invoices": 0, "user_count": 0, "avg_invoice": 0}, "revenueData": [], "distribution": [], "topProducts": [], "topCustomers": []}
+    if not conn:
+        if raise_errors:
+            raise RuntimeError("Database connection failed")
+        return {"stats": {"total_spend": 0, "total_invoices": 0, "user_count": 0, "avg_invoice": 0}, "revenueData": [], "distribution": [], "topProducts": [], "topCustomers": []}
     try:
         # 1. Basic Stats
         total_spend = await conn.fetchval("SELECT SUM(total_amount) FROM invoices WHERE status = 'approved'") or 0
@@ -471,9 +781,10 @@ async def get_report_stats():
         top_vendors = []
         try:
             top_vendors = await conn.fetch("""
-                SELECT vendor_name as name, COUNT(*) as sales, SUM(total_amount) as revenue
-                FROM invoices
-                GROUP BY vendor_name
+                SELECT COALESCE(v.canonical_name, i.vendor_name) as name, COUNT(*) as sales, SUM(i.total_amount) as revenue
+                FROM invoices i
+                LEFT JOIN vendors v ON v.vendor_id = i.vendor_id
+                GROUP BY v.vendor_id, COALESCE(v.canonical_name, i.vendor_name)
                 ORDER BY revenue DESC
                 LIMIT 5
             """)
@@ -506,6 +817,8 @@ async def get_report_stats():
         }
     except Exception as e:
         print(f"DB Error (report_stats): {e}")
+        if raise_errors:
+            raise
         return {"stats": {"total_spend": 0, "total_invoices": 0, "user_count": 0, "avg_invoice": 0}, "revenueData": [], "distribution": [], "topProducts": [], "topCustomers": []}
     finally:
         await conn.close()
@@ -550,14 +863,17 @@ async def get_merchants():
     conn = await get_db_connection()
     if not conn: return []
     try:
+        # One row per canonical vendor; invoices not linked yet fall back to their raw name
         rows = await conn.fetch("""
-            SELECT vendor_name as name, 
+            SELECT COALESCE(v.canonical_name, i.vendor_name) as name,
+                   v.vendor_id,
                    COUNT(*) as total_invoices, 
-                   SUM(total_amount) as total_spend,
-                   MAX(invoice_date) as last_interaction
-            FROM invoices
-            WHERE vendor_name IS NOT NULL
-            GROUP BY vendor_name
+                   SUM(i.total_amount) as total_spend,
+                   MAX(i.invoice_date) as last_interaction
+            FROM invoices i
+            LEFT JOIN vendors v ON v.vendor_id = i.vendor_id
+            WHERE i.vendor_id IS NOT NULL OR i.vendor_name IS NOT NULL
+            GROUP BY v.vendor_id, COALESCE(v.canonical_name, i.vendor_name)
             ORDER BY total_spend DESC
         """)
         return [dict(r) for r in rows]
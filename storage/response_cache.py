@@ -0,0 +1,130 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 300))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 512))
+
+# Parameters that identify the caller, not the result
+_IGNORED_PARAMS = {"token", "request"}
+
+class ResponseCache:
+    """
+    Caches computed analytics responses keyed on endpoint + normalized params.
+
+    Every entry is tagged with the invoices data version current when it was
+    computed; bump_data_version() (called after any invoice write) makes all
+    older entries stale at once. The TTL bounds staleness for writes made in
+    another worker process, or to tables other than invoices.
+
+    Entries keep the serialized JSON body and a strong ETag (hash of the body),
+    so If-None-Match revalidation is answered with 304 without recomputing.
+    """
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL_SECONDS, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.data_version = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "version_bumps": 0}
+
+    def bump_data_version(self):
+        self.data_version += 1
+        self.stats["version_bumps"] += 1
+
+    @staticmethod
+    def make_key(endpoint: str, params: Dict[str, Any]) -> str:
+        normalized = {k: v for k, v in params.items() if k not in _IGNORED_PARAMS}
+        return f"{endpoint}?{json.dumps(normalized, sort_keys=True, default=str)}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None or entry["version"] != self.data_version or time.monotonic() - entry["stored_at"] > self.ttl:
+            if entry is not None:
+                del self._entries[key]
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry
+
+    def put(self, key: str, data: Any, body: bytes, version: int) -> Dict[str, Any]:
+        entry = {
+            "data": data,
+            "body": body,
+            "etag": f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+            "version": version,
+            "stored_at": time.monotonic()
+        }
+        # A write that landed while we computed makes this result stale already
+        if version == self.data_version:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def cached(self, endpoint: str) -> Callable:
+        """
+        Decorator for FastAPI handlers. Served over HTTP the handler returns the
+        cached JSON with an ETag (or 304 on a matching If-None-Match); called
+        directly from Python (e.g. the overview endpoint) it returns the data.
+        """
+        def decorator(func):
+            signature = inspect.signature(func)
+
+            @functools.wraps(func)
+            async def wrapper(*args, request=None, **kwargs):
+                bound = signature.bind_partial(*args, **kwargs)
+                bound.apply_defaults()
+                key = self.make_key(endpoint, dict(bound.arguments))
+
+                entry = self.get(key)
+                if entry is None:
+                    from fastapi.encoders import jsonable_encoder
+                    version = self.data_version
+                    data = await func(*args, **kwargs)
+                    body = json.dumps(jsonable_encoder(data), separators=(",", ":")).encode()
+                    entry = self.put(key, data, body, version)
+
+                if request is None:
+                    return entry["data"]
+
+                from fastapi import Response
+                headers = {"ETag": entry["etag"], "Cache-Control": "private, no-cache"}
+                if_none_match = request.headers.get("if-none-match", "")
+                if entry["etag"] in [tag.strip() for tag in if_none_match.split(",")]:
+                    self.stats["not_modified"] += 1
+                    return Response(status_code=304, headers=headers)
+                return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+            # Let FastAPI inject the Request alongside the handler's own params
+            from fastapi import Request
+            params = list(signature.parameters.values())
+            params.append(inspect.Parameter("request", inspect.Parameter.KEYWORD_ONLY, annotation=Request))
+            wrapper.__signature__ = signature.replace(parameters=params)
+            return wrapper
+        return decorator
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "data_version": self.data_version,
+            "entries": len(self._entries),
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0
+        }
+
+response_cache = ResponseCache()
+
+def bump_data_version():
+    """ Call after any write to invoices so cached analytics are recomputed. """
+    response_cache.bump_data_version()
@@ -0,0 +1,64 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", 60))
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", 1024))
+
+class SessionCache:
+    """
+    In-process TTL/LRU cache of admin session tokens that were validated
+    against system_users, so verify_admin costs no DB round-trip on the hot path.
+
+    Logout, user deletion and role changes invalidate explicitly; the TTL bounds
+    how long another worker process can keep accepting a token revoked elsewhere.
+    """
+
+    def __init__(self, ttl: float = SESSION_CACHE_TTL_SECONDS, max_entries: int = SESSION_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, token: str) -> Optional[str]:
+        """ Returns the admin's phone for a cached, unexpired token. """
+        entry = self._entries.get(token)
+        if entry is None or time.monotonic() - entry["validated_at"] > self.ttl:
+            if entry is not None:
+                del self._entries[token]
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(token)
+        self.stats["hits"] += 1
+        return entry["phone"]
+
+    def put(self, token: str, phone: str):
+        self._entries[token] = {"phone": phone, "validated_at": time.monotonic()}
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_token(self, token: Optional[str]):
+        if token and self._entries.pop(token, None) is not None:
+            self.stats["invalidations"] += 1
+
+    def invalidate_user(self, phone: str):
+        """ Drops every cached token of a user (deleted, or role changed). """
+        for token in [t for t, e in self._entries.items() if e["phone"] == phone]:
+            del self._entries[token]
+            self.stats["invalidations"] += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "ttl_seconds": self.ttl,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0
+        }
+
+session_cache = SessionCache()
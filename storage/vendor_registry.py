@@ -0,0 +1,155 @@
+import logging
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Trigram similarity at which an unseen spelling joins an existing vendor
+VENDOR_MATCH_THRESHOLD = float(os.getenv("VENDOR_MATCH_THRESHOLD", 0.6))
+VENDOR_CACHE_MAX_ENTRIES = int(os.getenv("VENDOR_CACHE_MAX_ENTRIES", 4096))
+
+# Trailing company-form tokens dropped by normalization ("Carrefour LLC" -> "carrefour")
+LEGAL_SUFFIXES = {
+    "llc", "fz", "fze", "fzco", "fzc", "fzllc", "dmcc", "ltd", "limited", "inc", "incorporated",
+    "co", "company", "corp", "corporation", "est", "establishment", "plc", "pjsc", "psc",
+    "gmbh", "sa", "pvt", "llp", "wll", "spc"
+}
+# Words that describe the outlet rather than the merchant; ignored when
+# comparing names ("Carrefour Hypermarket" is still Carrefour)
+DESCRIPTOR_WORDS = {
+    "hypermarket", "supermarket", "market", "mart", "store", "stores", "shop", "restaurant",
+    "cafe", "trading", "services", "group", "uae", "branch"
+}
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]|_", re.UNICODE)
+
+def normalize_vendor_name(name: Optional[str]) -> str:
+    """ Case/width/punctuation-insensitive form with legal suffixes removed. """
+    if not name:
+        return ""
+    text = unicodedata.normalize("NFKC", name).casefold().replace("&", " and ").replace(".", "")
+    tokens = _PUNCTUATION_RE.sub(" ", text).split()
+    if tokens and tokens[0] == "the" and len(tokens) > 1:
+        tokens = tokens[1:]
+    while len(tokens) > 1 and tokens[-1] in LEGAL_SUFFIXES:
+        tokens.pop()
+    return " ".join(tokens)
+
+def core_name(normalized: str) -> str:
+    """ Normalized name without outlet descriptors; falls back to the full name. """
+    tokens = [t for t in normalized.split() if t not in DESCRIPTOR_WORDS]
+    return " ".join(tokens) or normalized
+
+def choose_match(normalized: str, candidates: List[Dict[str, Any]],
+                 threshold: float = VENDOR_MATCH_THRESHOLD) -> Optional[Any]:
+    """
+    Picks the vendor for an unseen spelling from trigram candidates
+    ({"vendor_id", "alias_normalized", "score"}, best first): same core name
+    wins outright, otherwise the best candidate at or above the threshold.
+    """
+    core = core_name(normalized)
+    for candidate in candidates:
+        if core_name(candidate["alias_normalized"]) == core:
+            return candidate["vendor_id"]
+    for candidate in candidates:
+        if candidate["score"] >= threshold:
+            return candidate["vendor_id"]
+    return None
+
+class VendorRegistry:
+    """
+    Resolves free-text vendor names to canonical vendor_ids.
+
+    Lookup order: in-process cache -> exact alias -> trigram candidates
+    (pg_trgm GIN) -> new vendor. Every resolved spelling is stored as an alias,
+    so each variant costs one fuzzy lookup in total. Runs on the caller's
+    connection, so resolution at ingest is part of the invoice transaction.
+    """
+
+    def __init__(self, max_entries: int = VENDOR_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+        self.stats = {"hits": 0, "alias_hits": 0, "fuzzy_matches": 0, "created": 0}
+
+    def _remember(self, normalized: str, vendor_id):
+        self._cache[normalized] = vendor_id
+        self._cache.move_to_end(normalized)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def resolve(self, conn, name: Optional[str]) -> Optional[Any]:
+        normalized = normalize_vendor_name(name)
+        if not normalized:
+            return None
+
+        if normalized in self._cache:
+            self._cache.move_to_end(normalized)
+            self.stats["hits"] += 1
+            return self._cache[normalized]
+
+        vendor_id = await conn.fetchval(
+            "SELECT vendor_id FROM vendor_aliases WHERE alias_normalized = $1", normalized
+        )
+        if vendor_id:
+            self.stats["alias_hits"] += 1
+            self._remember(normalized, vendor_id)
+            return vendor_id
+
+        candidates = await conn.fetch("""
+            SELECT vendor_id, alias_normalized, similarity(alias_normalized, $1) AS score
+            FROM vendor_aliases
+            WHERE alias_normalized % $1
+            ORDER BY score DESC
+            LIMIT 10
+        """, normalized)
+        vendor_id = choose_match(normalized, [dict(c) for c in candidates])
+        if vendor_id:
+            self.stats["fuzzy_matches"] += 1
+        else:
+            vendor_id = await conn.fetchval("""
+                INSERT INTO vendors (canonical_name, normalized_name)
+                VALUES ($1, $2)
+                ON CONFLICT (normalized_name) DO UPDATE SET normalized_name = EXCLUDED.normalized_name
+                RETURNING vendor_id
+            """, " ".join(name.split()), normalized)
+            self.stats["created"] += 1
+            logger.info(f"🏷️ New vendor: {name!r}")
+
+        # A concurrent ingest may have mapped this spelling first; its mapping wins.
+        # Not cached here: the row is only visible once the caller's transaction commits.
+        return await self.add_alias(conn, name, vendor_id)
+
+    async def add_alias(self, conn, alias: str, vendor_id) -> Any:
+        """ Maps a spelling to a vendor (first mapping wins); returns the vendor it maps to. """
+        return await conn.fetchval("""
+            INSERT INTO vendor_aliases (alias_normalized, vendor_id, alias)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (alias_normalized) DO UPDATE SET alias_normalized = EXCLUDED.alias_normalized
+            RETURNING vendor_id
+        """, normalize_vendor_name(alias), vendor_id, alias)
+
+    async def search(self, conn, text: str, limit: int = 20) -> List[Any]:
+        """ Vendor ids whose spellings contain or resemble `text`, best match first. """
+        normalized = normalize_vendor_name(text)
+        if not normalized:
+            return []
+        rows = await conn.fetch("""
+            SELECT vendor_id, MAX(similarity(alias_normalized, $1)) AS score
+            FROM vendor_aliases
+            WHERE alias_normalized LIKE '%' || $1 || '%' OR alias_normalized % $1
+            GROUP BY vendor_id
+            ORDER BY score DESC
+            LIMIT $2
+        """, normalized, limit)
+        return [r["vendor_id"] for r in rows]
+
+    def clear(self):
+        self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "entries": len(self._cache)}
+
+vendor_registry = VendorRegistry()
@@ -0,0 +1,98 @@
+"""
+Benchmark: bytes and latency of SELECT * versus the named invoice projections.
+
+Fills a scratch schema (projection_bench, with its own "invoices" table in
+the production layout) with synthetic invoices carrying a 768-dim embedding
+and a few KB of OCR text, then reads the same rows through each projection.
+Size is measured server-side with pg_column_size. Latency covers the fetch
+plus dict(r), as the endpoints do.
+
+    DATABASE_URL=postgres://... python tests/bench_invoice_projections.py --rows 20000
+
+Needs pgvector; never run by pytest.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncpg
+from dotenv import load_dotenv
+
+from storage.invoice_repository import select_sql
+
+SCHEMA = "projection_bench"
+
+CASES = {
+    "SELECT *": """
+        SELECT i.*, u.name AS user_name
+        FROM invoices i LEFT JOIN system_users u ON i.user_id = u.phone
+    """,
+    "summary": select_sql("summary"),
+    "detail": select_sql("detail"),
+    "audit": select_sql("audit"),
+    "export": select_sql("export"),
+    "detail + raw_text": select_sql("detail", include=["raw_text"]),
+}
+
+async def load(conn, rows: int, text_bytes: int):
+    await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+    # Same columns as public.invoices (generated search_tsv included)
+    await conn.execute(f"CREATE TABLE {SCHEMA}.invoices (LIKE public.invoices INCLUDING DEFAULTS INCLUDING GENERATED)")
+    started = time.perf_counter()
+    await conn.execute(f"""
+        INSERT INTO {SCHEMA}.invoices (user_id, vendor_name, invoice_date, total_amount, category, file_hash, raw_text, embedding)
+        SELECT '+9715' || (g % 200), 'Vendor ' || (g % 500), DATE '2024-01-01' + (g % 365), (g % 5000) + 0.99,
+               'Office', md5(g::text),
+               repeat('Tax invoice line ' || g || ' qty 1 price 10.00 ', $2 / 40),
+               (SELECT array_agg(random())::vector(768) FROM generate_series(1, 768) WHERE g > 0)
+        FROM generate_series(1, $1) g
+    """, rows, text_bytes)
+    await conn.execute(f"ANALYZE {SCHEMA}.invoices")
+    return time.perf_counter() - started
+
+async def measure(conn, sql: str, limit: int, repeats: int):
+    query = sql + " ORDER BY i.invoice_date DESC, i.invoice_id DESC LIMIT $1"
+    size = await conn.fetchval(f"SELECT SUM(pg_column_size(t.*)) FROM ({query}) t", limit)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        [dict(r) for r in await conn.fetch(query, limit)]
+        timings.append((time.perf_counter() - started) * 1000)
+    return size, statistics.median(timings), max(timings)
+
+async def bench(rows: int, limit: int, repeats: int, text_bytes: int):
+    conn = await asyncpg.connect(os.getenv("DATABASE_URL"), server_settings={"search_path": f"{SCHEMA},public"})
+    try:
+        load_s = await load(conn, rows, text_bytes)
+        print(f"📦 {rows:,} synthetic invoices (~{text_bytes} B raw_text + 768-dim embedding) loaded in {load_s:.1f}s")
+        print(f"Reading {limit:,} rows, median of {repeats} runs\n")
+        print(f"{'projection':<20}{'bytes':>14}{'per row':>10}{'vs *':>8}{'p50 ms':>10}{'max ms':>10}")
+        baseline = None
+        for name, sql in CASES.items():
+            size, p50, worst = await measure(conn, sql, limit, repeats)
+            baseline = baseline or size
+            print(f"{name:<20}{size:>14,}{size // limit:>10,}{size / baseline:>8.1%}{p50:>10.1f}{worst:>10.1f}")
+    finally:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Bytes/latency of invoice read projections.")
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--limit", type=int, default=1000, help="Rows read per query")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--text-bytes", type=int, default=4000)
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        print("❌ DATABASE_URL not set")
+        sys.exit(1)
+    asyncio.run(bench(args.rows, args.limit, args.repeats, args.text_bytes))
+    print("\n✅ SUCCESS: Projection benchmark complete.")
@@ -0,0 +1,133 @@
+"""
+Benchmark: recall@10 and latency of VectorSearcher against brute-force ground truth.
+
+Builds synthetic clustered embeddings in a scratch schema (vector_bench, which
+holds its own "invoices" table, so the production SQL runs unchanged), then
+queries globally, as a large tenant (tuned HNSW) and as a small tenant (exact scan).
+
+    DATABASE_URL=postgres://... python tests/bench_vector_search.py --sizes 10000 100000 1000000
+
+Needs pgvector and numpy; the 1M run holds the vectors in memory
+(~3 GB at 768 dims, use --dim 256 on smaller machines). Never run by pytest.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncpg
+import numpy as np
+from dotenv import load_dotenv
+
+from tools.search_tools.vector_search import VectorSearcher
+
+SCHEMA = "vector_bench"
+TENANTS = 500
+INSERT_CHUNK = 5000
+
+def synthetic_invoices(n: int, dim: int, seed: int = 7):
+    """ Clustered unit vectors (vendors/categories) with a skewed tenant distribution. """
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(max(n // 1000, 16), dim)).astype(np.float32)
+    vectors = centroids[rng.integers(len(centroids), size=n)] + 0.35 * rng.normal(size=(n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    weights = 1 / np.arange(1, TENANTS + 1) ** 1.1
+    users = rng.choice(TENANTS, size=n, p=weights / weights.sum())
+    return vectors, users
+
+def _vector_text(v) -> str:
+    return "[" + ",".join(f"{x:.6f}" for x in v) + "]"
+
+async def load(conn, vectors, users, dim: int):
+    await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+    await conn.execute(f"""
+        CREATE TABLE {SCHEMA}.invoices (
+            invoice_id UUID PRIMARY KEY, user_id VARCHAR(50), embedding vector({dim})
+        )
+    """)
+    ids = [uuid.uuid4() for _ in range(len(vectors))]
+    started = time.perf_counter()
+    for start in range(0, len(vectors), INSERT_CHUNK):
+        chunk = range(start, min(start + INSERT_CHUNK, len(vectors)))
+        await conn.execute(f"""
+            INSERT INTO {SCHEMA}.invoices (invoice_id, user_id, embedding)
+            SELECT id, u, e::vector FROM unnest($1::uuid[], $2::text[], $3::text[]) AS t(id, u, e)
+        """, ids[chunk.start:chunk.stop], [f"u{users[i]}" for i in chunk], [_vector_text(vectors[i]) for i in chunk])
+    load_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await conn.execute("SET maintenance_work_mem = '2GB'")
+    await conn.execute(f"CREATE INDEX ON {SCHEMA}.invoices USING hnsw (embedding vector_cosine_ops)")
+    await conn.execute(f"CREATE INDEX idx_invoices_user_embedded ON {SCHEMA}.invoices(user_id) WHERE embedding IS NOT NULL")
+    await conn.execute(f"ANALYZE {SCHEMA}.invoices")
+    return ids, load_s, time.perf_counter() - started
+
+def ground_truth(vectors, users, query, user: int = None, k: int = 10):
+    distances = 1 - vectors @ query
+    if user is not None:
+        distances = np.where(users == user, distances, np.inf)
+    top = np.argpartition(distances, k)[:k]
+    return set(top[np.argsort(distances[top])].tolist())
+
+async def run_case(conn, searcher, positions, vectors, users, queries, user, k=10):
+    recalls, latencies = [], []
+    for q in queries:
+        started = time.perf_counter()
+        rows = await searcher.search(conn, q.tolist(), f"u{user}" if user is not None else None, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        expected = ground_truth(vectors, users, q, user, k)
+        recalls.append(len({positions[r["invoice_id"]] for r in rows} & expected) / len(expected))
+    return float(np.mean(recalls)), float(np.percentile(latencies, 50)), float(np.percentile(latencies, 95))
+
+async def bench(size: int, dim: int, n_queries: int, ef_values, exact_threshold: int):
+    vectors, users = synthetic_invoices(size, dim)
+    conn = await asyncpg.connect(os.getenv("DATABASE_URL"), server_settings={"search_path": f"{SCHEMA},public"})
+    try:
+        ids, load_s, index_s = await load(conn, vectors, users, dim)
+        positions = {invoice_id: i for i, invoice_id in enumerate(ids)}
+        print(f"\n📦 {size:,} invoices × {dim} dims: load {load_s:.1f}s, index build {index_s:.1f}s")
+
+        rng = np.random.default_rng(11)
+        sample = vectors[rng.integers(size, size=n_queries)]
+        queries = sample + 0.1 * rng.normal(size=sample.shape).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        counts = np.bincount(users, minlength=TENANTS)
+        small = int(np.argmin(np.where(counts > 10, counts, np.iinfo(np.int64).max)))
+        cases = [("global", None), (f"large tenant ({counts[0]:,} rows)", 0), (f"small tenant ({counts[small]:,} rows)", small)]
+
+        print(f"{'case':<32}{'ef':>6}{'strategy':>16}{'recall@10':>11}{'p50 ms':>9}{'p95 ms':>9}")
+        for label, user in cases:
+            for ef in ef_values:
+                searcher = VectorSearcher(ef_search=ef, exact_threshold=exact_threshold)
+                recall, p50, p95 = await run_case(conn, searcher, positions, vectors, users, queries, user)
+                stats = searcher.get_stats()
+                strategy = max(("exact", "hnsw", "hnsw_iterative"), key=lambda s: stats[s])
+                print(f"{label:<32}{ef:>6}{strategy:>16}{recall:>11.3f}{p50:>9.2f}{p95:>9.2f}")
+                if strategy == "exact":
+                    break  # ef_search doesn't apply
+    finally:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Recall/latency benchmark for invoice vector search.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--ef", type=int, nargs="+", default=[40, 100, 200])
+    parser.add_argument("--exact-threshold", type=int, default=5000)
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        print("❌ DATABASE_URL not set")
+        sys.exit(1)
+    for size in args.sizes:
+        asyncio.run(bench(size, args.dim, args.queries, args.ef, args.exact_threshold))
+    print("\n✅ SUCCESS: Vector search benchmark complete.")
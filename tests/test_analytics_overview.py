@@ -0,0 +1,38 @@
+import asyncio
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api.analytics_api as analytics_api
+
+async def _echo(limit: int = 5, threshold_multiplier: float = 2.0, token: str = None):
+    return {"limit": limit, "threshold_multiplier": threshold_multiplier}
+
+def _overview(widgets):
+    original = analytics_api.OVERVIEW_WIDGETS
+    analytics_api.OVERVIEW_WIDGETS = {"echo": (_echo, {"limit", "threshold_multiplier"})}
+    try:
+        return asyncio.run(analytics_api.get_overview({"widgets": widgets}, token="t"))
+    finally:
+        analytics_api.OVERVIEW_WIDGETS = original
+
+def test_null_params_use_defaults():
+    response = _overview([{"id": "a", "type": "echo", "params": {"limit": None, "threshold_multiplier": "3"}}])
+    assert response["widgets"]["a"] == {"limit": 5, "threshold_multiplier": 3.0}
+    assert response["errors"] == {}
+
+def test_duplicate_ids_are_rejected():
+    response = _overview([
+        {"id": "dup", "type": "echo", "params": {"limit": 1}},
+        {"id": "dup", "type": "echo", "params": {"limit": 2}},
+        {"id": "ok", "type": "echo"}
+    ])
+    assert "dup" not in response["widgets"] and "Duplicate" in response["errors"]["dup"]
+    assert response["widgets"]["ok"]["limit"] == 5
+
+if __name__ == "__main__":
+    test_null_params_use_defaults()
+    test_duplicate_ids_are_rejected()
+    print("✅ SUCCESS: Overview ignores null params and rejects duplicate widget ids.")
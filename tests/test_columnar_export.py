@@ -0,0 +1,76 @@
+import asyncio
+import sys
+import os
+import tempfile
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+import tools.columnar_export as columnar
+from tools.columnar_export import plan_refresh, write_columnar
+from tools.export_tools import line_items_export_spec
+
+def _line_item(i):
+    return {
+        "line_item_id": uuid.uuid4(), "invoice_id": uuid.uuid4(), "invoice_date": date(2024, 5, 1 + i % 28),
+        "description": f"Item {i}", "quantity": Decimal("2.0000"), "unit_price": Decimal("10.5000"),
+        "tax": None, "line_total": Decimal("21.0000"), "created_at": datetime(2024, 5, 1, tzinfo=timezone.utc)
+    }
+
+def _write(rows, fmt, **kwargs):
+    async def iter_chunks(query, params=()):
+        for i in range(0, len(rows), 4):
+            yield rows[i:i + 4]
+
+    original = columnar.iter_chunks
+    columnar.iter_chunks = iter_chunks
+    path = os.path.join(tempfile.mkdtemp(), f"out.{fmt}")
+    try:
+        written = asyncio.run(write_columnar(line_items_export_spec(), path, fmt, **kwargs))
+    finally:
+        columnar.iter_chunks = original
+    return written, path
+
+def test_parquet_typed_columns_and_row_groups():
+    rows = [_line_item(i) for i in range(10)]
+    written, path = _write(rows, "parquet", row_group_rows=8)
+    assert written == 10
+
+    meta = pq.ParquetFile(path).metadata
+    assert meta.num_row_groups == 2
+    table = pq.read_table(path)
+    assert table.schema.field("invoice_id").type == pa.uuid()
+    assert table.schema.field("quantity").type == pa.decimal128(12, 4)
+    assert table.schema.field("invoice_date").type == pa.date32()
+    assert table.column("line_total")[0].as_py() == Decimal("21.0000")
+    assert table.column("tax").null_count == 10
+
+def test_arrow_ipc():
+    rows = [_line_item(i) for i in range(5)]
+    written, path = _write(rows, "arrow")
+    table = ipc.open_file(path).read_all()
+    assert written == 5 and table.num_rows == 5
+    assert table.column("description")[4].as_py() == "Item 4"
+
+def test_refresh_plan():
+    known = {"2024-01": {"invoices": 10}, "2024-02": {"invoices": 5}, "2023-12": {"invoices": 3}}
+    counts = {"2024-01": 10, "2024-02": 4, "2024-03": 7}
+    # 2024-01 had an update; 2024-02 lost a row; 2024-03 is new; 2023-12 is empty now
+    dirty, removed = plan_refresh(known, counts, changed={"2024-01"})
+    assert dirty == ["2024-01", "2024-02", "2024-03"]
+    assert removed == ["2023-12"]
+
+    assert plan_refresh(known={"2024-01": {"invoices": 10}}, counts={"2024-01": 10}, changed=set()) == ([], [])
+
+if __name__ == "__main__":
+    test_parquet_typed_columns_and_row_groups()
+    test_arrow_ipc()
+    test_refresh_plan()
+    print("✅ SUCCESS: Columnar exports are typed, chunked into row groups and refreshed incrementally.")
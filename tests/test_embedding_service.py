@@ -0,0 +1,96 @@
+import asyncio
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools.document_tools.embedding_service import EmbeddingService, local_embedding, text_key
+
+class CountingBackend:
+    """ Local model that records every batch it was called with. """
+
+    def __init__(self, delay=0.0, fail=False):
+        self.calls, self.delay, self.fail = [], delay, fail
+
+    async def __call__(self, texts):
+        self.calls.append(list(texts))
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("quota exceeded")
+        return [local_embedding(t) for t in texts]
+
+def test_local_model_is_deterministic():
+    a = local_embedding("Carrefour hypermarket receipt")
+    assert a == local_embedding("Carrefour hypermarket receipt")
+    assert len(a) == 768 and abs(sum(v * v for v in a) - 1) < 1e-9
+
+    def cos(x, y):
+        return sum(p * q for p, q in zip(x, y))
+    assert cos(a, local_embedding("carrefour receipt")) > cos(a, local_embedding("taxi fare dubai airport"))
+
+def test_cache_normalizes_text():
+    backend = CountingBackend()
+    service = EmbeddingService(backend=backend)
+    first = asyncio.run(service.embed("Office  supplies\n invoice"))
+    second = asyncio.run(service.embed("office supplies invoice"))
+    assert first == second and len(backend.calls) == 1
+    assert text_key("A  b") == text_key("a b")
+    assert service.get_stats()["hits"] == 1
+
+def test_batches_and_dedupes():
+    backend = CountingBackend()
+    service = EmbeddingService(backend=backend, batch_size=3)
+    texts = [f"invoice {i}" for i in range(7)] + ["invoice 0", ""]
+    vectors = asyncio.run(service.embed_many(texts))
+    assert [len(b) for b in backend.calls] == [3, 3, 1]
+    assert vectors[0] == vectors[7] and vectors[8] == []
+    assert all(len(v) == 768 for v in vectors[:8])
+
+def test_single_flight():
+    backend = CountingBackend(delay=0.05)
+    service = EmbeddingService(backend=backend)
+
+    async def run():
+        return await asyncio.gather(*(service.embed("monthly rent") for _ in range(5)))
+
+    vectors = asyncio.run(run())
+    assert len(backend.calls) == 1
+    assert all(v == vectors[0] for v in vectors)
+    assert service.get_stats()["coalesced"] == 4
+
+def test_failures_are_not_cached():
+    backend = CountingBackend(fail=True)
+    service = EmbeddingService(backend=backend)
+    assert asyncio.run(service.embed_many(["a", "b"])) == [[], []]
+    backend.fail = False
+    assert len(asyncio.run(service.embed("a"))) == 768
+    assert len(backend.calls) == 2 and service.get_stats()["errors"] == 1
+
+def test_cancelled_leader_releases_inflight():
+    backend = CountingBackend(delay=0.5)
+    service = EmbeddingService(backend=backend)
+
+    async def run():
+        leader = asyncio.create_task(service.embed("hello"))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(service.embed("hello"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        # Followers of a cancelled call get [] instead of hanging
+        assert await asyncio.wait_for(follower, 1) == []
+        assert service.get_stats()["inflight"] == 0
+
+        backend.delay = 0
+        return await asyncio.wait_for(service.embed("hello"), 1)
+
+    assert len(asyncio.run(run())) == 768
+
+if __name__ == "__main__":
+    test_local_model_is_deterministic()
+    test_cache_normalizes_text()
+    test_batches_and_dedupes()
+    test_single_flight()
+    test_failures_are_not_cached()
+    test_cancelled_leader_releases_inflight()
+    print("✅ SUCCESS: Embeddings are cached, batched and coalesced.")
@@ -0,0 +1,114 @@
+import asyncio
+import sys
+import os
+import tempfile
+import time
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import tools.export_jobs as export_jobs_module
+from tools.export_jobs import ExportJobManager
+from storage.response_cache import response_cache
+
+async def _fake_write_export(spec, file_path, fmt="xlsx", on_progress=None):
+    await asyncio.sleep(0.01)
+    with open(file_path, "w") as f:
+        f.write("data")
+    on_progress(3)
+    return 3
+
+async def _wait(manager, job_id):
+    while manager.get(job_id)["status"] in ("queued", "running"):
+        await asyncio.sleep(0.01)
+    return manager.get(job_id)
+
+def _run(coro_factory):
+    original = export_jobs_module.write_export
+    export_jobs_module.write_export = _fake_write_export
+    try:
+        return asyncio.run(coro_factory())
+    finally:
+        export_jobs_module.write_export = original
+
+def test_dedupe_and_completion():
+    async def main():
+        events = []
+        async def broadcast(message):
+            events.append(message["type"])
+
+        folder = tempfile.mkdtemp()
+        manager = ExportJobManager(workers=1, jobs_dir=folder)
+        manager.set_broadcaster(broadcast)
+
+        first = manager.create("invoices", "csv", {"start_date": "2024-01-01", "end_date": "", "include": "raw_text"})
+        # Same parameters in a different shape while the first is queued
+        second = manager.create("invoices", "csv", {"include": ["raw_text"], "start_date": "2024-01-01"})
+        assert first["job_id"] == second["job_id"]
+
+        job = await _wait(manager, first["job_id"])
+        assert job["status"] == "done" and job["rows_written"] == 3
+        assert os.path.exists(job["file_path"])
+        assert "export_ready" in events
+
+        # Finished artifact is reused until the data changes
+        assert manager.create("invoices", "csv", {"start_date": "2024-01-01", "include": "raw_text"})["job_id"] == job["job_id"]
+        response_cache.bump_data_version()
+        assert manager.create("invoices", "csv", {"start_date": "2024-01-01", "include": "raw_text"})["job_id"] != job["job_id"]
+        assert manager.stats["reused"] == 2
+        await manager.stop()
+
+    _run(main)
+
+def test_retention_eviction():
+    async def main():
+        folder = tempfile.mkdtemp()
+        manager = ExportJobManager(workers=1, max_artifacts=1, jobs_dir=folder, access_grace=60)
+        a = manager.create("employees", "csv")
+        await _wait(manager, a["job_id"])
+        b = manager.create("merchants", "csv")
+        await _wait(manager, b["job_id"])
+
+        # Over the cap, but a was just polled (a download may be streaming it)
+        assert manager.get(a["job_id"]) is not None
+        manager.jobs[a["job_id"]]["last_access"] = time.time() - 120
+        manager.evict()
+        # Only the most recently used artifact survives
+        assert manager.get(a["job_id"]) is None
+        kept = manager.get(b["job_id"])
+        assert os.path.exists(kept["file_path"])
+
+        manager.retention = 0
+        kept["finished_at"] = time.time() - 1
+        manager.evict()
+        assert manager.get(b["job_id"]) is not None
+        kept["last_access"] = time.time() - 120
+        manager.evict()
+        assert manager.get(b["job_id"]) is None
+        assert not os.path.exists(kept["file_path"])
+        await manager.stop()
+
+    _run(main)
+
+def test_sweep_only_touches_job_artifacts():
+    async def main():
+        folder = tempfile.mkdtemp()
+        orphan = os.path.join(folder, "0b6f1f9e-3c1a-4d2b-9f0e-5a7c8d9e0f1a_Invoices.csv")
+        other = os.path.join(folder, "whatsapp_report.xlsx")
+        for path in (orphan, other):
+            with open(path, "w") as f:
+                f.write("old")
+            os.utime(path, (time.time() - 10, time.time() - 10))
+
+        manager = ExportJobManager(workers=1, retention=1, jobs_dir=folder)
+        manager.evict()
+        assert not os.path.exists(orphan)
+        assert os.path.exists(other)
+
+    _run(main)
+
+if __name__ == "__main__":
+    test_dedupe_and_completion()
+    test_retention_eviction()
+    test_sweep_only_touches_job_artifacts()
+    print("✅ SUCCESS: Export jobs dedupe, report progress and evict old artifacts.")
@@ -0,0 +1,54 @@
+import sys
+import os
+import time
+import tempfile
+import hashlib
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools.document_tools.extraction_cache import ExtractionCache, hash_file
+
+def test_hit_miss_and_copy():
+    cache = ExtractionCache(max_entries=10, ttl=60)
+    assert cache.get("abc") is None
+
+    cache.put("abc", "CARREFOUR 12.50", {"vendor_name": "Carrefour", "total_amount": 12.5}, [0.1, 0.2])
+    hit = cache.get("abc")
+    assert hit["extraction"]["vendor_name"] == "Carrefour"
+    assert hit["embedding"] == [0.1, 0.2]
+
+    # Mutating a hit must not corrupt the cached entry
+    hit["extraction"]["vendor_name"] = "changed"
+    assert cache.get("abc")["extraction"]["vendor_name"] == "Carrefour"
+
+    stats = cache.get_stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1, stats
+
+def test_lru_and_ttl_eviction():
+    cache = ExtractionCache(max_entries=2, ttl=0.05)
+    cache.put("a", "a", {})
+    cache.put("b", "b", {})
+    cache.get("a")          # a is now most recently used
+    cache.put("c", "c", {})  # evicts b
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get_stats()["evictions"] == 1
+
+    time.sleep(0.1)
+    assert cache.get("c") is None
+    assert cache.get_stats()["expired"] == 1
+
+def test_hash_file():
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        f.write(b"%PDF-1.4 receipt")
+    try:
+        assert hash_file(f.name) == hashlib.sha256(b"%PDF-1.4 receipt").hexdigest()
+    finally:
+        os.unlink(f.name)
+
+if __name__ == "__main__":
+    test_hit_miss_and_copy()
+    test_lru_and_ttl_eviction()
+    test_hash_file()
+    print("✅ SUCCESS: Extraction cache works.")
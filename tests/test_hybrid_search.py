@@ -0,0 +1,71 @@
+import asyncio
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools.search_tools.hybrid_search import hybrid_search, reciprocal_rank_fusion
+
+def test_rrf_rewards_agreement():
+    fused = reciprocal_rank_fusion(
+        {"keyword": ["a", "b", "c"], "vector": ["c", "d", "a"]},
+        {"keyword": 1.0, "vector": 1.0},
+        k=60
+    )
+    order = [e["id"] for e in fused]
+    # Found by both sides beats found by one
+    assert order[:2] == ["a", "c"]
+    assert fused[0]["keyword_rank"] == 1 and fused[0]["vector_rank"] == 3
+    assert "vector_rank" not in fused[order.index("b")]
+
+def test_rrf_weights():
+    rankings = {"keyword": ["exact"], "vector": ["similar"]}
+    assert reciprocal_rank_fusion(rankings, {"keyword": 2.0, "vector": 1.0})[0]["id"] == "exact"
+    assert reciprocal_rank_fusion(rankings, {"keyword": 1.0, "vector": 2.0})[0]["id"] == "similar"
+
+class FakeConn:
+    """ Answers the keyword, vector and detail queries from canned rows. """
+
+    def __init__(self, keyword, vector):
+        self.keyword, self.vector, self.queries = keyword, vector, []
+
+    async def fetch(self, sql, *params):
+        self.queries.append(sql)
+        if "search_tsv @@" in sql:
+            return [{"invoice_id": i, "rank": 1.0} for i in self.keyword]
+        if "<=>" in sql:
+            return [{"invoice_id": i, "distance": 0.1 * n} for n, i in enumerate(self.vector)]
+        return [{"invoice_id": i, "vendor_name": f"Vendor {i}", "raw_text": None} for i in params[0]]
+
+    async def fetchval(self, sql, *params):
+        return 0  # tiny tenant: vector side takes the exact-scan path
+
+def test_hybrid_and_keyword_only():
+    conn = FakeConn(keyword=["inv-1"], vector=["inv-2", "inv-1"])
+    found = asyncio.run(hybrid_search(conn, "INV-2024-0042", [0.1] * 768, user_id="+971500000001"))
+    assert found["method"] == "hybrid_rrf"
+    assert [r["invoice_id"] for r in found["results"]] == ["inv-1", "inv-2"]
+    assert found["results"][0]["similarity"] > 0
+
+    # No embedding (API down): keyword side alone, no vector query issued
+    conn = FakeConn(keyword=["inv-1"], vector=["inv-2"])
+    found = asyncio.run(hybrid_search(conn, "INV-2024-0042", None))
+    assert found["method"] == "keyword"
+    assert [r["invoice_id"] for r in found["results"]] == ["inv-1"]
+    assert not any("<=>" in q for q in conn.queries)
+
+def test_keyword_side_matches_any_term():
+    conn = FakeConn(keyword=["inv-1"], vector=[])
+    found = asyncio.run(hybrid_search(conn, "coffee I bought last week", None))
+    assert [r["invoice_id"] for r in found["results"]] == ["inv-1"]
+    # Terms are ORed and ranked, not all required
+    keyword_sql = next(q for q in conn.queries if "search_tsv @@" in q)
+    assert "' | '" in keyword_sql and "websearch_to_tsquery" not in keyword_sql
+
+if __name__ == "__main__":
+    test_rrf_rewards_agreement()
+    test_rrf_weights()
+    test_hybrid_and_keyword_only()
+    test_keyword_side_matches_any_term()
+    print("✅ SUCCESS: Hybrid search fuses keyword and vector rankings.")
@@ -0,0 +1,98 @@
+import asyncio
+import sys
+import os
+import time
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import agent_orchestrator.ingest_queue as ingest_module
+from agent_orchestrator.keyed_scheduler import KeyedScheduler
+
+TIMEOUT = 0.1
+
+class FakeDB:
+    """ In-memory ingest_jobs evaluating the claim/start/complete statements. """
+
+    def __init__(self, jobs):
+        self.jobs = [{**j, "status": "queued", "attempts": 0, "locked_at": None, "claimed_by": None} for j in jobs]
+
+    async def connect(self, *args, **kwargs):
+        return FakeConn(self)
+
+class FakeConn:
+    def __init__(self, db):
+        self.db = db
+
+    async def close(self):
+        pass
+
+    async def fetchrow(self, sql, timeout, worker_id, busy=()):
+        # Whether the stale-lock branch skips this worker's own claims
+        spares_own = "j.claimed_by IS DISTINCT FROM $2" in sql
+        now = time.monotonic()
+
+        def stale(j):
+            return j["status"] == "running" and j["locked_at"] < now - timeout
+
+        for j in self.db.jobs:
+            claimable = j["status"] == "queued" or (stale(j) and not (spares_own and j["claimed_by"] == worker_id))
+            blocked = any(
+                e["user_phone"] == j["user_phone"] and e["created"] < j["created"]
+                and (e["status"] == "queued" or (e["status"] == "running" and e["claimed_by"] != worker_id and not stale(e)))
+                for e in self.db.jobs
+            )
+            if claimable and not blocked and j["user_phone"] not in busy:
+                j.update(status="running", attempts=j["attempts"] + 1, locked_at=now, claimed_by=worker_id)
+                return {k: j[k] for k in ("job_id", "message_id", "user_phone", "payload", "attempts")} | {"max_attempts": 5}
+        return None
+
+    async def execute(self, sql, job_id, *params):
+        job = next(j for j in self.db.jobs if j["job_id"] == job_id)
+        if "status = 'done'" in sql:
+            job["status"] = "done"
+        elif "SET locked_at = NOW()" in sql:
+            job["locked_at"] = time.monotonic()
+
+def test_jobs_waiting_for_a_slot_are_not_reclaimed():
+    async def main():
+        jobs = [
+            {"job_id": i, "message_id": f"m{i}", "user_phone": phone, "payload": {}, "created": i}
+            for i, phone in enumerate(["A", "A", "B", "C", "D"])
+        ]
+        db = FakeDB(jobs)
+        processed = []
+
+        async def process_job(job):
+            processed.append(job["job_id"])
+            # Each job is well inside the timeout, but the later ones wait
+            # longer than the timeout for the single scheduler slot
+            await asyncio.sleep(TIMEOUT * 0.6)
+
+        originals = (ingest_module.get_db_connection, ingest_module.agent_scheduler,
+                     ingest_module.INGEST_JOB_TIMEOUT, ingest_module.INGEST_POLL_INTERVAL)
+        ingest_module.get_db_connection = db.connect
+        ingest_module.agent_scheduler = KeyedScheduler(max_concurrency=1, idle_timeout=0.05)
+        ingest_module.INGEST_JOB_TIMEOUT, ingest_module.INGEST_POLL_INTERVAL = TIMEOUT, 0.01
+        try:
+            queue = ingest_module.IngestQueue()
+            queue.process_job = process_job
+            queue.start(concurrency=1)
+            deadline = time.monotonic() + 3
+            while any(j["status"] != "done" for j in db.jobs) and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            await queue.stop()
+        finally:
+            (ingest_module.get_db_connection, ingest_module.agent_scheduler,
+             ingest_module.INGEST_JOB_TIMEOUT, ingest_module.INGEST_POLL_INTERVAL) = originals
+
+        # Every message handled exactly once, in order per user
+        assert sorted(processed) == [0, 1, 2, 3, 4], processed
+        assert processed.index(0) < processed.index(1)
+        assert all(j["attempts"] == 1 for j in db.jobs)
+
+    asyncio.run(main())
+
+if __name__ == "__main__":
+    test_jobs_waiting_for_a_slot_are_not_reclaimed()
+    print("✅ SUCCESS: Claimed jobs waiting for a slot are never reclaimed by their own worker.")
@@ -0,0 +1,110 @@
+import asyncio
+import sys
+import os
+import uuid
+from contextlib import asynccontextmanager
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import storage.postgres_repository as repo
+
+class FakeConn:
+    """ One connection: records statements and whether the transaction committed. """
+
+    def __init__(self, fail_copy=False):
+        self.hashes, self.audit, self.copied, self.inserts, self.fail_copy = {}, [], [], [], fail_copy
+        self.committed = self.rolled_back = 0
+
+    @asynccontextmanager
+    async def _tx(self):
+        try:
+            yield
+        except Exception:
+            self.rolled_back += 1
+            raise
+        self.committed += 1
+
+    def transaction(self):
+        return self._tx()
+
+    async def fetchval(self, sql, *params):
+        if "FROM vendor_aliases" in sql:
+            return "vendor-1"
+        if "INSERT INTO invoices" in sql:
+            self.inserts.append(params)
+            if params[11] in self.hashes:  # ON CONFLICT (file_hash) DO NOTHING
+                return None
+            self.hashes[params[11]] = uuid.uuid4()
+            return self.hashes[params[11]]
+        if "WHERE file_hash" in sql:
+            return self.hashes.get(params[0])
+
+    async def execute(self, sql, *params):
+        assert "activity_audit_log" in sql
+        self.audit.append(params)
+
+    async def copy_records_to_table(self, table, records, columns):
+        if self.fail_copy:
+            raise ValueError("invalid input syntax for type numeric")
+        self.copied.append((table, list(records), columns))
+
+INVOICE = {
+    "vendor_name": "Carrefour", "total_amount": 105.0, "invoice_date": "2024-05-01",
+    "line_items": [{"description": "Water", "quantity": 2, "unit_price": "2.50", "line_total": 5}]
+}
+
+def _no_second_connection():
+    async def refuse(*args, **kwargs):
+        raise AssertionError("opened a second connection")
+    repo.get_db_connection = refuse
+
+def test_single_connection_and_duplicate():
+    original = repo.get_db_connection
+    _no_second_connection()
+    try:
+        conn = FakeConn()
+        first = asyncio.run(repo.persist_invoice_intelligence("+971500000001", INVOICE, conn=conn))
+        assert first and conn.committed == 1
+        assert len(conn.audit) == 1 and conn.audit[0][3] == first
+        table, records, columns = conn.copied[0]
+        assert table == "invoice_line_items" and columns[0] == "invoice_id" and len(records) == 1
+
+        again = asyncio.run(repo.persist_invoice_intelligence("+971500000001", INVOICE, conn=conn))
+        assert again == first
+        assert len(conn.audit) == 1 and len(conn.copied) == 1
+    finally:
+        repo.get_db_connection = original
+
+def test_failure_rolls_back_audit_with_invoice():
+    original = repo.get_db_connection
+    _no_second_connection()
+    try:
+        conn = FakeConn(fail_copy=True)
+        try:
+            asyncio.run(repo.persist_invoice_intelligence("+971500000001", INVOICE, conn=conn))
+            assert False, "caller-owned connection should see the error"
+        except ValueError:
+            pass
+        # The audit row was written inside the transaction that rolled back
+        assert conn.rolled_back == 1 and conn.committed == 0 and len(conn.audit) == 1
+    finally:
+        repo.get_db_connection = original
+
+def test_extraction_meta_is_stored():
+    original = repo.get_db_connection
+    _no_second_connection()
+    try:
+        conn = FakeConn()
+        pages = [{"page": 0, "method": "text_layer", "chars": 812}, {"page": 1, "method": "ocr", "chars": 3}]
+        invoice = {**INVOICE, "extraction_meta": {"source": "ocr", "pages": pages}}
+        asyncio.run(repo.persist_invoice_intelligence("+971500000001", invoice, conn=conn))
+        assert '"method": "text_layer"' in conn.inserts[0][19]
+    finally:
+        repo.get_db_connection = original
+
+if __name__ == "__main__":
+    test_single_connection_and_duplicate()
+    test_failure_rolls_back_audit_with_invoice()
+    test_extraction_meta_is_stored()
+    print("✅ SUCCESS: Invoice, audit row and line items persist on one connection.")
@@ -0,0 +1,53 @@
+import asyncio
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from storage.invoice_repository import HEAVY_FIELDS, PROJECTIONS, load_heavy, projection_columns, select_sql
+
+def test_projections_never_carry_heavy_columns():
+    for name in PROJECTIONS:
+        sql = select_sql(name)
+        assert "raw_text" not in sql and "embedding" not in sql and "i.*" not in sql, name
+
+def test_include_heavy_on_request():
+    columns = projection_columns("summary", include=["raw_text", "raw_text"])
+    assert columns[-1] == "i.raw_text AS raw_text"
+    assert sum("raw_text" in c for c in columns) == 1
+    for bad in (lambda: projection_columns("everything"), lambda: projection_columns("detail", ["search_tsv"])):
+        try:
+            bad()
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+
+def test_export_projection_matches_arrow_schema():
+    from tools.columnar_export import ARROW_SCHEMAS
+    from tools.export_tools import INVOICE_EXPORT_COLUMNS, column_name
+    names = [column_name(c) for c in INVOICE_EXPORT_COLUMNS]
+    assert names == PROJECTIONS["export"]
+    assert set(names) <= set(ARROW_SCHEMAS["invoices"])
+
+class FakeConn:
+    def __init__(self):
+        self.sql = None
+
+    async def fetchrow(self, sql, *params):
+        self.sql = sql
+        return {"raw_text": "TAX INVOICE ..."}
+
+def test_load_heavy_is_a_separate_narrow_query():
+    conn = FakeConn()
+    assert asyncio.run(load_heavy(conn, "inv-1")) == {"raw_text": "TAX INVOICE ..."}
+    assert conn.sql.startswith("SELECT i.raw_text AS raw_text FROM invoices")
+    assert asyncio.run(load_heavy(conn, "inv-1", [])) == {}
+    assert set(HEAVY_FIELDS) == {"raw_text", "embedding"}
+
+if __name__ == "__main__":
+    test_projections_never_carry_heavy_columns()
+    test_include_heavy_on_request()
+    test_export_projection_matches_arrow_schema()
+    test_load_heavy_is_a_separate_narrow_query()
+    print("✅ SUCCESS: Invoice reads go through slim named projections.")
@@ -0,0 +1,84 @@
+import asyncio
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agent_orchestrator.keyed_scheduler import KeyedScheduler
+
+async def _fifo_per_key():
+    scheduler = KeyedScheduler(max_concurrency=4, idle_timeout=0.05)
+    order = []
+
+    async def handle(user, n, delay):
+        await asyncio.sleep(delay)
+        order.append((user, n))
+
+    # The first message for user A is slow; the second must still finish after it
+    futures = [
+        scheduler.submit("A", handle, "A", 1, 0.05),
+        scheduler.submit("A", handle, "A", 2, 0),
+        scheduler.submit("B", handle, "B", 1, 0),
+    ]
+    await asyncio.gather(*futures)
+
+    a_order = [n for user, n in order if user == "A"]
+    assert a_order == [1, 2], a_order
+    # B is not blocked behind A's slow message
+    assert order.index(("B", 1)) < order.index(("A", 1))
+
+    # Idle lanes are reclaimed
+    await asyncio.sleep(0.2)
+    assert scheduler.get_stats()["active_lanes"] == 0
+
+async def _global_limit():
+    scheduler = KeyedScheduler(max_concurrency=2, idle_timeout=0.05)
+    running = 0
+    peak = 0
+
+    async def handle():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+
+    await asyncio.gather(*[scheduler.submit(f"user_{i}", handle) for i in range(6)])
+    assert peak == 2, peak
+    await scheduler.shutdown()
+
+async def _errors_propagate():
+    scheduler = KeyedScheduler(max_concurrency=1, idle_timeout=0.05)
+
+    async def boom():
+        raise ValueError("bad invoice")
+
+    async def ok():
+        return "next"
+
+    failed = scheduler.submit("A", boom)
+    following = scheduler.submit("A", ok)
+    try:
+        await failed
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    # A failure must not wedge the user's lane
+    assert await following == "next"
+    await scheduler.shutdown()
+
+def test_fifo_per_key():
+    asyncio.run(_fifo_per_key())
+
+def test_global_limit():
+    asyncio.run(_global_limit())
+
+def test_errors_propagate():
+    asyncio.run(_errors_propagate())
+
+if __name__ == "__main__":
+    test_fifo_per_key()
+    test_global_limit()
+    test_errors_propagate()
+    print("✅ SUCCESS: Keyed scheduler keeps per-user order.")
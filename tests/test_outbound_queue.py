@@ -0,0 +1,106 @@
+import asyncio
+import sys
+import os
+import time
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools.messaging_tools.outbound_queue import OutboundQueue, TokenBucket
+
+async def _coalesces_per_recipient():
+    sent = []
+
+    async def sender(recipient, text):
+        sent.append((recipient, text))
+        return 200
+
+    queue = OutboundQueue(sender=sender, coalesce_window=0.05)
+    futures = [
+        queue.enqueue("971500000001", "✅ Invoice from Carrefour received and processed."),
+        queue.enqueue("971500000001", "❌ Invoice from Carrefour was REJECTED."),
+        queue.enqueue("971500000002", "🔔 Payment Reminder"),
+    ]
+    assert all(await asyncio.gather(*futures))
+
+    by_recipient = {r: t for r, t in sent}
+    assert len(sent) == 2, sent
+    assert "received" in by_recipient["971500000001"] and "REJECTED" in by_recipient["971500000001"]
+    stats = queue.get_stats()
+    assert stats["delivered"] == 3 and stats["coalesced"] == 1 and stats["depth"] == 0, stats
+    await queue.stop()
+
+async def _retries_then_drops():
+    responses = {"retry": [429, 503, 200], "bad": [400]}
+    calls = []
+
+    async def sender(recipient, text):
+        calls.append(recipient)
+        return responses[recipient].pop(0)
+
+    queue = OutboundQueue(sender=sender, coalesce_window=0, backoff_base=0.01)
+    ok = queue.enqueue("retry", "hello")
+    bad = queue.enqueue("bad", "hello")
+    assert await ok is True
+    assert await bad is False
+
+    stats = queue.get_stats()
+    assert calls.count("retry") == 3 and calls.count("bad") == 1, calls
+    assert stats["retries"] == 2 and stats["dropped"] == 1, stats
+    await queue.stop()
+
+async def _token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50, capacity=5)
+    started = time.monotonic()
+    for _ in range(10):
+        await bucket.acquire()
+    # 5 from the burst, the other 5 at 50/s
+    assert time.monotonic() - started >= 0.08
+
+async def _immediate_replies_keep_order():
+    sent = []
+
+    async def sender(recipient, text):
+        await asyncio.sleep(0.02)
+        sent.append(text)
+        return 200
+
+    queue = OutboundQueue(sender=sender, coalesce_window=5)
+    started = time.monotonic()
+    received = queue.enqueue("971500000001", "✅ Invoice received")
+    # An interactive reply doesn't wait out the window, and can't overtake the notification
+    assert await queue.enqueue("971500000001", "Your total is 105 AED", immediate=True) is True
+    assert await received is True
+    assert time.monotonic() - started < 1
+    assert sent == ["✅ Invoice received\n\nYour total is 105 AED"], sent
+
+    # A reply sent while an earlier batch is in flight goes out after it
+    first = queue.enqueue("971500000001", "one", immediate=True)
+    second = queue.enqueue("971500000001", "two", immediate=True)
+    await asyncio.gather(first, second)
+    assert sent[1:] == ["one", "two"], sent
+
+    # drain() pushes out a coalescing text and waits for it
+    queue.enqueue("971500000001", "before the document")
+    await queue.drain("971500000001")
+    assert sent[-1] == "before the document" and queue.get_stats()["depth"] == 0
+    await queue.stop()
+
+def test_coalesces_per_recipient():
+    asyncio.run(_coalesces_per_recipient())
+
+def test_retries_then_drops():
+    asyncio.run(_retries_then_drops())
+
+def test_immediate_replies_keep_order():
+    asyncio.run(_immediate_replies_keep_order())
+
+def test_token_bucket_limits_rate():
+    asyncio.run(_token_bucket_limits_rate())
+
+if __name__ == "__main__":
+    test_coalesces_per_recipient()
+    test_retries_then_drops()
+    test_immediate_replies_keep_order()
+    test_token_bucket_limits_rate()
+    print("✅ SUCCESS: Outbound queue rate-limits, retries and coalesces.")
@@ -0,0 +1,88 @@
+import asyncio
+import sys
+import os
+import uuid
+from datetime import date
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from storage.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_page, select_fields
+
+FIELDS = {"invoice_id": "i.invoice_id", "invoice_date": "i.invoice_date", "vendor_name": "i.vendor_name"}
+
+def _order(row):
+    """ invoice_date DESC NULLS LAST, invoice_id DESC (as a reverse sort key) """
+    return (row["invoice_date"] is not None, row["invoice_date"] or date.min, row["invoice_id"])
+
+class FakeConn:
+    """ Evaluates the three keyset query shapes over in-memory (invoice_date, invoice_id) rows. """
+
+    def __init__(self, rows):
+        self.rows, self.queries = rows, []
+
+    async def fetch(self, sql, *params):
+        self.queries.append(sql)
+        limit, rows = params[-1], self.rows
+        if ") < (" in sql:
+            after = (params[0], params[1])
+            rows = [r for r in rows if r["invoice_date"] is not None and (r["invoice_date"], r["invoice_id"]) < after]
+        elif "IS NULL" in sql:
+            rows = [r for r in rows if r["invoice_date"] is None]
+            if "i.invoice_id <" in sql:
+                rows = [r for r in rows if r["invoice_id"] < params[0]]
+        return sorted(rows, key=_order, reverse=True)[:limit]
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(date(2024, 5, 1), "abc")
+    assert decode_cursor(cursor) == (date(2024, 5, 1), "abc")
+    assert decode_cursor(encode_cursor(None, "x")) == (None, "x")
+    for bad in ("not-a-cursor", encode_cursor(1, 2)[:-3]):
+        try:
+            decode_cursor(bad)
+            assert False, "expected InvalidCursor"
+        except InvalidCursor:
+            pass
+
+def test_select_fields():
+    assert select_fields(None, FIELDS, ["vendor_name"], required=["invoice_id"]) == [
+        "i.invoice_id AS invoice_id", "i.vendor_name AS vendor_name"
+    ]
+    try:
+        select_fields("vendor_name,embedding", FIELDS, [])
+        assert False, "expected ValueError"
+    except ValueError as e:
+        assert "embedding" in str(e)
+
+def test_walks_every_row_once():
+    days = [date(2024, 1, 1 + i % 4) for i in range(9)] + [None, None, None]
+    rows = [{"invoice_id": str(uuid.uuid4()), "invoice_date": d} for d in days]
+    conn = FakeConn(rows)
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = asyncio.run(keyset_page(
+            conn, ["i.invoice_id AS invoice_id"], "invoices i", [], [],
+            sort_expr="i.invoice_date", id_expr="i.invoice_id", sort_key="invoice_date", id_key="invoice_id",
+            page_size=5, cursor=cursor
+        ))
+        seen += page["items"]
+        pages += 1
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert pages == 3 and len(seen) == 12
+    assert [r["invoice_id"] for r in seen] == [r["invoice_id"] for r in sorted(rows, key=_order, reverse=True)]
+    # Undated invoices come last
+    assert all(r["invoice_date"] is None for r in seen[-3:])
+    # Every query sorting on invoice_date matches the index order (DESC NULLS LAST)
+    for sql in conn.queries:
+        order_by = sql.split("ORDER BY")[1]
+        assert "i.invoice_date" not in order_by or "i.invoice_date DESC NULLS LAST" in order_by
+
+if __name__ == "__main__":
+    test_cursor_round_trip()
+    test_select_fields()
+    test_walks_every_row_once()
+    print("✅ SUCCESS: Keyset pagination walks every invoice exactly once.")
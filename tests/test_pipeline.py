@@ -0,0 +1,71 @@
+import asyncio
+import sys
+import os
+import time
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agent_orchestrator.pipeline import Pipeline, PipelineMetrics
+
+async def _independent_stages_overlap():
+    metrics = PipelineMetrics()
+    pipeline = Pipeline("test", metrics)
+
+    async def slow(r):
+        await asyncio.sleep(0.1)
+        return "ok"
+
+    async def combine(r):
+        return (r["embed"], r["upload"])
+
+    pipeline.stage("embed", slow)
+    pipeline.stage("upload", slow)
+    pipeline.stage("persist", combine, after=["embed", "upload"])
+
+    started = time.monotonic()
+    results = await pipeline.run()
+    # embed and upload ran concurrently, not back to back
+    assert time.monotonic() - started < 0.18
+    assert results["persist"] == ("ok", "ok")
+    assert metrics.get_stats()["test.persist"]["count"] == 1
+
+async def _deferred_stages_do_not_block():
+    metrics = PipelineMetrics()
+    pipeline = Pipeline("test", metrics)
+    done = asyncio.Event()
+
+    async def persist(r):
+        return "invoice-1"
+
+    async def sheets(r):
+        await asyncio.sleep(0.1)
+        done.set()
+
+    async def broken(r):
+        raise RuntimeError("sheets api down")
+
+    pipeline.stage("persist", persist)
+    pipeline.stage("sheets", sheets, after=["persist"], deferred=True)
+    pipeline.stage("broken", broken, after=["persist"], deferred=True)
+
+    started = time.monotonic()
+    await pipeline.run()
+    assert time.monotonic() - started < 0.05
+    assert not done.is_set()
+
+    # Deferred work still completes, and its failure does not propagate
+    await asyncio.wait_for(done.wait(), timeout=1)
+    await asyncio.sleep(0)
+    assert "test.total" in metrics.get_stats()
+
+def test_independent_stages_overlap():
+    asyncio.run(_independent_stages_overlap())
+
+def test_deferred_stages_do_not_block():
+    asyncio.run(_deferred_stages_do_not_block())
+
+if __name__ == "__main__":
+    test_independent_stages_overlap()
+    test_deferred_stages_do_not_block()
+    print("✅ SUCCESS: Pipeline runs independent stages concurrently.")
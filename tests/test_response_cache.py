@@ -0,0 +1,47 @@
+import sys
+import os
+import time
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from storage.response_cache import ResponseCache
+
+def test_key_normalization():
+    # Parameter order and the caller's token don't change the key
+    a = ResponseCache.make_key("analytics.spend-trends", {"start_date": "2024-01-01", "period": "daily", "token": "x"})
+    b = ResponseCache.make_key("analytics.spend-trends", {"period": "daily", "start_date": "2024-01-01", "token": "y"})
+    assert a == b
+    assert a != ResponseCache.make_key("analytics.spend-trends", {"period": "weekly", "start_date": "2024-01-01"})
+
+def test_version_bump_invalidates():
+    cache = ResponseCache(ttl=60)
+    entry = cache.put("k", {"total": 1}, b'{"total":1}', cache.data_version)
+    assert cache.get("k")["etag"] == entry["etag"]
+
+    cache.bump_data_version()
+    assert cache.get("k") is None
+    assert cache.get_stats()["entries"] == 0
+
+def test_write_during_compute_is_not_cached():
+    cache = ResponseCache(ttl=60)
+    version = cache.data_version
+    cache.bump_data_version()  # an invoice write lands while the query runs
+    cache.put("k", {"total": 1}, b'{"total":1}', version)
+    assert cache.get("k") is None
+
+def test_ttl_and_strong_etag():
+    cache = ResponseCache(ttl=0.05)
+    first = cache.put("k", {"total": 1}, b'{"total":1}', 0)
+    same = cache.put("k2", {"total": 1}, b'{"total":1}', 0)
+    assert first["etag"] == same["etag"] and first["etag"].startswith('"')
+
+    time.sleep(0.1)
+    assert cache.get("k") is None
+
+if __name__ == "__main__":
+    test_key_normalization()
+    test_version_bump_invalidates()
+    test_write_during_compute_is_not_cached()
+    test_ttl_and_strong_etag()
+    print("✅ SUCCESS: Response cache keys, versions and expires entries.")
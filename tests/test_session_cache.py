@@ -0,0 +1,48 @@
+import sys
+import os
+import time
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from storage.session_cache import SessionCache
+
+def test_hit_rate_and_ttl():
+    cache = SessionCache(ttl=0.05)
+    assert cache.get("tok") is None
+    cache.put("tok", "971500000001")
+    assert cache.get("tok") == "971500000001"
+    assert cache.get_stats()["hit_rate"] == 0.5
+
+    time.sleep(0.1)
+    assert cache.get("tok") is None
+
+def test_invalidation():
+    cache = SessionCache(ttl=60)
+    cache.put("a1", "admin-1")
+    cache.put("a2", "admin-1")
+    cache.put("b1", "admin-2")
+
+    # Logout
+    cache.invalidate_token("b1")
+    assert cache.get("b1") is None
+
+    # User deleted / role changed: every token of that user goes
+    cache.invalidate_user("admin-1")
+    assert cache.get("a1") is None and cache.get("a2") is None
+    assert cache.get_stats()["invalidations"] == 3
+
+def test_lru_bound():
+    cache = SessionCache(ttl=60, max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+
+if __name__ == "__main__":
+    test_hit_rate_and_ttl()
+    test_invalidation()
+    test_lru_bound()
+    print("✅ SUCCESS: Session cache validates and invalidates tokens.")
@@ -0,0 +1,70 @@
+import asyncio
+import sys
+import os
+from contextlib import asynccontextmanager
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools.search_tools.vector_search import VectorSearcher, tenant_index_name
+
+class FakeConn:
+    """ Records statements; reports a fixed pgvector version and tenant size. """
+
+    def __init__(self, version="0.8.0", user_rows=10):
+        self.version, self.user_rows = version, user_rows
+        self.executed, self.fetched, self.in_tx = [], [], False
+
+    async def fetchval(self, sql, *params):
+        return self.version if "pg_extension" in sql else self.user_rows
+
+    async def execute(self, sql, *params):
+        assert self.in_tx, "settings must be SET LOCAL inside a transaction"
+        self.executed.append((sql, params))
+
+    async def fetch(self, sql, *params):
+        self.fetched.append(sql)
+        return [{"invoice_id": "inv-1", "distance": 0.2}]
+
+    @asynccontextmanager
+    async def _tx(self):
+        self.in_tx = True
+        yield
+        self.in_tx = False
+
+    def transaction(self):
+        return self._tx()
+
+def test_small_tenant_uses_exact_scan():
+    conn, searcher = FakeConn(user_rows=40), VectorSearcher(exact_threshold=100)
+    rows = asyncio.run(searcher.search(conn, [0.1] * 768, user_id="u1", limit=10))
+    assert rows == [{"invoice_id": "inv-1", "distance": 0.2}]
+    assert "AS MATERIALIZED" in conn.fetched[0] and not conn.executed
+    assert searcher.get_stats()["exact"] == 1
+
+def test_large_tenant_tunes_hnsw():
+    conn, searcher = FakeConn(user_rows=50_000), VectorSearcher(exact_threshold=100, ef_search=5)
+    asyncio.run(searcher.search(conn, [0.1] * 768, user_id="u1", limit=20))
+    settings = {sql.split("'")[1]: params[0] for sql, params in conn.executed if params}
+    # ef_search is never below the requested limit
+    assert settings["hnsw.ef_search"] == "20"
+    assert settings["hnsw.iterative_scan"] == "relaxed_order"
+    assert any("force_custom_plan" in sql for sql, _ in conn.executed)
+    assert searcher.get_stats()["hnsw_iterative"] == 1
+
+def test_old_pgvector_skips_iterative_scan():
+    conn, searcher = FakeConn(version="0.7.4", user_rows=50_000), VectorSearcher(exact_threshold=100)
+    asyncio.run(searcher.search(conn, [0.1] * 768, user_id="u1", limit=10))
+    assert not any("hnsw.iterative_scan" in sql for sql, _ in conn.executed)
+    assert searcher.get_stats()["hnsw"] == 1
+
+def test_tenant_index_name_is_safe_identifier():
+    name = tenant_index_name("+971 50'; DROP TABLE invoices;--")
+    assert name.replace("_", "").isalnum() and len(name) < 63
+
+if __name__ == "__main__":
+    test_small_tenant_uses_exact_scan()
+    test_large_tenant_tunes_hnsw()
+    test_old_pgvector_skips_iterative_scan()
+    test_tenant_index_name_is_safe_identifier()
+    print("✅ SUCCESS: Vector search picks exact or tuned HNSW scans per tenant.")
@@ -0,0 +1,74 @@
+import asyncio
+import sys
+import os
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from storage.vendor_registry import VendorRegistry, choose_match, core_name, normalize_vendor_name
+
+def test_normalization():
+    assert normalize_vendor_name("CARREFOUR L.L.C.") == "carrefour"
+    assert normalize_vendor_name("  Carrefour   LLC ") == "carrefour"
+    assert normalize_vendor_name("The Noodle House FZ-LLC") == "noodle house"
+    assert normalize_vendor_name("Marks & Spencer") == "marks and spencer"
+    # A legal suffix alone is still a name
+    assert normalize_vendor_name("LLC") == "llc"
+    assert normalize_vendor_name(None) == ""
+    assert core_name("carrefour hypermarket") == "carrefour"
+
+def test_choose_match():
+    candidates = [
+        {"vendor_id": "v-emirates", "alias_normalized": "emirates", "score": 0.45},
+        {"vendor_id": "v-carrefour", "alias_normalized": "carrefour", "score": 0.45},
+    ]
+    assert choose_match("carrefour hypermarket", candidates) == "v-carrefour"
+    # Same brand prefix but a different business: below threshold, no merge
+    assert choose_match("emirates airline", candidates) is None
+    assert choose_match("carrefur", [{"vendor_id": "v1", "alias_normalized": "carrefour", "score": 0.7}]) == "v1"
+
+class FakeConn:
+    """ In-memory vendors/aliases; fuzzy candidates are every alias (scored 0.4). """
+
+    def __init__(self):
+        self.vendors, self.aliases, self.calls = {}, {}, 0
+
+    async def fetchval(self, sql, *params):
+        self.calls += 1
+        if "FROM vendor_aliases WHERE alias_normalized" in sql:
+            return self.aliases.get(params[0])
+        if "INSERT INTO vendors" in sql:
+            return self.vendors.setdefault(params[1], f"v-{params[1]}")
+        if "INSERT INTO vendor_aliases" in sql:
+            return self.aliases.setdefault(params[0], params[1])
+
+    async def fetch(self, sql, *params):
+        self.calls += 1
+        return [{"vendor_id": v, "alias_normalized": a, "score": 0.4} for a, v in self.aliases.items()]
+
+def test_resolve_merges_variants():
+    conn, registry = FakeConn(), VendorRegistry()
+
+    async def run():
+        first = await registry.resolve(conn, "Carrefour")
+        second = await registry.resolve(conn, "CARREFOUR LLC")
+        third = await registry.resolve(conn, "Carrefour Hypermarket")
+        other = await registry.resolve(conn, "Lulu Hypermarket")
+        return first, second, third, other
+
+    first, second, third, other = asyncio.run(run())
+    assert first == second == third == "v-carrefour"
+    assert other == "v-lulu hypermarket"
+    assert set(conn.aliases) == {"carrefour", "carrefour hypermarket", "lulu hypermarket"}
+    assert registry.get_stats()["created"] == 2 and registry.get_stats()["fuzzy_matches"] == 1
+
+    # Known spelling: served from the cache without touching the database
+    calls = conn.calls
+    assert asyncio.run(registry.resolve(conn, "carrefour")) == "v-carrefour"
+    assert conn.calls == calls
+
+if __name__ == "__main__":
+    test_normalization()
+    test_choose_match()
+    test_resolve_merges_variants()
+    print("✅ SUCCESS: Vendor names resolve to canonical vendors.")
@@ -0,0 +1,59 @@
+import asyncio
+import os
+import sys
+
+# Add root to path for imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from dotenv import load_dotenv
+from storage.postgres_repository import get_db_connection, close_db_pool
+from storage.vendor_registry import vendor_registry
+
+async def backfill():
+    """ Links existing invoices and purchase orders to canonical vendors (migration 019). """
+    conn = await get_db_connection()
+    if not conn:
+        print("❌ Could not connect to database.")
+        return False
+    try:
+        names = [r["vendor_name"] for r in await conn.fetch("""
+            SELECT vendor_name FROM invoices WHERE vendor_id IS NULL AND vendor_name IS NOT NULL
+            UNION
+            SELECT vendor_name FROM purchase_orders WHERE vendor_id IS NULL AND vendor_name IS NOT NULL
+        """)]
+        print(f"📊 Found {len(names)} unlinked vendor spellings.")
+
+        for i, name in enumerate(names, start=1):
+            async with conn.transaction():
+                vendor_id = await vendor_registry.resolve(conn, name)
+                if not vendor_id:
+                    continue
+                await conn.execute(
+                    "UPDATE invoices SET vendor_id = $1 WHERE vendor_name = $2 AND vendor_id IS NULL", vendor_id, name
+                )
+                await conn.execute(
+                    "UPDATE purchase_orders SET vendor_id = $1 WHERE vendor_name = $2 AND vendor_id IS NULL", vendor_id, name
+                )
+            if i % 100 == 0:
+                print(f"🔄 {i}/{len(names)} linked")
+
+        vendors = await conn.fetchval("SELECT COUNT(*) FROM vendors")
+        print(f"✅ Linked {len(names)} spellings to {vendors} vendors ({vendor_registry.get_stats()})")
+
+        # Merchant analytics group the rollup by vendor_id; rebuild it so it
+        # reflects the new links in one consistent pass
+        async with conn.transaction():
+            rows = await conn.fetchval("SELECT rebuild_daily_spend_rollup()")
+        print(f"✅ Rebuilt daily_spend_rollup: {rows} row(s)")
+        return True
+    except Exception as e:
+        print(f"❌ Vendor backfill failed: {e}")
+        return False
+    finally:
+        await conn.close()
+        await close_db_pool()
+
+if __name__ == "__main__":
+    load_dotenv()
+    if not asyncio.run(backfill()):
+        sys.exit(1)
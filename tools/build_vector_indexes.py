@@ -0,0 +1,39 @@
+import argparse
+import asyncio
+import os
+import sys
+
+# Add root to path for imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from dotenv import load_dotenv
+from storage.postgres_repository import get_db_connection, close_db_pool
+
+async def build(min_rows: int = None, drop_stale: bool = True):
+    """ Creates/drops per-tenant partial HNSW indexes according to each user's invoice count. """
+    from tools.search_tools.vector_search import VECTOR_TENANT_INDEX_MIN_ROWS, build_tenant_indexes
+
+    conn = await get_db_connection()
+    if not conn:
+        print("❌ Could not connect to database.")
+        return False
+    try:
+        summary = await build_tenant_indexes(conn, min_rows or VECTOR_TENANT_INDEX_MIN_ROWS, drop_stale=drop_stale)
+        print(f"✅ Tenant vector indexes: {len(summary['created'])} created, {len(summary['dropped'])} dropped")
+        return True
+    except Exception as e:
+        print(f"❌ Building tenant vector indexes failed: {e}")
+        return False
+    finally:
+        await conn.close()
+        await close_db_pool()
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Maintain per-tenant partial HNSW indexes on invoices.embedding.")
+    parser.add_argument("--min-rows", type=int, help="Embedded invoices a user needs for a dedicated index")
+    parser.add_argument("--keep-stale", action="store_true", help="Don't drop indexes of users that shrank")
+    args = parser.parse_args()
+
+    if not asyncio.run(build(args.min_rows, drop_stale=not args.keep_stale)):
+        sys.exit(1)
@@ -0,0 +1,336 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from storage.postgres_repository import get_db_connection
+from tools.export_tools import EXPORT_DIR, INVOICE_EXPORT_COLUMNS, LINE_ITEM_EXPORT_COLUMNS, column_name, iter_chunks
+
+logger = logging.getLogger(__name__)
+
+# snappy is fastest to read back; zstd is ~30% smaller. Arrow IPC only supports zstd/lz4.
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+PARQUET_ROW_GROUP_ROWS = int(os.getenv("PARQUET_ROW_GROUP_ROWS", 100_000))
+ARROW_IPC_COMPRESSION = os.getenv("ARROW_IPC_COMPRESSION", "zstd")
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(EXPORT_DIR, "snapshot"))
+# Rows committed by transactions that started before a refresh can carry an
+# older updated_at; re-reading this much history each refresh picks them up.
+SNAPSHOT_WATERMARK_LAG_SECONDS = int(os.getenv("SNAPSHOT_WATERMARK_LAG_SECONDS", 300))
+SNAPSHOT_FORMAT_VERSION = 1
+# Hive convention, understood by pyarrow.dataset, DuckDB and Spark
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# pyarrow's uuid extension type is written as the Parquet UUID logical type
+UUID = pa.uuid()
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+
+# Postgres column -> Arrow type, per exported table
+ARROW_SCHEMAS: Dict[str, Dict[str, pa.DataType]] = {
+    "invoices": {
+        "invoice_id": UUID, "user_id": pa.string(), "user_name": pa.string(),
+        "vendor_name": pa.string(), "invoice_date": pa.date32(), "due_date": pa.date32(),
+        "currency": pa.string(), "subtotal": pa.decimal128(15, 2), "tax_amount": pa.decimal128(15, 2),
+        "vat_rate": pa.decimal128(5, 2), "is_vat_reclaimable": pa.bool_(), "total_amount": pa.decimal128(15, 2),
+        "confidence_score": pa.decimal128(5, 4), "line_items_status": pa.string(), "status": pa.string(),
+        "payment_status": pa.string(), "category": pa.string(), "cost_center": pa.string(),
+        "project_id": pa.string(), "po_id": UUID, "file_url": pa.string(), "file_hash": pa.string(),
+        "whatsapp_media_id": pa.string(), "version": pa.int32(), "is_latest": pa.bool_(),
+        "parent_invoice_id": UUID, "compliance_flags": pa.string(),
+        "created_at": TIMESTAMP, "updated_at": TIMESTAMP,
+        "raw_text": pa.large_string(), "embedding": pa.large_string()
+    },
+    "line_items": {
+        "line_item_id": UUID, "invoice_id": UUID, "invoice_date": pa.date32(),
+        "description": pa.string(), "quantity": pa.decimal128(12, 4), "unit_price": pa.decimal128(15, 4),
+        "tax": pa.decimal128(15, 4), "line_total": pa.decimal128(15, 4), "created_at": TIMESTAMP
+    },
+    "audit": {
+        "audit_id": UUID, "created_at": TIMESTAMP, "user_id": pa.string(), "user": pa.string(),
+        "action": pa.string(), "entity_type": pa.string(), "entity_id": UUID,
+        "before_state": pa.string(), "after_state": pa.string(), "ip_address": pa.string()
+    },
+    "bot_interactions": {
+        "created_at": TIMESTAMP, "query": pa.string(), "response": pa.string(), "intent": pa.string(), "user": pa.string()
+    },
+    "merchants": {
+        "vendor_name": pa.string(), "invoices": pa.int64(), "total_spend": pa.decimal128(38, 2), "last_seen": pa.date32()
+    },
+    "employees": {
+        "phone": pa.string(), "name": pa.string(), "role": pa.string(), "is_approved": pa.bool_(), "created_at": TIMESTAMP
+    },
+    "notifications": {
+        "created_at": TIMESTAMP, "event_type": pa.string(), "message": pa.string(), "user_id": pa.string()
+    }
+}
+
+def arrow_schema(spec: Dict[str, Any]) -> pa.Schema:
+    """ Typed schema for a spec's columns (fixed up front so every chunk agrees). """
+    types = ARROW_SCHEMAS[spec["table"]]
+    return pa.schema([pa.field(c, types[c]) for c in spec["columns"]])
+
+def _text(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+def _column(values: List[Any], field_type: pa.DataType) -> pa.Array:
+    if field_type == UUID:
+        storage = pa.array([v.bytes if v is not None else None for v in values], pa.binary(16))
+        return pa.ExtensionArray.from_storage(UUID, storage)
+    if pa.types.is_string(field_type) or pa.types.is_large_string(field_type):
+        values = [_text(v) for v in values]
+    return pa.array(values, field_type)
+
+def _to_batch(rows: list, columns: List[str], schema: pa.Schema) -> pa.RecordBatch:
+    return pa.RecordBatch.from_arrays([_column([r[c] for r in rows], schema.field(c).type) for c in columns], schema=schema)
+
+class _ColumnarSink:
+    """ Buffers record batches into row groups of PARQUET_ROW_GROUP_ROWS. """
+
+    def __init__(self, file_path: str, fmt: str, schema: pa.Schema, compression: str, row_group_rows: int):
+        self.row_group_rows = row_group_rows
+        self._pending: List[pa.RecordBatch] = []
+        self._pending_rows = 0
+        if fmt == "parquet":
+            self._writer = pq.ParquetWriter(file_path, schema, compression=compression)
+        else:
+            options = ipc.IpcWriteOptions(compression=ARROW_IPC_COMPRESSION or None)
+            self._writer = ipc.new_file(file_path, schema, options=options)
+        self.fmt = fmt
+
+    def write(self, batch: pa.RecordBatch):
+        self._pending.append(batch)
+        self._pending_rows += batch.num_rows
+        if self._pending_rows >= self.row_group_rows:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        table = pa.Table.from_batches(self._pending)
+        if self.fmt == "parquet":
+            self._writer.write_table(table, row_group_size=self.row_group_rows)
+        else:
+            self._writer.write_table(table, max_chunksize=self.row_group_rows)
+        self._pending, self._pending_rows = [], 0
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+async def write_columnar(spec: Dict[str, Any], file_path: str, fmt: str = "parquet",
+                         on_progress: Optional[Callable[[int], None]] = None,
+                         compression: str = PARQUET_COMPRESSION,
+                         row_group_rows: int = PARQUET_ROW_GROUP_ROWS) -> int:
+    """
+    Writes a spec as Parquet or Arrow IPC with typed columns; returns rows written.
+    Rows come from the export cursor in chunks and are flushed per row group,
+    so memory is bounded by one row group.
+    """
+    schema = arrow_schema(spec)
+    sink = None
+    written = 0
+    try:
+        async for rows in iter_chunks(spec["query"], spec["params"]):
+            batch = await asyncio.to_thread(_to_batch, rows, spec["columns"], schema)
+            if sink is None:
+                sink = _ColumnarSink(file_path, fmt, schema, compression, row_group_rows)
+            await asyncio.to_thread(sink.write, batch)
+            written += len(rows)
+            if on_progress:
+                on_progress(written)
+    finally:
+        if sink is not None:
+            await asyncio.to_thread(sink.close)
+    return written
+
+# --- Month-partitioned snapshot ---
+# <SNAPSHOT_DIR>/invoices/month=YYYY-MM/part-0.parquet
+# <SNAPSHOT_DIR>/line_items/month=YYYY-MM/part-0.parquet
+# <SNAPSHOT_DIR>/_manifest.json   (watermark + row counts per partition)
+# Readable as one dataset: pyarrow.dataset.dataset(path, partitioning="hive")
+
+def _month_bounds(month: str):
+    if month == NULL_PARTITION:
+        return None, None
+    start = datetime.strptime(month, "%Y-%m").date()
+    end = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start, end
+
+def _snapshot_specs(month: str) -> Dict[str, Dict[str, Any]]:
+    start, end = _month_bounds(month)
+    where = "i.invoice_date IS NULL" if start is None else "i.invoice_date >= $1 AND i.invoice_date < $2"
+    params = [] if start is None else [start, end]
+    return {
+        "invoices": {
+            "table": "invoices",
+            "query": f"""
+                SELECT {", ".join(INVOICE_EXPORT_COLUMNS)}
+                FROM invoices i
+                LEFT JOIN system_users u ON i.user_id = u.phone
+                WHERE {where}
+                ORDER BY i.invoice_date, i.invoice_id
+            """,
+            "params": params,
+            "columns": [column_name(c) for c in INVOICE_EXPORT_COLUMNS]
+        },
+        "line_items": {
+            "table": "line_items",
+            "query": f"""
+                SELECT {", ".join(LINE_ITEM_EXPORT_COLUMNS)}
+                FROM invoice_line_items li
+                JOIN invoices i ON i.invoice_id = li.invoice_id
+                WHERE {where}
+                ORDER BY i.invoice_date, li.invoice_id
+            """,
+            "params": params,
+            "columns": [column_name(c) for c in LINE_ITEM_EXPORT_COLUMNS]
+        }
+    }
+
+def _load_manifest(snapshot_dir: str) -> Dict[str, Any]:
+    path = os.path.join(snapshot_dir, "_manifest.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") == SNAPSHOT_FORMAT_VERSION:
+            return manifest
+    return {"format_version": SNAPSHOT_FORMAT_VERSION, "watermark": None, "partitions": {}}
+
+def _save_manifest(snapshot_dir: str, manifest: Dict[str, Any]):
+    path = os.path.join(snapshot_dir, "_manifest.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def _partition_path(snapshot_dir: str, table: str, month: str) -> str:
+    return os.path.join(snapshot_dir, table, f"month={month}", "part-0.parquet")
+
+async def _write_partition(snapshot_dir: str, month: str) -> Dict[str, int]:
+    counts = {}
+    for table, spec in _snapshot_specs(month).items():
+        final_path = _partition_path(snapshot_dir, table, month)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        tmp_path = final_path + ".tmp"
+        rows = await write_columnar(spec, tmp_path, "parquet")
+        if rows:
+            # Readers never see a half-written partition
+            os.replace(tmp_path, final_path)
+        else:
+            for path in (tmp_path, final_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        counts[table] = rows
+    return counts
+
+def _drop_partition(snapshot_dir: str, month: str):
+    for table in ("invoices", "line_items"):
+        shutil.rmtree(os.path.dirname(_partition_path(snapshot_dir, table, month)), ignore_errors=True)
+
+def plan_refresh(known: Dict[str, Dict[str, Any]], counts: Dict[str, int], changed: set):
+    """
+    Months to rewrite and months to drop, given the manifest's partitions, the
+    current invoice count per month and the months with rows updated since
+    the watermark.
+    """
+    stale = {m for m, n in counts.items() if known.get(m, {}).get("invoices") != n}
+    dirty = sorted((changed | stale) & set(counts))
+    removed = sorted(set(known) - set(counts))
+    return dirty, removed
+
+_refresh_lock = asyncio.Lock()
+
+def snapshot_status(snapshot_dir: str = SNAPSHOT_DIR) -> Dict[str, Any]:
+    manifest = _load_manifest(snapshot_dir)
+    return {
+        "refreshing": _refresh_lock.locked(),
+        "path": snapshot_dir,
+        "watermark": manifest["watermark"],
+        "partitions": manifest["partitions"]
+    }
+
+async def refresh_snapshot(snapshot_dir: str = SNAPSHOT_DIR, full: bool = False) -> Dict[str, Any]:
+    """ Serialized wrapper: concurrent refreshes would rewrite the same partitions. """
+    async with _refresh_lock:
+        return await _refresh_snapshot(snapshot_dir, full)
+
+async def _refresh_snapshot(snapshot_dir: str, full: bool) -> Dict[str, Any]:
+    """
+    Brings the month-partitioned Parquet snapshot up to date and returns a summary.
+
+    A month is rewritten when any of its invoices has updated_at past the last
+    watermark, or when its invoice count no longer matches the manifest
+    (deletes, or invoices moved to another month). Counts come from
+    daily_spend_rollup, so detecting deletes doesn't scan invoices.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    manifest = _load_manifest(snapshot_dir)
+    if full:
+        # Forget recorded counts but keep every month on disk known, so months
+        # that no longer have invoices are dropped rather than orphaned
+        on_disk = os.listdir(os.path.join(snapshot_dir, "invoices")) if os.path.isdir(os.path.join(snapshot_dir, "invoices")) else []
+        manifest["watermark"] = None
+        manifest["partitions"] = {d.split("=", 1)[1]: {} for d in on_disk if d.startswith("month=")}
+    watermark = datetime.fromisoformat(manifest["watermark"]) if manifest["watermark"] else None
+
+    conn = await get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
+    try:
+        db_now = await conn.fetchval("SELECT NOW()")
+        counts = {
+            r["month"]: r["invoices"]
+            for r in await conn.fetch("""
+                SELECT to_char(day, 'YYYY-MM') AS month, SUM(invoice_count)::bigint AS invoices
+                FROM daily_spend_rollup GROUP BY 1
+            """)
+        }
+        undated = await conn.fetchval("SELECT COUNT(*) FROM invoices WHERE invoice_date IS NULL")
+        if undated:
+            counts[NULL_PARTITION] = undated
+
+        if watermark is None:
+            changed = set(counts)
+        else:
+            changed = {
+                r["month"] or NULL_PARTITION
+                for r in await conn.fetch(
+                    "SELECT DISTINCT to_char(invoice_date, 'YYYY-MM') AS month FROM invoices WHERE updated_at > $1",
+                    watermark
+                )
+            }
+    finally:
+        await conn.close()
+
+    known = manifest["partitions"]
+    dirty, removed = plan_refresh(known, counts, changed)
+
+    for month in removed:
+        _drop_partition(snapshot_dir, month)
+        del known[month]
+
+    rows = 0
+    for month in dirty:
+        written = await _write_partition(snapshot_dir, month)
+        known[month] = {**written, "refreshed_at": datetime.now().isoformat()}
+        rows += written["invoices"]
+        # Persist progress so an interrupted refresh resumes with the remaining months
+        _save_manifest(snapshot_dir, manifest)
+
+    manifest["watermark"] = (db_now - timedelta(seconds=SNAPSHOT_WATERMARK_LAG_SECONDS)).isoformat()
+    manifest["compression"] = PARQUET_COMPRESSION
+    _save_manifest(snapshot_dir, manifest)
+
+    summary = {"rewritten": dirty, "removed": removed, "invoices_written": rows, "partitions": len(known), "watermark": manifest["watermark"]}
+    logger.info(f"🗂️ Snapshot refreshed: {len(dirty)} month(s) rewritten, {len(removed)} removed, {rows} invoices")
+    return summary
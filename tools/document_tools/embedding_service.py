@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/text-embedding-004")
+EMBEDDING_DIM = 768
+# "gemini" in production; "local" for tests and offline benchmarks
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "gemini")
+# Gemini batchEmbedContents accepts up to 100 texts per request
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 100))
+EMBEDDING_MAX_CONCURRENT_BATCHES = int(os.getenv("EMBEDDING_MAX_CONCURRENT_BATCHES", 4))
+EMBEDDING_MAX_CHARS = 8000
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 4096))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", 24 * 3600))
+
+Backend = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+def normalize_text(text: str) -> str:
+    """ NFC, collapsed whitespace, truncated to what the model accepts. """
+    return " ".join(unicodedata.normalize("NFC", text or "").split())[:EMBEDDING_MAX_CHARS]
+
+def text_key(text: str, model: str = EMBEDDING_MODEL) -> str:
+    """ Cache key: case-insensitive, so "Apple receipt" and "apple  receipt" share an entry. """
+    return hashlib.sha256(f"{model}\0{normalize_text(text).casefold()}".encode()).hexdigest()
+
+async def gemini_backend(texts: List[str]) -> List[List[float]]:
+    from tools.document_tools.extraction_tools import get_gemini_client
+    client = get_gemini_client()
+    if not client:
+        raise RuntimeError("Gemini client not configured")
+    response = await client.aio.models.embed_content(model=EMBEDDING_MODEL, contents=texts)
+    return [e.values for e in response.embeddings]
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def local_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """
+    Deterministic stand-in model (feature hashing of words and character
+    trigrams, L2-normalized). Texts sharing vocabulary land close together,
+    which is enough for tests and for benchmarking the vector index offline.
+    """
+    vector = [0.0] * dim
+    words = _TOKEN_RE.findall(text.casefold())
+    features = words + [w[i:i + 3] for w in words if len(w) > 3 for i in range(len(w) - 2)]
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dim
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    if not norm:
+        # Empty text still needs a valid unit vector for cosine distance
+        vector[0], norm = 1.0, 1.0
+    return [v / norm for v in vector]
+
+async def local_backend(texts: List[str]) -> List[List[float]]:
+    return [local_embedding(t) for t in texts]
+
+BACKENDS: Dict[str, Backend] = {"gemini": gemini_backend, "local": local_backend}
+
+class EmbeddingService:
+    """
+    Embedding front-end shared by ingest, search and the vector sync script.
+
+    - LRU + TTL cache keyed on the normalized text hash (repeated searches
+      and re-processed invoices cost no API call).
+    - Concurrent requests for the same text share one in-flight call (single-flight).
+    - embed_many() sends cache misses in batches of EMBEDDING_BATCH_SIZE.
+    Failures return [] for the affected texts and are not cached.
+    """
+
+    def __init__(self, backend: Optional[Backend] = None, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES, ttl: float = EMBEDDING_CACHE_TTL_SECONDS,
+                 dim: int = EMBEDDING_DIM):
+        self._backend = backend
+        self.batch_size = batch_size
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.dim = dim
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "api_calls": 0, "texts_embedded": 0, "errors": 0}
+
+    @property
+    def backend(self) -> Backend:
+        return self._backend or BACKENDS.get(EMBEDDING_BACKEND, gemini_backend)
+
+    # --- Cache ---
+
+    def _get(self, key: str) -> Optional[List[float]]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry["stored_at"] > self.ttl:
+            if entry is not None:
+                del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry["embedding"]
+
+    def _put(self, key: str, embedding: List[float]):
+        self._entries[key] = {"embedding": embedding, "stored_at": time.monotonic()}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    # --- Public API ---
+
+    async def embed(self, text: str) -> List[float]:
+        return (await self.embed_many([text]))[0]
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """ Embeddings in input order; [] for empty texts and failures. """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        waits: Dict[int, asyncio.Future] = {}
+        todo: Dict[str, str] = {}  # key -> normalized text, deduped within the call
+
+        loop = asyncio.get_running_loop()
+        for i, text in enumerate(texts):
+            normalized = normalize_text(text)
+            if not normalized:
+                results[i] = []
+                continue
+            key = text_key(normalized)
+            cached = self._get(key)
+            if cached is not None:
+                self.stats["hits"] += 1
+                results[i] = cached
+                continue
+            if key in self._inflight:
+                if key not in todo:
+                    self.stats["coalesced"] += 1
+                waits[i] = self._inflight[key]
+                continue
+            self.stats["misses"] += 1
+            todo[key] = normalized
+            self._inflight[key] = loop.create_future()
+            waits[i] = self._inflight[key]
+
+        if todo:
+            items = list(todo.items())
+            batches = [items[n:n + self.batch_size] for n in range(0, len(items), self.batch_size)]
+            owned = {key: self._inflight[key] for key in todo}
+            try:
+                await asyncio.gather(*(self._run_batch(batch) for batch in batches))
+            finally:
+                # On cancellation (client gone, wait_for timeout) followers get [] and the keys are released
+                for key, future in owned.items():
+                    if self._inflight.get(key) is future:
+                        del self._inflight[key]
+                    if not future.done():
+                        future.set_result([])
+
+        for i, future in waits.items():
+            results[i] = await asyncio.shield(future)
+        return results
+
+    async def _run_batch(self, batch: List[tuple]):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(EMBEDDING_MAX_CONCURRENT_BATCHES)
+        try:
+            async with self._semaphore:
+                self.stats["api_calls"] += 1
+                vectors = await self.backend([text for _, text in batch])
+            if len(vectors) != len(batch):
+                raise RuntimeError(f"Backend returned {len(vectors)} embeddings for {len(batch)} texts")
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Embedding generation failed for {len(batch)} text(s): {e}")
+            vectors = [[] for _ in batch]
+
+        for (key, _), vector in zip(batch, vectors):
+            vector = list(vector)
+            if vector and len(vector) != self.dim:
+                logger.warning(f"Unexpected embedding dimension: {len(vector)}")
+                vector = []
+            if vector:
+                self._put(key, vector)
+                self.stats["texts_embedded"] += 1
+            future = self._inflight.pop(key, None)
+            if future is not None and not future.done():
+                future.set_result(vector)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "backend": "custom" if self._backend else EMBEDDING_BACKEND,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hit_rate": round((self.stats["hits"] + self.stats["coalesced"]) / lookups, 3) if lookups else 0.0
+        }
+
+embedding_service = EmbeddingService()
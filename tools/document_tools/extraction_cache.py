@@ -0,0 +1,84 @@
+import copy
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", 1000))
+EXTRACTION_CACHE_TTL_SECONDS = float(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+
+def hash_file(file_path: str) -> str:
+    """ SHA-256 of the raw file bytes, read in chunks. """
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+class ExtractionCache:
+    """
+    Content-addressed cache of extraction results keyed on the SHA-256 of the
+    uploaded file. A re-sent receipt or forwarded PDF skips LlamaParse, Gemini
+    and the embedding call entirely. Entries are evicted LRU beyond max_entries
+    and expire after ttl seconds.
+    """
+
+    def __init__(self, max_entries: int = EXTRACTION_CACHE_MAX_ENTRIES, ttl: float = EXTRACTION_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """ Returns {raw_text, extraction, embedding} or None. Callers get their own copy. """
+        entry = self._entries.get(content_hash)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        if time.monotonic() - entry["stored_at"] > self.ttl:
+            del self._entries[content_hash]
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(content_hash)
+        self.stats["hits"] += 1
+        return copy.deepcopy(entry["value"])
+
+    def put(self, content_hash: str, raw_text: str, extraction: Dict[str, Any], embedding=None):
+        self._entries[content_hash] = {
+            "stored_at": time.monotonic(),
+            "value": {
+                "raw_text": raw_text,
+                "extraction": copy.deepcopy(extraction),
+                "embedding": list(embedding) if embedding else None
+            }
+        }
+        self._entries.move_to_end(content_hash)
+        self.stats["stores"] += 1
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, content_hash: str):
+        self._entries.pop(content_hash, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0
+        }
+
+extraction_cache = ExtractionCache()
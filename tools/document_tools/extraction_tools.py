@@ -407,27 +407,15 @@ def validate_expense(
 async def generate_embedding(text: str) -> List[float]:
     """
     Generate embedding for semantic search using Gemini.
+    Served through the shared embedding cache; [] on failure.
     """
-    client = get_gemini_client()
-    if not client or not text:
-        return []
-    
-    try:
-        # Truncate text if too long (approx char limit for embedding models is often ~10k-30k chars, but let's be safe)
-        safe_text = text[:8000] 
-        
-        response = await client.aio.models.embed_content(
-            model="models/text-embedding-004",
-            contents=safe_text
-        )
-        # Verify dimension
-        embedding = response.embeddings[0].values
-        if len(embedding) == 768:
-            return embedding
-        else:
-            logger.warning(f"Unexpected embedding dimension: {len(embedding)}")
-            return []
-            
-    except Exception as e:
-        logger.error(f"Embedding generation failed: {e}")
-        return []
+    from tools.document_tools.embedding_service import embedding_service
+    return await embedding_service.embed(text)
+
+async def generate_embeddings(texts: List[str]) -> List[List[float]]:
+    """
+    Batch variant of generate_embedding: one API call per EMBEDDING_BATCH_SIZE
+    cache misses, results in input order ([] for failed or empty texts).
+    """
+    from tools.document_tools.embedding_service import embedding_service
+    return await embedding_service.embed_many(texts)
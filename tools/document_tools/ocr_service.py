@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", 2))
+OCR_MAX_QUEUE = int(os.getenv("OCR_MAX_QUEUE", 8))
+OCR_JOB_TIMEOUT = float(os.getenv("OCR_JOB_TIMEOUT", 120))
+OCR_WARM_ON_STARTUP = os.getenv("OCR_WARM_ON_STARTUP", "false").lower() == "true"
+
+class OCRQueueFullError(Exception):
+    """ Raised when more OCR jobs are outstanding than OCR_WORKERS + OCR_MAX_QUEUE. """
+
+# --- Worker-process side (must be top-level so it can be pickled) ---
+
+def _init_worker():
+    # Each worker process loads its own PaddleOCR model exactly once
+    from tools.document_tools.ocr_tools import get_paddle_ocr
+    started = time.time()
+    get_paddle_ocr()
+    print(f"🔥 OCR worker {os.getpid()} warmed up in {time.time() - started:.1f}s")
+
+def _warmup_job():
+    return os.getpid()
+
+def _ocr_job(file_path: str, is_pdf: bool, submitted_at: float, layer: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    from tools.document_tools.ocr_tools import read_pdf_text_layer, render_pdf_pages, preprocess_image, ocr_paddle
+
+    started_at = time.time()
+
+    # Born-digital PDF pages come straight from the text layer;
+    # only scanned/sparse pages are rasterized and OCR'd.
+    if is_pdf:
+        if layer is None:
+            layer = read_pdf_text_layer(file_path)
+        page_text = dict(layer["page_texts"])
+        tokens = list(layer["tokens"])
+        confidences = [1.0] * len(page_text)
+        pages = layer["pages"]
+        ocr_pages = layer["needs_ocr"]
+        # Pages are rendered straight into NumPy arrays; nothing touches disk
+        images = render_pdf_pages(file_path, ocr_pages) if ocr_pages else []
+    else:
+        page_text, tokens, confidences = {}, [], []
+        pages = [{"page": 0, "method": "ocr"}]
+        ocr_pages = [0]
+        images = [(0, file_path)]
+
+    for page_no, img in images:
+        proc = preprocess_image(img, f"{os.path.basename(file_path)}_{page_no}.png")
+        res = ocr_paddle(proc)
+        if res["raw_text"]:
+            page_text[page_no] = res["raw_text"]
+            confidences.append(res["ocr_confidence"])
+        for token in res["tokens"]:
+            tokens.append({**token, "page": page_no})
+
+    if is_pdf:
+        text_pages = sum(1 for p in pages if p["method"] == "text_layer")
+        print(f"📑 {os.path.basename(file_path)}: {text_pages}/{len(pages)} page(s) from text layer, {len(ocr_pages)} OCR'd")
+
+    return {
+        "raw_text": "\n".join(page_text[k] for k in sorted(page_text)),
+        "tokens": tokens,
+        "ocr_confidence": sum(confidences) / len(confidences) if confidences else 0.0,
+        "page_count": len(pages),
+        "pages": pages,
+        "timings": {
+            "queue_wait": max(0.0, started_at - submitted_at),
+            "inference": time.time() - started_at
+        }
+    }
+
+# --- Event-loop side ---
+
+class OCRService:
+    """
+    Runs PaddleOCR and OpenCV preprocessing in a ProcessPoolExecutor so CPU-heavy
+    inference never blocks the asyncio event loop. Outstanding jobs are bounded
+    and each job has a timeout; queue-wait and inference time are tracked separately.
+    """
+
+    def __init__(self, workers: int = OCR_WORKERS, max_queue: int = OCR_MAX_QUEUE, job_timeout: float = OCR_JOB_TIMEOUT):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._outstanding = 0
+        self.stats = {
+            "completed": 0, "failed": 0, "timeouts": 0, "rejected": 0,
+            "queue_wait_total": 0.0, "inference_total": 0.0,
+            "last_queue_wait": 0.0, "last_inference": 0.0
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: Paddle does not survive fork() of a process that already imported it
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+        return self._executor
+
+    def start(self):
+        """ Starts the worker processes (and loads the models) ahead of the first receipt. """
+        executor = self._get_executor()
+        for _ in range(self.workers):
+            executor.submit(_warmup_job)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _release(self, _future):
+        self._outstanding -= 1
+
+    async def ocr_document(self, file_path: str, mime_type: Optional[str] = None,
+                           text_layer: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        OCRs an image or PDF off the event loop.
+        Returns {raw_text, tokens, ocr_confidence, page_count, pages, timings};
+        pages records per page whether the text layer or OCR was used.
+        text_layer: a read_pdf_text_layer() result the caller already has (not read again).
+        """
+        if self._outstanding >= self.workers + self.max_queue:
+            self.stats["rejected"] += 1
+            raise OCRQueueFullError(f"OCR queue full ({self._outstanding} jobs outstanding)")
+
+        is_pdf = mime_type == "application/pdf" or file_path.lower().endswith(".pdf")
+        try:
+            cf = self._get_executor().submit(_ocr_job, file_path, is_pdf, time.time(), text_layer)
+        except BrokenProcessPool:
+            logger.error("OCR process pool is broken, restarting it")
+            self.shutdown()
+            cf = self._get_executor().submit(_ocr_job, file_path, is_pdf, time.time(), text_layer)
+
+        # The slot is held until the worker actually finishes, even if we time out
+        self._outstanding += 1
+        future = asyncio.wrap_future(cf)
+        future.add_done_callback(self._release)
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=self.job_timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.error(f"⏱️ OCR timed out after {self.job_timeout}s for {file_path}")
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"OCR failed for {file_path}: {e}")
+            raise
+
+        timings = result["timings"]
+        self.stats["completed"] += 1
+        self.stats["queue_wait_total"] += timings["queue_wait"]
+        self.stats["inference_total"] += timings["inference"]
+        self.stats["last_queue_wait"] = timings["queue_wait"]
+        self.stats["last_inference"] = timings["inference"]
+        logger.info(f"🔍 OCR {os.path.basename(file_path)}: waited {timings['queue_wait']:.2f}s, inference {timings['inference']:.2f}s")
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        completed = self.stats["completed"] or 1
+        return {
+            **self.stats,
+            "outstanding": self._outstanding,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "avg_queue_wait": round(self.stats["queue_wait_total"] / completed, 3),
+            "avg_inference": round(self.stats["inference_total"] / completed, 3)
+        }
+
+ocr_service = OCRService()
@@ -26,45 +26,121 @@ def get_paddle_ocr():
                 _paddle_ocr = None
     return _paddle_ocr
 
-def render_pdf_to_images(pdf_path):
-    output_images = []
-    temp_dir = "uploads/pdf_pages"
-    os.makedirs(temp_dir, exist_ok=True)
-    
+# A page whose text layer has fewer characters than this is treated as scanned
+PDF_TEXT_LAYER_MIN_CHARS = int(os.getenv("PDF_TEXT_LAYER_MIN_CHARS", 40))
+
+def _is_usable_text(text):
+    """ Rejects empty/sparse layers and garbled ones (broken font encodings). """
+    stripped = "".join(text.split())
+    if len(stripped) < PDF_TEXT_LAYER_MIN_CHARS:
+        return False
+    garbled = sum(1 for c in stripped if c == "\ufffd" or not c.isprintable())
+    return garbled / len(stripped) < 0.1
+
+def read_pdf_text_layer(pdf_path):
+    """
+    Reads the embedded text layer of a born-digital PDF with PyMuPDF.
+    Returns per-page decisions so only scanned/sparse pages get rasterized + OCR'd:
+    {"page_texts": {page: text}, "tokens", "pages": [{"page", "method", "chars"}], "needs_ocr": [page numbers]}
+    """
+    pages = []
+    needs_ocr = []
+    page_texts = {}
+    tokens = []
+
+    doc = fitz.open(pdf_path)
+    try:
+        for i in range(len(doc)):
+            page = doc[i]
+            words = page.get_text("words")
+            text = page.get_text("text")
+            if _is_usable_text(text):
+                page_texts[i] = text.strip()
+                for x0, y0, x1, y1, word, *_ in words:
+                    # Same 4-point bbox shape as PaddleOCR (in PDF points, not pixels)
+                    tokens.append({"text": word, "confidence": 1.0, "bbox": [[x0, y0], [x1, y0], [x1, y1], [x0, y1]], "page": i})
+                pages.append({"page": i, "method": "text_layer", "chars": len(text.strip())})
+            else:
+                needs_ocr.append(i)
+                pages.append({"page": i, "method": "ocr", "chars": len(text.strip())})
+    finally:
+        doc.close()
+
+    return {
+        "page_texts": page_texts,
+        "tokens": tokens,
+        "pages": pages,
+        "needs_ocr": needs_ocr
+    }
+
+# Writes rendered/preprocessed pages under uploads/ for inspection
+OCR_DEBUG_DUMP = os.getenv("OCR_DEBUG_DUMP", "false").lower() == "true"
+OCR_RENDER_DPI = int(os.getenv("OCR_RENDER_DPI", 300))
+
+def _debug_dump(folder, name, img):
+    if not OCR_DEBUG_DUMP:
+        return
+    os.makedirs(folder, exist_ok=True)
+    cv2.imwrite(os.path.join(folder, name), img)
+
+def pixmap_to_array(pix):
+    """ Wraps the Pixmap sample buffer as an (h, w, n) uint8 array without copying. """
+    buf = getattr(pix, "samples_mv", None) or pix.samples
+    arr = np.frombuffer(buf, dtype=np.uint8)
+    if pix.n == 1:
+        return arr.reshape(pix.h, pix.w)
+    return arr.reshape(pix.h, pix.w, pix.n)
+
+def render_pdf_pages(pdf_path, page_numbers=None):
+    """
+    Yields (page_number, ndarray) for each page, rendered in grayscale in memory.
+    The array is a view over the Pixmap buffer, so it is only valid until the
+    next page is yielded; consume (preprocess) it before advancing.
+    """
     doc = fitz.open(pdf_path)
-    for i in range(len(doc)):
-        page = doc[i]
-        pix = page.get_pixmap(matrix=fitz.Matrix(300/72, 300/72))
-        img_path = os.path.join(temp_dir, f"{os.path.basename(pdf_path)}_{i}.png")
-        pix.save(img_path)
-        output_images.append(img_path)
-    doc.close()
-    return output_images
+    try:
+        for i in (range(len(doc)) if page_numbers is None else page_numbers):
+            pix = doc[i].get_pixmap(matrix=fitz.Matrix(OCR_RENDER_DPI/72, OCR_RENDER_DPI/72), colorspace=fitz.csGRAY, alpha=False)
+            img = pixmap_to_array(pix)
+            _debug_dump("uploads/pdf_pages", f"{os.path.basename(pdf_path)}_{i}.png", img)
+            yield i, img
+            del img, pix
+    finally:
+        doc.close()
 
-def preprocess_image(image_path):
-    img = cv2.imread(image_path)
-    if img is None: return image_path
+def preprocess_image(image, debug_name="page.png"):
+    """
+    Accepts an image path or an ndarray (grayscale, or RGB as rendered by PyMuPDF)
+    and returns the preprocessed grayscale ndarray, ready for ocr_paddle.
+    """
+    if isinstance(image, str):
+        debug_name = os.path.basename(image)
+        img = cv2.imread(image)
+        if img is None: return image
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    elif image.ndim == 2:
+        gray = image
+    else:
+        gray = cv2.cvtColor(image, cv2.COLOR_RGBA2GRAY if image.shape[2] == 4 else cv2.COLOR_RGB2GRAY)
     
     # Simple effective preprocess
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
     enhanced = clahe.apply(gray)
     denoised = cv2.fastNlMeansDenoising(enhanced, None, 10, 7, 21)
     
-    proc_path = f"uploads/preprocessed/proc_{os.path.basename(image_path)}"
-    os.makedirs("uploads/preprocessed", exist_ok=True)
-    cv2.imwrite(proc_path, denoised)
-    return proc_path
+    _debug_dump("uploads/preprocessed", f"proc_{debug_name}", denoised)
+    return denoised
 
-def ocr_paddle(image_path):
+def ocr_paddle(image):
+    """ OCRs an image path or an ndarray (grayscale arrays are accepted by PaddleOCR). """
     ocr = get_paddle_ocr()
     if not ocr:
         return {"raw_text": "", "tokens": [], "ocr_confidence": 0.0}
         
     try:
-        result = ocr.ocr(image_path, cls=True)
+        result = ocr.ocr(image, cls=True)
     except:
-        result = ocr.ocr(image_path)
+        result = ocr.ocr(image)
         
     if not result or not result[0]:
         return {"raw_text": "", "tokens": [], "ocr_confidence": 0.0}
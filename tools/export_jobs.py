@@ -0,0 +1,321 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from storage.response_cache import response_cache
+from tools.export_tools import (
+    EXPORT_DIR,
+    EXPORT_FORMATS,
+    audit_export_spec,
+    bot_export_spec,
+    employees_export_spec,
+    export_filename,
+    generate_advanced_report,
+    invoice_export_spec,
+    line_items_export_spec,
+    merchants_export_spec,
+    notifications_export_spec,
+    write_export,
+)
+
+logger = logging.getLogger(__name__)
+
+EXPORT_JOB_WORKERS = int(os.getenv("EXPORT_JOB_WORKERS", 2))
+# Finished job artifacts (and orphaned ones in exports/jobs/) older than this are deleted
+EXPORT_RETENTION_SECONDS = float(os.getenv("EXPORT_RETENTION_SECONDS", 24 * 3600))
+EXPORT_MAX_ARTIFACTS = int(os.getenv("EXPORT_MAX_ARTIFACTS", 50))
+# Artifacts fetched or polled this recently are never evicted (a download may still be streaming)
+EXPORT_ACCESS_GRACE_SECONDS = float(os.getenv("EXPORT_ACCESS_GRACE_SECONDS", 600))
+# Exports of tables the data version doesn't track are only reused this long
+EXPORT_UNVERSIONED_REUSE_SECONDS = float(os.getenv("EXPORT_UNVERSIONED_REUSE_SECONDS", 300))
+# rows_written is broadcast at most this often while a job runs
+EXPORT_PROGRESS_INTERVAL = float(os.getenv("EXPORT_PROGRESS_INTERVAL", 2))
+
+EXPORT_JOBS_DIR = os.path.join(EXPORT_DIR, "jobs")
+# Job artifacts are written as "<job_id>_<filename>"
+JOB_ARTIFACT_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_.+")
+
+def _invoices(params):
+    include = params.get("include") or []
+    if isinstance(include, str):
+        include = [c.strip() for c in include.split(",") if c.strip()]
+    return invoice_export_spec(params.get("start_date"), params.get("end_date"), params.get("user_id"), include)
+
+def _line_items(params):
+    return line_items_export_spec(params.get("start_date"), params.get("end_date"), params.get("user_id"))
+
+# kind -> (spec builder, accepted params, tracked by the invoices data version)
+EXPORT_KINDS: Dict[str, tuple] = {
+    "invoices": (_invoices, {"start_date", "end_date", "user_id", "include"}, True),
+    "line-items": (_line_items, {"start_date", "end_date", "user_id"}, True),
+    "merchants": (lambda params: merchants_export_spec(), set(), True),
+    "advanced-report": (None, set(), True),
+    "audit": (lambda params: audit_export_spec(), set(), False),
+    "bot-activity": (lambda params: bot_export_spec(), set(), False),
+    "employees": (lambda params: employees_export_spec(), set(), False),
+    "notifications": (lambda params: notifications_export_spec(), set(), False),
+}
+
+def _normalize_params(kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """ Drops unknown and empty params so equivalent requests hash the same. """
+    accepted = EXPORT_KINDS[kind][1]
+    normalized = {}
+    for key, value in (params or {}).items():
+        if key not in accepted or value in (None, "", "null", "undefined", []):
+            continue
+        if key == "include" and isinstance(value, str):
+            value = [c.strip() for c in value.split(",") if c.strip()]
+        if isinstance(value, list):
+            value = sorted(set(value))
+        normalized[key] = value
+    return normalized
+
+def fingerprint(kind: str, fmt: str, params: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps([kind, fmt, params], sort_keys=True).encode()).hexdigest()
+
+class ExportJobManager:
+    """
+    Runs exports in the background so admin requests return immediately.
+
+    - create() dedupes on (parameter fingerprint, invoices data version): an
+      identical request while the data is unchanged gets the queued, running
+      or finished job instead of a new file.
+    - Workers report rows_written as they go; completion and failure are
+      broadcast over the dashboard WebSocket.
+    - Finished artifacts are evicted after EXPORT_RETENTION_SECONDS or beyond
+      EXPORT_MAX_ARTIFACTS (least recently used first), except ones accessed
+      within the last EXPORT_ACCESS_GRACE_SECONDS.
+    Jobs live in memory; artifacts from a previous process are swept from
+    jobs_dir on start(). Other files in exports/ are never touched.
+    """
+
+    def __init__(self, workers: int = EXPORT_JOB_WORKERS, retention: float = EXPORT_RETENTION_SECONDS,
+                 max_artifacts: int = EXPORT_MAX_ARTIFACTS, jobs_dir: str = EXPORT_JOBS_DIR,
+                 access_grace: float = EXPORT_ACCESS_GRACE_SECONDS):
+        self.workers = workers
+        self.retention = retention
+        self.max_artifacts = max_artifacts
+        self.jobs_dir = jobs_dir
+        self.access_grace = access_grace
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._by_key: Dict[tuple, str] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.broadcaster: Optional[Callable[[dict], Awaitable[None]]] = None
+        self.stats = {"created": 0, "reused": 0, "completed": 0, "failed": 0, "evicted": 0}
+
+    def set_broadcaster(self, func: Callable[[dict], Awaitable[None]]):
+        self.broadcaster = func
+
+    def start(self):
+        if self._tasks:
+            return
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self.evict()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # --- Public API ---
+
+    def create(self, kind: str, fmt: str = "xlsx", params: Dict[str, Any] = None) -> Dict[str, Any]:
+        if kind not in EXPORT_KINDS:
+            raise ValueError(f"Unknown export kind: {kind}")
+        if kind == "advanced-report":
+            fmt = "xlsx"
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported format: {fmt}")
+
+        params = _normalize_params(kind, params)
+        key = (fingerprint(kind, fmt, params), response_cache.data_version)
+        existing = self.jobs.get(self._by_key.get(key))
+        if existing and self._reusable(existing):
+            existing["last_access"] = time.time()
+            self.stats["reused"] += 1
+            return self.public(existing)
+
+        self.start()
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "kind": kind,
+            "format": fmt,
+            "params": params,
+            "key": key,
+            "status": "queued",
+            "rows_written": 0,
+            "filename": None,
+            "file_path": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "last_access": time.time()
+        }
+        self.jobs[job["job_id"]] = job
+        self._by_key[key] = job["job_id"]
+        self._queue.put_nowait(job["job_id"])
+        self.stats["created"] += 1
+        return self.public(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        if job:
+            job["last_access"] = time.time()
+        return job
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        return [self.public(j) for j in sorted(self.jobs.values(), key=lambda j: j["created_at"], reverse=True)]
+
+    @staticmethod
+    def public(job: Dict[str, Any]) -> Dict[str, Any]:
+        def ts(value):
+            return datetime.fromtimestamp(value).isoformat() if value else None
+        return {
+            "job_id": job["job_id"],
+            "kind": job["kind"],
+            "format": job["format"],
+            "params": job["params"],
+            "status": job["status"],
+            "rows_written": job["rows_written"],
+            "filename": job["filename"],
+            "error": job["error"],
+            "created_at": ts(job["created_at"]),
+            "finished_at": ts(job["finished_at"]),
+            "download_url": f"/api/admin/export-jobs/{job['job_id']}/download" if job["status"] == "done" else None
+        }
+
+    # --- Internals ---
+
+    def _reusable(self, job: Dict[str, Any]) -> bool:
+        if job["status"] == "failed":
+            return False
+        if job["status"] == "done" and not (job["file_path"] and os.path.exists(job["file_path"])):
+            return False
+        if not EXPORT_KINDS[job["kind"]][2]:
+            return time.time() - job["created_at"] < EXPORT_UNVERSIONED_REUSE_SECONDS
+        return True
+
+    async def _worker(self, n: int):
+        while True:
+            job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is None:
+                continue
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = str(e)
+                job["finished_at"] = time.time()
+                self.stats["failed"] += 1
+                logger.error(f"❌ Export job {job_id} ({job['kind']}) failed: {e}")
+                await self._broadcast("export_failed", job)
+            finally:
+                self.evict()
+
+    async def _run(self, job: Dict[str, Any]):
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        last_report = [0.0]
+
+        def on_progress(rows: int):
+            job["rows_written"] = rows
+            now = time.monotonic()
+            if now - last_report[0] >= EXPORT_PROGRESS_INTERVAL:
+                last_report[0] = now
+                asyncio.get_running_loop().create_task(self._broadcast("export_progress", job))
+
+        builder = EXPORT_KINDS[job["kind"]][0]
+        if builder is None:
+            filename = f"Professional_Expense_Report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+            file_path = os.path.join(self.jobs_dir, f"{job['job_id']}_{filename}")
+            produced = await generate_advanced_report(file_path, on_progress)
+            written = job["rows_written"] if produced else 0
+        else:
+            spec = builder(job["params"])
+            filename = export_filename(spec, job["format"])
+            file_path = os.path.join(self.jobs_dir, f"{job['job_id']}_{filename}")
+            written = await write_export(spec, file_path, job["format"], on_progress)
+
+        job["rows_written"] = written
+        job["finished_at"] = time.time()
+        if not written:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            job["status"] = "failed"
+            job["error"] = "No data to export"
+            self.stats["failed"] += 1
+            await self._broadcast("export_failed", job)
+            return
+
+        job["filename"] = filename
+        job["file_path"] = file_path
+        job["status"] = "done"
+        self.stats["completed"] += 1
+        logger.info(f"📤 Export job {job['job_id']} ({job['kind']}) wrote {written} rows in {job['finished_at'] - job['started_at']:.1f}s")
+        await self._broadcast("export_ready", job)
+
+    async def _broadcast(self, event_type: str, job: Dict[str, Any]):
+        if not self.broadcaster:
+            return
+        try:
+            await self.broadcaster({"type": event_type, "data": self.public(job)})
+        except Exception as e:
+            logger.warning(f"Export job broadcast failed: {e}")
+
+    def _drop(self, job: Dict[str, Any]):
+        self.jobs.pop(job["job_id"], None)
+        if self._by_key.get(job["key"]) == job["job_id"]:
+            del self._by_key[job["key"]]
+        if job["file_path"] and os.path.exists(job["file_path"]):
+            os.remove(job["file_path"])
+        self.stats["evicted"] += 1
+
+    def evict(self):
+        """ Applies the retention policy to job artifacts, live and orphaned, in jobs_dir. """
+        now = time.time()
+        evictable = [j for j in self.jobs.values() if now - j["last_access"] > self.access_grace]
+        for job in evictable:
+            if job["status"] in ("done", "failed") and now - job["finished_at"] > self.retention:
+                self._drop(job)
+
+        done = sorted((j for j in self.jobs.values() if j["status"] == "done"), key=lambda j: j["last_access"])
+        excess = max(0, len(done) - self.max_artifacts)
+        for job in [j for j in done if now - j["last_access"] > self.access_grace][:excess]:
+            self._drop(job)
+
+        # Job artifacts no live job owns (left by a previous process)
+        if not os.path.isdir(self.jobs_dir):
+            return
+        owned = {j["file_path"] for j in self.jobs.values() if j["file_path"]}
+        for name in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, name)
+            if path in owned or not JOB_ARTIFACT_RE.match(name) or not os.path.isfile(path):
+                continue
+            try:
+                if now - os.path.getmtime(path) > self.retention:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        by_status: Dict[str, int] = {}
+        for job in self.jobs.values():
+            by_status[job["status"]] = by_status.get(job["status"], 0) + 1
+        return {**self.stats, "jobs": by_status, "queued": self._queue.qsize() if self._queue else 0}
+
+export_jobs = ExportJobManager()
@@ -1,216 +1,397 @@
-
-import pandas as pd
+import asyncio
+import csv
+import io
+import json
+import logging
 import os
-from datetime import datetime
+import tempfile
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+from uuid import UUID
+
+from openpyxl import Workbook
 from storage.postgres_repository import get_db_connection
+from storage.invoice_repository import HEAVY_FIELDS, projection_columns
+
+logger = logging.getLogger(__name__)
 
 EXPORT_DIR = os.path.join(os.getcwd(), "exports")
 os.makedirs(EXPORT_DIR, exist_ok=True)
 
-async def generate_custom_export(start_date: str = None, end_date: str = None, user_id: str = None):
+# Rows pulled from the server-side cursor per round-trip; bounds export memory
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", 2000))
+# Bytes per chunk when streaming a finished file to the client
+EXPORT_STREAM_BYTES = 256 * 1024
+
+EXPORT_FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "csv.gz": "application/gzip",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file"
+}
+# Formats whose file can be sent as it is written; the others are finished in a temp file first
+STREAMABLE_FORMATS = {"csv", "csv.gz"}
+
+# Large per-invoice columns that are only exported on request (include=raw_text,embedding)
+HEAVY_INVOICE_COLUMNS = {name: f"{expr} AS {name}" for name, expr in HEAVY_FIELDS.items()}
+
+INVOICE_EXPORT_COLUMNS = projection_columns("export")
+
+LINE_ITEM_EXPORT_COLUMNS = [
+    "li.line_item_id", "li.invoice_id", "i.invoice_date", "li.description", "li.quantity",
+    "li.unit_price", "li.tax", "li.line_total", "li.created_at"
+]
+
+def column_name(expr: str) -> str:
+    """ "u.name AS user_name" -> "user_name", "i.vendor_name" -> "vendor_name" """
+    return expr.split(" AS ")[-1].split(".")[-1]
+
+def _cell(value: Any) -> Any:
+    """ Converts asyncpg values to something both openpyxl and csv accept. """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return str(value)
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+def _valid_date(value: Optional[str]) -> Optional[date]:
+    if value and value not in ['null', 'undefined', '']:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    return None
+
+# --- Export specs ---
+# A spec is everything needed to produce one sheet/file: its query, params,
+# output columns and source table (which picks the typed Arrow schema).
+# Building it is cheap, so callers (routes, the WhatsApp export intent) can
+# inspect or stream it without touching the database first.
+
+def invoice_export_spec(start_date: str = None, end_date: str = None, user_id: str = None,
+                        include: Iterable[str] = ()) -> Dict[str, Any]:
+    columns = list(INVOICE_EXPORT_COLUMNS)
+    for name in include or ():
+        if name in HEAVY_INVOICE_COLUMNS:
+            columns.append(HEAVY_INVOICE_COLUMNS[name])
+
+    where, params = _invoice_filters(start_date, end_date, user_id)
+    return {
+        "name": "Invoices_Export",
+        "sheet": "Invoices",
+        "table": "invoices",
+        "query": f"""
+            SELECT {", ".join(columns)}
+            FROM invoices i
+            LEFT JOIN system_users u ON i.user_id = u.phone
+            WHERE {where}
+            ORDER BY i.invoice_date DESC
+        """,
+        "params": params,
+        "columns": [column_name(c) for c in columns]
+    }
+
+def line_items_export_spec(start_date: str = None, end_date: str = None, user_id: str = None) -> Dict[str, Any]:
+    where, params = _invoice_filters(start_date, end_date, user_id)
+    return {
+        "name": "LineItems_Export",
+        "sheet": "Line Items",
+        "table": "line_items",
+        "query": f"""
+            SELECT {", ".join(LINE_ITEM_EXPORT_COLUMNS)}
+            FROM invoice_line_items li
+            JOIN invoices i ON i.invoice_id = li.invoice_id
+            WHERE {where}
+            ORDER BY i.invoice_date DESC, li.invoice_id
+        """,
+        "params": params,
+        "columns": [column_name(c) for c in LINE_ITEM_EXPORT_COLUMNS]
+    }
+
+def _invoice_filters(start_date: str = None, end_date: str = None, user_id: str = None):
+    """ WHERE clause (on alias i) and params for the invoice date range / owner filters. """
+    clauses, params = ["1=1"], []
+    start, end = _valid_date(start_date), _valid_date(end_date)
+    if start:
+        params.append(start)
+        clauses.append(f"i.invoice_date >= ${len(params)}")
+    if end:
+        params.append(end)
+        clauses.append(f"i.invoice_date <= ${len(params)}")
+    if user_id:
+        params.append(user_id)
+        clauses.append(f"i.user_id = ${len(params)}")
+    return " AND ".join(clauses), params
+
+def _simple_spec(name: str, sheet: str, table: str, query: str, columns: List[str]) -> Dict[str, Any]:
+    return {"name": name, "sheet": sheet, "table": table, "query": query, "params": [], "columns": columns}
+
+def audit_export_spec() -> Dict[str, Any]:
+    return _simple_spec(
+        "AuditLogs", "Audit Log", "audit",
+        "SELECT a.created_at, a.action, a.entity_type, a.entity_id, u.name as user FROM activity_audit_log a LEFT JOIN system_users u ON a.user_id = u.phone ORDER BY a.created_at DESC",
+        ["created_at", "action", "entity_type", "entity_id", "user"]
+    )
+
+def bot_export_spec() -> Dict[str, Any]:
+    return _simple_spec(
+        "BotActivity", "Bot Activity", "bot_interactions",
+        "SELECT b.created_at, b.query, b.response, b.intent, u.name as user FROM bot_interactions b LEFT JOIN system_users u ON b.user_id = u.phone ORDER BY b.created_at DESC",
+        ["created_at", "query", "response", "intent", "user"]
+    )
+
+def merchants_export_spec() -> Dict[str, Any]:
+    return _simple_spec(
+        "Merchants", "Merchants", "merchants",
+        """
+            SELECT COALESCE(v.canonical_name, i.vendor_name) as vendor_name, COUNT(*) as invoices,
+                   SUM(i.total_amount) as total_spend, MAX(i.invoice_date) as last_seen
+            FROM invoices i
+            LEFT JOIN vendors v ON v.vendor_id = i.vendor_id
+            WHERE i.vendor_id IS NOT NULL OR i.vendor_name IS NOT NULL
+            GROUP BY v.vendor_id, COALESCE(v.canonical_name, i.vendor_name)
+            ORDER BY total_spend DESC
+        """,
+        ["vendor_name", "invoices", "total_spend", "last_seen"]
+    )
+
+def employees_export_spec() -> Dict[str, Any]:
+    return _simple_spec(
+        "Employees", "Employees", "employees",
+        "SELECT phone, name, role, is_approved, created_at FROM system_users ORDER BY name",
+        ["phone", "name", "role", "is_approved", "created_at"]
+    )
+
+def notifications_export_spec() -> Dict[str, Any]:
+    return _simple_spec(
+        "Notifications", "Notifications", "notifications",
+        "SELECT created_at, event_type, message, user_id FROM notification_events ORDER BY created_at DESC",
+        ["created_at", "event_type", "message", "user_id"]
+    )
+
+# --- Streaming core ---
+
+async def iter_chunks(query: str, params: Iterable[Any] = (), chunk_size: int = EXPORT_CHUNK_ROWS) -> AsyncIterator[list]:
     """
-    Generates a simple flat CSV/Excel export for invoices.
+    Yields the result of `query` in lists of at most `chunk_size` records,
+    read through a server-side cursor so the full result set is never in memory.
     """
     conn = await get_db_connection()
-    if not conn: return None
-    
+    if not conn:
+        raise RuntimeError("Database connection failed")
     try:
-        query = """
-            SELECT i.*, u.name as user_name 
-            FROM invoices i
-            LEFT JOIN system_users u ON i.user_id = u.phone
-            WHERE 1=1
-        """
-        params = []
-        if start_date and start_date not in ['null', 'undefined', '']:
-            p_idx = len(params) + 1
-            query += f" AND i.invoice_date >= ${p_idx}"
-            params.append(datetime.strptime(start_date, "%Y-%m-%d").date())
-            
-        if end_date and end_date not in ['null', 'undefined', '']:
-            p_idx = len(params) + 1
-            query += f" AND i.invoice_date <= ${p_idx}"
-            params.append(datetime.strptime(end_date, "%Y-%m-%d").date())
-            
-        if user_id:
-            p_idx = len(params) + 1
-            query += f" AND i.user_id = ${p_idx}"
-            params.append(user_id)
-            
-        query += " ORDER BY i.invoice_date DESC"
-        
-        rows = await conn.fetch(query, *params)
-        
-        if not rows: return None
-            
-        df = pd.DataFrame([dict(r) for r in rows])
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"Invoices_Export_{timestamp}.xlsx"
-        file_path = os.path.join(EXPORT_DIR, filename)
-        
-        # Convert date columns to string for better Excel compatibility
-        for col in ['invoice_date', 'created_at', 'updated_at']:
-            if col in df.columns:
-                df[col] = df[col].astype(str)
-
-        df.to_excel(file_path, index=False)
-        return file_path
+        # asyncpg cursors only live inside a transaction
+        async with conn.transaction():
+            cursor = await conn.cursor(query, *params)
+            while True:
+                rows = await cursor.fetch(chunk_size)
+                if not rows:
+                    break
+                yield rows
     finally:
         await conn.close()
 
-async def generate_advanced_report():
+def _append_rows(ws, columns: List[str], rows: list):
+    for row in rows:
+        ws.append([_cell(row[c]) for c in columns])
+
+async def _write_sheet(wb: Workbook, spec: Dict[str, Any], on_progress: Optional[Callable[[int], None]] = None) -> int:
+    ws = wb.create_sheet(spec["sheet"][:31])
+    ws.append(spec["columns"])
+    written = 0
+    async for rows in iter_chunks(spec["query"], spec["params"]):
+        # openpyxl serialization is CPU-bound; keep the event loop free
+        await asyncio.to_thread(_append_rows, ws, spec["columns"], rows)
+        written += len(rows)
+        if on_progress:
+            on_progress(written)
+    return written
+
+async def stream_csv(spec: Dict[str, Any], compress: bool = False,
+                     on_progress: Optional[Callable[[int], None]] = None) -> AsyncIterator[bytes]:
+    """ Yields CSV (optionally gzip) bytes chunk by chunk as rows arrive from the cursor. """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(spec["columns"])
+    gzip = zlib.compressobj(wbits=31) if compress else None
+    written = 0
+
+    async for rows in iter_chunks(spec["query"], spec["params"]):
+        for row in rows:
+            writer.writerow([_cell(row[c]) for c in spec["columns"]])
+        written += len(rows)
+        if on_progress:
+            on_progress(written)
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        data = gzip.compress(data) if gzip else data
+        if data:
+            yield data
+
+    # No rows: yield nothing, so callers can tell an empty export apart
+    if written and gzip:
+        yield gzip.flush()
+
+async def write_export(spec: Dict[str, Any], file_path: str, fmt: str = "xlsx",
+                       on_progress: Optional[Callable[[int], None]] = None) -> int:
+    """ Writes one spec to `file_path` in bounded memory; returns rows written. """
+    if fmt in ("parquet", "arrow"):
+        # pyarrow is only needed for columnar exports
+        from tools.columnar_export import write_columnar
+        return await write_columnar(spec, file_path, fmt, on_progress)
+
+    if fmt == "xlsx":
+        wb = Workbook(write_only=True)
+        written = await _write_sheet(wb, spec, on_progress)
+        await asyncio.to_thread(wb.save, file_path)
+        return written
+
+    written = 0
+    def _progress(count):
+        nonlocal written
+        written = count
+        if on_progress:
+            on_progress(count)
+
+    with open(file_path, "wb") as f:
+        async for data in stream_csv(spec, compress=(fmt == "csv.gz"), on_progress=_progress):
+            await asyncio.to_thread(f.write, data)
+    return written
+
+async def stream_export(spec: Dict[str, Any], fmt: str = "xlsx") -> AsyncIterator[bytes]:
+    """
+    Streams an export to an HTTP client. CSV is streamed as it is generated.
+    xlsx, Parquet and Arrow files carry their directory/footer at the end, so
+    they are written in bounded memory into a temp file and then streamed.
+    Yields nothing when the query returns no rows.
+    """
+    if fmt in STREAMABLE_FORMATS:
+        async for data in stream_csv(spec, compress=(fmt == "csv.gz")):
+            yield data
+        return
+
+    fd, tmp_path = tempfile.mkstemp(suffix=f".{fmt}", dir=EXPORT_DIR)
+    os.close(fd)
+    try:
+        if not await write_export(spec, tmp_path, fmt):
+            return
+        with open(tmp_path, "rb") as f:
+            while True:
+                data = await asyncio.to_thread(f.read, EXPORT_STREAM_BYTES)
+                if not data:
+                    break
+                yield data
+    finally:
+        os.remove(tmp_path)
+
+def export_filename(spec: Dict[str, Any], fmt: str = "xlsx") -> str:
+    return f"{spec['name']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+
+async def _export_to_file(spec: Dict[str, Any], fmt: str = "xlsx") -> Optional[str]:
+    """ Writes a spec into EXPORT_DIR; returns the path, or None if there was no data. """
+    file_path = os.path.join(EXPORT_DIR, export_filename(spec, fmt))
+    try:
+        written = await write_export(spec, file_path, fmt)
+    except Exception:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    if not written:
+        os.remove(file_path)
+        return None
+    logger.info(f"📤 Exported {written} rows to {os.path.basename(file_path)}")
+    return file_path
+
+# --- File generators (used by the WhatsApp export intent) ---
+
+async def generate_custom_export(start_date: str = None, end_date: str = None, user_id: str = None,
+                                 include: Iterable[str] = (), fmt: str = "xlsx"):
+    """
+    Generates a flat invoices export. Heavy columns (raw_text, embedding)
+    are left out unless listed in `include`.
+    """
+    return await _export_to_file(invoice_export_spec(start_date, end_date, user_id, include), fmt)
+
+async def generate_advanced_report(file_path: str = None, on_progress: Optional[Callable[[int], None]] = None):
     """
     Generates a professional multi-sheet Excel report:
     1. Summary Dashboard (Calculated stats)
-    2. Expenses by Category (Tabs for each category or grouped) - logic: One sheet with category grouping.
+    2. Expenses by Category (grouped by cost center)
     3. Expenses by Merchant
-    4. Full Raw Data
+    4. Full Raw Data (streamed)
+    Aggregates are computed in SQL so only the raw data sheet scales with table size.
     """
     conn = await get_db_connection()
     if not conn: return None
-    
+
     try:
-        # Fetch all approved invoices for the report
-        rows = await conn.fetch("""
-            SELECT i.invoice_id, i.invoice_date, i.vendor_name, i.total_amount, i.currency, 
-                   i.status, i.cost_center, u.name as employee
-            FROM invoices i
-            LEFT JOIN system_users u ON i.user_id = u.phone
-            WHERE i.status != 'rejected'
-            ORDER BY i.invoice_date DESC
+        summary = await conn.fetchrow("""
+            SELECT COUNT(*) AS invoices, COALESCE(SUM(total_amount), 0) AS total, AVG(COALESCE(total_amount, 0)) AS average
+            FROM invoices WHERE status != 'rejected'
         """)
-        
-        if not rows: return None
-        
-        data = [dict(r) for r in rows]
-        df = pd.DataFrame(data)
-        
-        # Clean data
-        df['total_amount'] = pd.to_numeric(df['total_amount'], errors='coerce').fillna(0)
-        df['vendor_name'] = df['vendor_name'].fillna('Unknown')
-        df['cost_center'] = df['cost_center'].fillna('Uncategorized')
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"Professional_Expense_Report_{timestamp}.xlsx"
-        file_path = os.path.join(EXPORT_DIR, filename)
-        
-        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-            # Sheet 1: Executive Summary
-            summary_data = {
-                'Metric': ['Total Spend', 'Total Invoices', 'Average Invoice Value', 'Top Vendor', 'Top Category'],
-                'Value': [
-                    df['total_amount'].sum(),
-                    len(df),
-                    df['total_amount'].mean(),
-                    df.groupby('vendor_name')['total_amount'].sum().idxmax() if not df.empty else 'N/A',
-                    df.groupby('cost_center')['total_amount'].sum().idxmax() if not df.empty else 'N/A'
-                ]
-            }
-            pd.DataFrame(summary_data).to_excel(writer, sheet_name='Executive Summary', index=False)
-            
-            # Sheet 2: By Category
-            cat_group = df.groupby('cost_center').agg({
-                'total_amount': 'sum',
-                'invoice_id': 'count'
-            }).reset_index().sort_values('total_amount', ascending=False)
-            cat_group.columns = ['Category', 'Total Spend', 'Invoice Count']
-            cat_group.to_excel(writer, sheet_name='By Category', index=False)
-            
-            # Sheet 3: By Merchant
-            merch_group = df.groupby('vendor_name').agg({
-                'total_amount': 'sum',
-                'invoice_id': 'count'
-            }).reset_index().sort_values('total_amount', ascending=False)
-            merch_group.columns = ['Merchant', 'Total Spend', 'Invoice Count']
-            merch_group.to_excel(writer, sheet_name='By Merchant', index=False)
-            
-            # Sheet 4: Raw Data (Sorted by Date)
-            df.sort_values('invoice_date', ascending=False).to_excel(writer, sheet_name='Raw Data', index=False)
-            
-        return file_path
+        if not summary["invoices"]:
+            return None
+
+        grouping = """
+            SELECT COALESCE({col}, '{fallback}') AS name, SUM(COALESCE(total_amount, 0)) AS total, COUNT(*) AS invoices
+            FROM invoices WHERE status != 'rejected'
+            GROUP BY 1 ORDER BY total DESC
+        """
+        by_category = await conn.fetch(grouping.format(col="cost_center", fallback="Uncategorized"))
+        by_merchant = await conn.fetch(grouping.format(col="vendor_name", fallback="Unknown"))
     finally:
         await conn.close()
 
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Executive Summary")
+    ws.append(["Metric", "Value"])
+    for metric, value in [
+        ("Total Spend", summary["total"]),
+        ("Total Invoices", summary["invoices"]),
+        ("Average Invoice Value", summary["average"]),
+        ("Top Vendor", by_merchant[0]["name"] if by_merchant else "N/A"),
+        ("Top Category", by_category[0]["name"] if by_category else "N/A")
+    ]:
+        ws.append([metric, _cell(value)])
+
+    for title, header, rows in [("By Category", "Category", by_category), ("By Merchant", "Merchant", by_merchant)]:
+        ws = wb.create_sheet(title)
+        ws.append([header, "Total Spend", "Invoice Count"])
+        for row in rows:
+            ws.append([row["name"], _cell(row["total"]), row["invoices"]])
+
+    raw = _simple_spec("Professional_Expense_Report", "Raw Data", "invoices", """
+        SELECT i.invoice_id, i.invoice_date, i.vendor_name, i.total_amount, i.currency,
+               i.status, i.cost_center, u.name as employee
+        FROM invoices i
+        LEFT JOIN system_users u ON i.user_id = u.phone
+        WHERE i.status != 'rejected'
+        ORDER BY i.invoice_date DESC
+    """, ["invoice_id", "invoice_date", "vendor_name", "total_amount", "currency", "status", "cost_center", "employee"])
+    await _write_sheet(wb, raw, on_progress)
+
+    file_path = file_path or os.path.join(EXPORT_DIR, export_filename(raw))
+    await asyncio.to_thread(wb.save, file_path)
+    return file_path
+
 async def generate_audit_export():
-    conn = await get_db_connection()
-    if not conn: return None
-    try:
-        rows = await conn.fetch("SELECT a.created_at, a.action, a.entity_type, a.entity_id, u.name as user FROM activity_audit_log a LEFT JOIN system_users u ON a.user_id = u.phone ORDER BY a.created_at DESC")
-        if not rows: return None
-        df = pd.DataFrame([dict(r) for r in rows])
-        for col in ['created_at']:
-            if col in df.columns: df[col] = df[col].astype(str)
-            
-        file_path = os.path.join(EXPORT_DIR, f"AuditLogs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
-        df.to_excel(file_path, index=False)
-        return file_path
-    finally:
-        await conn.close()
+    return await _export_to_file(audit_export_spec())
 
 async def generate_bot_export():
-    conn = await get_db_connection()
-    if not conn: return None
-    try:
-        rows = await conn.fetch("SELECT b.created_at, b.query, b.response, b.intent, u.name as user FROM bot_interactions b LEFT JOIN system_users u ON b.user_id = u.phone ORDER BY b.created_at DESC")
-        if not rows: return None
-        df = pd.DataFrame([dict(r) for r in rows])
-        for col in ['created_at']:
-            if col in df.columns: df[col] = df[col].astype(str)
-
-        file_path = os.path.join(EXPORT_DIR, f"BotActivity_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
-        df.to_excel(file_path, index=False)
-        return file_path
-    finally:
-        await conn.close()
+    return await _export_to_file(bot_export_spec())
 
 async def generate_merchants_export():
-    conn = await get_db_connection()
-    if not conn: return None
-    try:
-        rows = await conn.fetch("""
-            SELECT vendor_name, COUNT(*) as invoices, SUM(total_amount) as total_spend, MAX(invoice_date) as last_seen
-            FROM invoices
-            WHERE vendor_name IS NOT NULL
-            GROUP BY vendor_name
-            ORDER BY total_spend DESC
-        """)
-        if not rows: return None
-        df = pd.DataFrame([dict(r) for r in rows])
-        file_path = os.path.join(EXPORT_DIR, f"Merchants_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
-        df.to_excel(file_path, index=False)
-        return file_path
-    finally:
-        await conn.close()
+    return await _export_to_file(merchants_export_spec())
 
 async def generate_employees_export():
-    conn = await get_db_connection()
-    if not conn: return None
-    try:
-        rows = await conn.fetch("SELECT phone, name, role, is_approved, created_at FROM system_users ORDER BY name")
-        if not rows: return None
-        df = pd.DataFrame([dict(r) for r in rows])
-        for col in ['created_at']:
-             if col in df.columns: df[col] = df[col].astype(str)
-
-        file_path = os.path.join(EXPORT_DIR, f"Employees_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
-        df.to_excel(file_path, index=False)
-        return file_path
-    finally:
-        await conn.close()
+    return await _export_to_file(employees_export_spec())
 
 async def generate_notifications_export():
-    conn = await get_db_connection()
-    if not conn: return None
-    try:
-        rows = await conn.fetch("SELECT created_at, event_type, message, user_id FROM notification_events ORDER BY created_at DESC")
-        if not rows: return None
-        df = pd.DataFrame([dict(r) for r in rows])
-        for col in ['created_at']:
-            if col in df.columns: df[col] = df[col].astype(str)
-            
-        file_path = os.path.join(EXPORT_DIR, f"Notifications_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
-        df.to_excel(file_path, index=False)
-        return file_path
-    finally:
-        await conn.close()
+    return await _export_to_file(notifications_export_spec())
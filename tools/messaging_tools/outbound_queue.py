@@ -0,0 +1,289 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Meta's Cloud API throughput is per sending phone number
+OUTBOUND_RATE_PER_SECOND = float(os.getenv("OUTBOUND_RATE_PER_SECOND", 20))
+OUTBOUND_BURST = int(os.getenv("OUTBOUND_BURST", 20))
+# Texts to the same recipient arriving within this window are sent as one message
+OUTBOUND_COALESCE_WINDOW = float(os.getenv("OUTBOUND_COALESCE_WINDOW", 1.5))
+OUTBOUND_MAX_ATTEMPTS = int(os.getenv("OUTBOUND_MAX_ATTEMPTS", 5))
+OUTBOUND_BACKOFF_BASE = float(os.getenv("OUTBOUND_BACKOFF_BASE", 1))
+OUTBOUND_BACKOFF_MAX = float(os.getenv("OUTBOUND_BACKOFF_MAX", 60))
+OUTBOUND_DRAIN_TIMEOUT = float(os.getenv("OUTBOUND_DRAIN_TIMEOUT", 10))
+
+# WhatsApp rejects text bodies longer than this
+WA_MAX_TEXT_LENGTH = 4096
+
+class TokenBucket:
+    """ Allows `rate` acquisitions per second with bursts of up to `capacity`. """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> float:
+        """ Waits for a token; returns how long the caller was throttled. """
+        started = time.monotonic()
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+        return time.monotonic() - started
+
+def _split_text(text: str, limit: int = WA_MAX_TEXT_LENGTH) -> List[str]:
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text:
+        chunks.append(text)
+    return chunks
+
+def _is_retryable(status: int) -> bool:
+    return status == 429 or status >= 500
+
+class OutboundQueue:
+    """
+    Outbound WhatsApp text queue; every user-facing text goes through it
+    (send_whatsapp enqueues with immediate=True), so per-user order and the
+    rate limit hold across notifications and interactive replies.
+
+    - Texts to the same recipient within OUTBOUND_COALESCE_WINDOW are joined into one message;
+      an immediate text flushes the recipient's pending texts together with it, in order.
+    - Sends go through a token bucket per sending phone ID.
+    - 429/5xx responses and transport errors are retried with exponential backoff;
+      other errors, or exhausting OUTBOUND_MAX_ATTEMPTS, drop the message (counted).
+    - Each recipient has at most one batch in flight, so messages stay in order.
+
+    enqueue() returns immediately with a future that resolves to True/False once
+    the message is delivered or dropped; callers don't have to await it.
+    """
+
+    def __init__(self, sender: Optional[Callable[[str, str], Awaitable[Any]]] = None,
+                 rate: float = OUTBOUND_RATE_PER_SECOND, burst: int = OUTBOUND_BURST,
+                 coalesce_window: float = OUTBOUND_COALESCE_WINDOW, max_attempts: int = OUTBOUND_MAX_ATTEMPTS,
+                 backoff_base: float = OUTBOUND_BACKOFF_BASE, backoff_max: float = OUTBOUND_BACKOFF_MAX):
+        self._sender = sender
+        self.rate = rate
+        self.burst = burst
+        self.coalesce_window = coalesce_window
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._inflight: Dict[str, List[Dict[str, Any]]] = {}  # recipient -> items of its batch in flight
+        self._ready: Optional[asyncio.Queue] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._send_tasks: Set[asyncio.Task] = set()
+        self._depth = 0
+        self.stats = {
+            "enqueued": 0, "delivered": 0, "dropped": 0, "api_calls": 0, "coalesced": 0,
+            "retries": 0, "throttled_seconds": 0.0,
+            "latency_total": 0.0, "latency_max": 0.0, "last_latency": 0.0
+        }
+
+    # --- Sending backend ---
+
+    async def _send(self, recipient: str, text: str) -> int:
+        """ Returns the HTTP status (200 when WhatsApp is not configured / simulated). """
+        if self._sender is not None:
+            result = await self._sender(recipient, text)
+        else:
+            from tools.messaging_tools.whatsapp import send_text_message
+            result = await send_text_message(recipient, text)
+        if result is None:
+            return 200
+        return result if isinstance(result, int) else result.status_code
+
+    def _phone_id(self) -> str:
+        return os.getenv("WA_PHONE_ID") or "default"
+
+    def _bucket(self, phone_id: str) -> TokenBucket:
+        bucket = self._buckets.get(phone_id)
+        if bucket is None:
+            bucket = self._buckets[phone_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    # --- Public API ---
+
+    def start(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._ready = asyncio.Queue()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    def enqueue(self, recipient: str, text: str, immediate: bool = False) -> asyncio.Future:
+        """ immediate: skip the coalesce window (interactive replies); still sent after earlier texts. """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(recipient, []).append({"text": text, "future": future, "enqueued_at": time.monotonic()})
+        self._depth += 1
+        self.stats["enqueued"] += 1
+        if recipient in self._inflight:
+            pass  # _finish() flushes whatever arrived meanwhile
+        elif immediate:
+            timer = self._timers.pop(recipient, None)
+            if timer:
+                timer.cancel()
+            self._flush(recipient)
+        elif recipient not in self._timers:
+            self._schedule_flush(recipient, self.coalesce_window)
+        return future
+
+    async def drain(self, recipient: str):
+        """ Sends the recipient's pending texts now and waits until they and any in-flight batch are done. """
+        futures = [item["future"] for item in self._inflight.get(recipient, []) + self._pending.get(recipient, [])]
+        timer = self._timers.pop(recipient, None)
+        if timer:
+            timer.cancel()
+            self._flush(recipient)
+        if futures:
+            await asyncio.gather(*futures)
+
+    async def stop(self, timeout: float = OUTBOUND_DRAIN_TIMEOUT):
+        """ Flushes everything pending and waits (bounded) for in-flight sends. """
+        if self._dispatcher is None:
+            return
+        for recipient in list(self._timers):
+            self._timers.pop(recipient).cancel()
+            self._flush(recipient)
+
+        deadline = time.monotonic() + timeout
+        while self._depth and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._depth:
+            logger.warning(f"Outbound queue stopped with {self._depth} undelivered message(s)")
+
+        self._dispatcher.cancel()
+        for task in list(self._send_tasks):
+            task.cancel()
+        await asyncio.gather(self._dispatcher, *self._send_tasks, return_exceptions=True)
+        self._dispatcher = None
+
+    # --- Internals ---
+
+    def _schedule_flush(self, recipient: str, delay: float):
+        loop = asyncio.get_running_loop()
+        self._timers[recipient] = loop.call_later(delay, self._flush, recipient)
+
+    def _flush(self, recipient: str):
+        self._timers.pop(recipient, None)
+        if recipient in self._inflight:
+            return
+        items = self._pending.pop(recipient, [])
+        if not items:
+            return
+        self._inflight[recipient] = items
+        text = "\n\n".join(item["text"] for item in items)
+        self._ready.put_nowait({
+            "recipient": recipient,
+            "items": items,
+            "chunks": _split_text(text),
+            "sent": 0,
+            "attempt": 0
+        })
+
+    async def _dispatch(self):
+        while True:
+            batch = await self._ready.get()
+            try:
+                self.stats["throttled_seconds"] += await self._bucket(self._phone_id()).acquire()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbound rate limiter failed: {e}")
+            task = asyncio.create_task(self._deliver(batch))
+            self._send_tasks.add(task)
+            task.add_done_callback(self._send_tasks.discard)
+
+    async def _deliver(self, batch: Dict[str, Any]):
+        recipient = batch["recipient"]
+        while batch["sent"] < len(batch["chunks"]):
+            if batch["sent"] > 0:
+                # Continuation chunks of a long message also count against the rate limit
+                self.stats["throttled_seconds"] += await self._bucket(self._phone_id()).acquire()
+            try:
+                status = await self._send(recipient, batch["chunks"][batch["sent"]])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Outbound send to {recipient} failed: {e}")
+                status = 0
+            self.stats["api_calls"] += 1
+
+            if status == 200:
+                batch["sent"] += 1
+                continue
+
+            batch["attempt"] += 1
+            if (status and not _is_retryable(status)) or batch["attempt"] >= self.max_attempts:
+                self._finish(batch, delivered=False)
+                logger.error(f"📭 Dropped {len(batch['items'])} message(s) to {recipient} (status {status or 'error'}, attempt {batch['attempt']})")
+                return
+
+            backoff = min(self.backoff_max, self.backoff_base * (2 ** (batch["attempt"] - 1)))
+            backoff *= random.uniform(0.8, 1.2)
+            self.stats["retries"] += 1
+            await asyncio.sleep(backoff)
+            self.stats["throttled_seconds"] += await self._bucket(self._phone_id()).acquire()
+
+        self._finish(batch, delivered=True)
+
+    def _finish(self, batch: Dict[str, Any], delivered: bool):
+        recipient = batch["recipient"]
+        now = time.monotonic()
+        for item in batch["items"]:
+            if not item["future"].done():
+                item["future"].set_result(delivered)
+            if delivered:
+                latency = now - item["enqueued_at"]
+                self.stats["latency_total"] += latency
+                self.stats["latency_max"] = max(self.stats["latency_max"], latency)
+                self.stats["last_latency"] = latency
+
+        count = len(batch["items"])
+        self._depth -= count
+        if delivered:
+            self.stats["delivered"] += count
+            self.stats["coalesced"] += count - 1
+        else:
+            self.stats["dropped"] += count
+
+        self._inflight.pop(recipient, None)
+        # Anything that arrived while this batch was in flight goes next
+        if self._pending.get(recipient) and recipient not in self._timers:
+            self._schedule_flush(recipient, 0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        delivered = self.stats["delivered"] or 1
+        return {
+            **self.stats,
+            "depth": self._depth,
+            "waiting_recipients": len(self._pending),
+            "inflight_recipients": len(self._inflight),
+            "avg_latency": round(self.stats["latency_total"] / delivered, 3),
+            "rate_per_second": self.rate
+        }
+
+outbound_queue = OutboundQueue()
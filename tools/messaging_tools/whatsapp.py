@@ -1,19 +1,65 @@
 import httpx
 import os
+from typing import Optional
 
 WA_TOKEN = os.getenv("WA_TOKEN")
 WA_PHONE_ID = os.getenv("WA_PHONE_ID")
 
-async def send_whatsapp(user_phone, text):
-    global WA_TOKEN, WA_PHONE_ID
-    if not WA_TOKEN: WA_TOKEN = os.getenv("WA_TOKEN")
+WA_HTTP_MAX_CONNECTIONS = int(os.getenv("WA_HTTP_MAX_CONNECTIONS", 20))
+WA_HTTP_MAX_KEEPALIVE = int(os.getenv("WA_HTTP_MAX_KEEPALIVE", 10))
+WA_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("WA_HTTP_KEEPALIVE_EXPIRY", 60))
+WA_HTTP2 = os.getenv("WA_HTTP2", "true").lower() == "true"
+
+# One client for the whole process: keeps TLS connections to graph.facebook.com
+# alive (and multiplexed over HTTP/2) instead of a new handshake per message.
+_http_client: Optional[httpx.AsyncClient] = None
+
+def init_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        limits = httpx.Limits(
+            max_connections=WA_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=WA_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=WA_HTTP_KEEPALIVE_EXPIRY
+        )
+        timeout = httpx.Timeout(10.0, connect=5.0)
+        try:
+            _http_client = httpx.AsyncClient(http2=WA_HTTP2, limits=limits, timeout=timeout)
+        except ImportError:
+            # http2=True needs the 'h2' package (httpx[http2])
+            print("⚠️ h2 not installed, WhatsApp client falling back to HTTP/1.1")
+            _http_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+    return _http_client
+
+def get_http_client() -> httpx.AsyncClient:
+    """ Shared client; created lazily for scripts that never ran the app startup hook. """
+    return init_http_client()
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def get_phone_id() -> Optional[str]:
+    global WA_PHONE_ID
     if not WA_PHONE_ID: WA_PHONE_ID = os.getenv("WA_PHONE_ID")
+    return WA_PHONE_ID
+
+async def send_text_message(user_phone, text) -> Optional[httpx.Response]:
+    """
+    Posts one text message and returns the raw response (None when WhatsApp is
+    not configured). Transport errors are raised so callers can decide to retry.
+    """
+    global WA_TOKEN
+    if not WA_TOKEN: WA_TOKEN = os.getenv("WA_TOKEN")
+    phone_id = get_phone_id()
 
-    if not WA_TOKEN or not WA_PHONE_ID:
+    if not WA_TOKEN or not phone_id:
         print(f"⚠️ WhatsApp not configured. Simulation: To {user_phone}: {text}")
-        return False
+        return None
         
-    url = f"https://graph.facebook.com/v17.0/{WA_PHONE_ID}/messages"
+    url = f"https://graph.facebook.com/v17.0/{phone_id}/messages"
     headers = {
         "Authorization": f"Bearer {WA_TOKEN}",
         "Content-Type": "application/json"
@@ -26,19 +72,26 @@ async def send_whatsapp(user_phone, text):
         "text": {"body": text}
     }
     
-    async with httpx.AsyncClient() as client:
-        try:
-            print(f"📤 [WA_SEND] phone={user_phone}, text_len={len(text)}")
-            response = await client.post(url, headers=headers, json=payload, timeout=10.0)
-            if response.status_code == 200:
-                print(f"✅ [WA_SUCCESS] to={user_phone}")
-                return True
-            else:
-                print(f"❌ [WA_ERROR] status={response.status_code}, body={response.text}")
-                return False
-        except Exception as e:
-            print(f"❌ [WA_EXCEPTION] {e}")
-            return False
+    print(f"📤 [WA_SEND] phone={user_phone}, text_len={len(text)}")
+    response = await get_http_client().post(url, headers=headers, json=payload, timeout=10.0)
+    if response.status_code == 200:
+        print(f"✅ [WA_SUCCESS] to={user_phone}")
+    else:
+        print(f"❌ [WA_ERROR] status={response.status_code}, body={response.text}")
+    return response
+
+async def send_whatsapp(user_phone, text):
+    """
+    Sends a reply through the outbound queue without the coalesce window: it goes
+    out right after anything already queued for the user (e.g. "invoice received"),
+    under the shared rate limit and retries. Returns True once delivered.
+    """
+    from tools.messaging_tools.outbound_queue import outbound_queue
+    try:
+        return await outbound_queue.enqueue(user_phone, text, immediate=True)
+    except Exception as e:
+        print(f"❌ [WA_EXCEPTION] {e}")
+        return False
 
 async def mark_read(message_id):
     if not WA_TOKEN or not WA_PHONE_ID: return
@@ -49,8 +102,7 @@ async def mark_read(message_id):
         "status": "read",
         "message_id": message_id
     }
-    async with httpx.AsyncClient() as client:
-        await client.post(url, headers=headers, json=payload)
+    await get_http_client().post(url, headers=headers, json=payload, timeout=5.0)
 
 async def upload_media(file_path, mime_type):
     global WA_TOKEN, WA_PHONE_ID
@@ -68,15 +120,14 @@ async def upload_media(file_path, mime_type):
             }
             data = {'messaging_product': 'whatsapp'}
             
-            async with httpx.AsyncClient() as client:
-                print(f"📤 Uploading media: {file_path}")
-                response = await client.post(url, headers=headers, files=files, data=data, timeout=30.0)
-                
-                if response.status_code == 200:
-                    return response.json().get("id")
-                else:
-                    print(f"❌ Upload Error: {response.text}")
-                    return None
+            print(f"📤 Uploading media: {file_path}")
+            response = await get_http_client().post(url, headers=headers, files=files, data=data, timeout=30.0)
+            
+            if response.status_code == 200:
+                return response.json().get("id")
+            else:
+                print(f"❌ Upload Error: {response.text}")
+                return None
     except Exception as e:
         print(f"❌ Upload Exception: {e}")
         return None
@@ -104,16 +155,47 @@ async def send_whatsapp_document(user_phone, media_id, filename, caption=None):
     
     if caption:
         payload["document"]["caption"] = caption
-        
-    async with httpx.AsyncClient() as client:
-        try:
-            print(f"📤 Sending Document to {user_phone}: {filename}")
-            response = await client.post(url, headers=headers, json=payload, timeout=10.0)
-            if response.status_code == 200:
-                return True
-            else:
-                print(f"❌ WA Document Error: {response.text}")
-                return False
-        except Exception as e:
-            print(f"❌ WA Document Exception: {e}")
+
+    # Texts queued for the user before this document go out first
+    from tools.messaging_tools.outbound_queue import outbound_queue
+    await outbound_queue.drain(user_phone)
+
+    try:
+        print(f"📤 Sending Document to {user_phone}: {filename}")
+        response = await get_http_client().post(url, headers=headers, json=payload, timeout=10.0)
+        if response.status_code == 200:
+            return True
+        else:
+            print(f"❌ WA Document Error: {response.text}")
             return False
+    except Exception as e:
+        print(f"❌ WA Document Exception: {e}")
+        return False
+
+async def download_wa_media(media_id, mime_type):
+    global WA_TOKEN
+    if not WA_TOKEN: WA_TOKEN = os.getenv("WA_TOKEN")
+    if not WA_TOKEN: return None
+    url = f"https://graph.facebook.com/v17.0/{media_id}"
+    headers = {"Authorization": f"Bearer {WA_TOKEN}"}
+    
+    client = get_http_client()
+    res = await client.get(url, headers=headers, timeout=10.0)
+    if res.status_code != 200: return None
+    media_url = res.json().get("url")
+    
+    # Download actual file
+    res = await client.get(media_url, headers=headers, timeout=60.0)
+    if res.status_code != 200: return None
+    
+    # Determine extension
+    ext = "bin"
+    if "pdf" in mime_type: ext = "pdf"
+    elif "png" in mime_type: ext = "png"
+    elif "jpeg" in mime_type or "jpg" in mime_type: ext = "jpg"
+    
+    os.makedirs("uploads", exist_ok=True)
+    local_path = os.path.join("uploads", f"{media_id}.{ext}")
+    with open(local_path, "wb") as f:
+        f.write(res.content)
+    return local_path
@@ -2,7 +2,7 @@ import logging
 import json
 from typing import Dict, Any, Optional
 from storage.postgres_repository import get_db_connection
-from tools.messaging_tools.whatsapp import send_whatsapp
+from tools.messaging_tools.outbound_queue import outbound_queue
 
 logger = logging.getLogger(__name__)
 
@@ -74,8 +74,8 @@ class NotificationEngine:
                 VALUES ($1, $2, $3, $4)
             """, user_id, event_type, message, json.dumps(payload, default=str))
             
-            # Send via WhatsApp
-            await send_whatsapp(user_id, message)
+            # Send via WhatsApp (queued: rate-limited, retried, coalesced per recipient)
+            outbound_queue.enqueue(user_id, message)
 
             # Broadcast to WebSockets
             if NotificationEngine.broadcaster:
@@ -1,6 +1,9 @@
 from typing import Dict, Any, List, Optional
 import logging
 from storage.postgres_repository import get_db_connection, sanitize_file_url
+from storage.response_cache import bump_data_version
+from storage.vendor_registry import vendor_registry
+from storage.invoice_repository import fetch_invoice, fetch_line_items, load_heavy
 from tools.finance_tools.reporting_engine import ReportingEngine
 import asyncpg
 from datetime import datetime, timedelta
@@ -58,6 +61,7 @@ class QueryEngine:
                     await conn.execute("DELETE FROM invoices WHERE user_id = $1", user_id)
                 else:
                     await conn.execute("DELETE FROM invoices") # Master clear for admin
+                bump_data_version()
                 return {"results": [], "query_meta": {"intent": "clear_data", "success": True}}
             elif intent == "finance_scenario":
                 return await QueryEngine._handle_finance_scenario(conn, user_id, role, entities)
@@ -139,9 +143,12 @@ class QueryEngine:
         # Filters
         vendor = entities.get("vendor")
         if vendor:
-            query += f" AND vendor_name ILIKE ${param_idx}"
+            # Fuzzy match against the vendor registry (trigram index), then join by id;
+            # invoices not yet linked to a vendor still match by raw name
+            query += f" AND (i.vendor_id = ANY(${param_idx}::uuid[]) OR (i.vendor_id IS NULL AND i.vendor_name ILIKE ${param_idx + 1}))"
+            params.append(await vendor_registry.search(conn, vendor))
             params.append(f"%{vendor}%")
-            param_idx += 1
+            param_idx += 2
             
         amount_filter = entities.get("amount_filter")
         if amount_filter:
@@ -179,20 +186,21 @@ class QueryEngine:
             return {"error": "Specific invoice not identified. Which one are you referring to?"}
             
         # Check permissions first
-        invoice = await conn.fetchrow("SELECT * FROM invoices WHERE invoice_id = $1", invoice_id)
+        invoice = await fetch_invoice(conn, invoice_id, "detail")
         if not invoice:
             return {"error": "Invoice not found"}
             
         if role != "admin" and invoice['user_id'] != user_id:
             return {"error": "You do not have permission to view this invoice"}
             
-        items = await conn.fetch("SELECT * FROM invoice_line_items WHERE invoice_id = $1", invoice_id)
+        items = await fetch_line_items(conn, invoice_id)
+        # The document text is loaded only now that the caller may see it (answers can quote it)
+        invoice.update(await load_heavy(conn, invoice_id, ["raw_text"]))
         
-        d = dict(invoice)
-        d["file_url"] = sanitize_file_url(d.get("file_url"))
+        invoice["file_url"] = sanitize_file_url(invoice.get("file_url"))
         return {
-            "summary": d,
-            "line_items": [dict(i) for i in items],
+            "summary": invoice,
+            "line_items": items,
             "query_meta": {"intent": "invoice_detail", "invoice_id": invoice_id}
         }
 
@@ -205,73 +213,52 @@ class QueryEngine:
     @staticmethod
     async def _handle_semantic_search(conn, user_id, role, entities):
         """
-        Semantic search using vector embeddings.
-        Finds invoices by natural language description.
+        Hybrid search: full-text matches (exact tokens such as invoice numbers)
+        fused with vector similarity (natural language descriptions).
         """
         search_query = entities.get("search_query", "")
         if not search_query:
             return {"error": "No search query provided", "query_meta": {"intent": "semantic_search"}}
-        
-        # Generate embedding for the search query
+
+        # Generate embedding for the search query; keyword search still runs without it
         from tools.document_tools.extraction_tools import generate_embedding
+        from tools.search_tools.hybrid_search import hybrid_search
         query_embedding = await generate_embedding(search_query)
-        
         if not query_embedding:
-            # Fallback to regular text search
-            logger.warning("Embedding generation failed, falling back to text search")
-            entities["vendor"] = search_query
-            return await QueryEngine._handle_invoice_search(conn, user_id, role, entities)
-        
-        # Vector similarity search using cosine distance
-        # Lower distance = more similar
-        query = """
-            SELECT i.invoice_id, i.vendor_name, i.total_amount, i.currency, 
-                   i.invoice_date, i.status, i.file_url, i.raw_text, u.name as user_name,
-                   (i.embedding <=> $1::vector) as distance
-            FROM invoices i
-            LEFT JOIN system_users u ON i.user_id = u.phone
-            WHERE i.embedding IS NOT NULL
-        """
-        params = [str(query_embedding)]
-        param_idx = 2
-        
-        # Apply permissions
-        if role != "admin":
-            query += f" AND i.user_id = ${param_idx}"
-            params.append(user_id)
-            param_idx += 1
-        
-        # Order by similarity and limit results
-        query += " ORDER BY distance ASC LIMIT 10"
-        
-        try:
-            rows = await conn.fetch(query, *params)
-            results = []
-            for i, r in enumerate(rows):
-                d = dict(r)
-                d["file_url"] = sanitize_file_url(d.get("file_url"))
-                # Include similarity score (convert distance to similarity percentage)
-                d["similarity"] = max(0, min(100, (1 - d["distance"]) * 100))
-                
-                # Only include full raw_text for the top 3 results to save tokens
-                if i >= 3:
-                     d["raw_text"] = d.get("raw_text", "")[:200] + "..." if d.get("raw_text") else None
-                
-                results.append(d)
-            
-            return {
-                "results": results,
-                "query_meta": {
-                    "intent": "semantic_search",
-                    "search_query": search_query,
-                    "method": "vector_similarity"
-                }
+            logger.warning("Embedding generation failed, using keyword search only")
+
+        found = await hybrid_search(
+            conn, search_query, query_embedding,
+            user_id=user_id if role != "admin" else None
+        )
+        if not found["results"]:
+            # Neither side matched (or both failed): fall back to the vendor registry / name search
+            fallback = await QueryEngine._handle_invoice_search(conn, user_id, role, {**entities, "vendor": search_query})
+            fallback["query_meta"] = {
+                "intent": "semantic_search",
+                "search_query": search_query,
+                "method": "vendor_fallback",
+                "candidates": found["candidates"]
             }
-        except Exception as e:
-            logger.error(f"Vector search failed: {e}")
-            # Fallback to text search
-            entities["vendor"] = search_query
-            return await QueryEngine._handle_invoice_search(conn, user_id, role, entities)
+            return fallback
+
+        results = []
+        for i, d in enumerate(found["results"]):
+            d["file_url"] = sanitize_file_url(d.get("file_url"))
+            # Only include full raw_text for the top 3 results to save tokens
+            if i >= 3:
+                d["raw_text"] = d.get("raw_text", "")[:200] + "..." if d.get("raw_text") else None
+            results.append(d)
+
+        return {
+            "results": results,
+            "query_meta": {
+                "intent": "semantic_search",
+                "search_query": search_query,
+                "method": found["method"],
+                "candidates": found["candidates"]
+            }
+        }
 
     @staticmethod
     async def _handle_finance_scenario(conn, user_id, role, entities):
@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Add root to path for imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from dotenv import load_dotenv
+from storage.postgres_repository import get_db_connection, close_db_pool
+
+async def rebuild_rollup(verify: bool = False):
+    """ Recomputes daily_spend_rollup from invoices (invoice writes wait meanwhile). """
+    conn = await get_db_connection()
+    if not conn:
+        print("❌ Failed to connect to PostgreSQL")
+        return False
+
+    try:
+        started = time.time()
+        async with conn.transaction():
+            rows = await conn.fetchval("SELECT rebuild_daily_spend_rollup()")
+        print(f"✅ Rebuilt daily_spend_rollup: {rows} row(s) in {time.time() - started:.1f}s")
+
+        if verify:
+            mismatch = await conn.fetchrow("""
+                SELECT
+                    (SELECT COUNT(*) FROM invoices WHERE invoice_date IS NOT NULL) AS invoices,
+                    (SELECT COALESCE(SUM(invoice_count), 0) FROM daily_spend_rollup) AS rolled_up,
+                    (SELECT COALESCE(SUM(total_amount), 0) FROM invoices WHERE invoice_date IS NOT NULL) AS invoice_total,
+                    (SELECT COALESCE(SUM(total_amount), 0) FROM daily_spend_rollup) AS rollup_total
+            """)
+            ok = mismatch["invoices"] == mismatch["rolled_up"] and mismatch["invoice_total"] == mismatch["rollup_total"]
+            print(f"{'✅' if ok else '❌'} Verify: {dict(mismatch)}")
+            return ok
+        return True
+    finally:
+        await conn.close()
+        await close_db_pool()
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Rebuild the daily_spend_rollup table from invoices.")
+    parser.add_argument("--verify", action="store_true", help="Compare rollup totals with invoices after rebuilding")
+    args = parser.parse_args()
+
+    if not asyncio.run(rebuild_rollup(verify=args.verify)):
+        sys.exit(1)
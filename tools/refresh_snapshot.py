@@ -0,0 +1,37 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Add root to path for imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from dotenv import load_dotenv
+from storage.postgres_repository import close_db_pool
+
+async def refresh(snapshot_dir: str = None, full: bool = False):
+    """ Updates the month-partitioned Parquet snapshot (only changed months are rewritten). """
+    from tools.columnar_export import SNAPSHOT_DIR, refresh_snapshot
+
+    try:
+        started = time.time()
+        summary = await refresh_snapshot(snapshot_dir or SNAPSHOT_DIR, full=full)
+        print(f"✅ Snapshot at {snapshot_dir or SNAPSHOT_DIR}: rewrote {len(summary['rewritten'])} month(s), "
+              f"removed {len(summary['removed'])}, {summary['invoices_written']} invoice(s) in {time.time() - started:.1f}s")
+        return True
+    except Exception as e:
+        print(f"❌ Snapshot refresh failed: {e}")
+        return False
+    finally:
+        await close_db_pool()
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Refresh the month-partitioned Parquet snapshot of invoices and line items.")
+    parser.add_argument("--dir", help="Snapshot directory (default: SNAPSHOT_DIR)")
+    parser.add_argument("--full", action="store_true", help="Rewrite every month instead of only changed ones")
+    args = parser.parse_args()
+
+    if not asyncio.run(refresh(args.dir, full=args.full)):
+        sys.exit(1)
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import os
 import sys
@@ -5,36 +6,49 @@ import sys
 # Add root to path for imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from storage.postgres_repository import get_db_connection
+from dotenv import load_dotenv
+from storage.postgres_repository import (
+    get_db_connection,
+    get_pending_migrations,
+    run_pg_migrations,
+    close_db_pool
+)
 
-async def run_migrations():
+async def check_migrations():
+    """ Reports pending migrations without applying them. Returns the pending count. """
     conn = await get_db_connection()
     if not conn:
         print("❌ Failed to connect to PostgreSQL")
-        return
-    
-    migration_path = os.path.join(os.getcwd(), "storage", "migrations", "01_invoice_tables.sql")
-    if not os.path.exists(migration_path):
-        # Try relative to script
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        migration_path = os.path.join(script_dir, "..", "storage", "migrations", "01_invoice_tables.sql")
-        
-    if not os.path.exists(migration_path):
-        print(f"❌ Migration file not found: {migration_path}")
-        return
-
-    print(f"🚀 Running migration: {migration_path}...")
-    
-    with open(migration_path, "r") as f:
-        sql = f.read()
+        return -1
 
     try:
-        await conn.execute(sql)
-        print("✅ Migration applied successfully!")
-    except Exception as e:
-        print(f"❌ Error applying migration: {e}")
+        pending = await get_pending_migrations(conn)
     finally:
         await conn.close()
 
+    if not pending:
+        print("✅ No pending migrations.")
+    else:
+        print(f"📋 {len(pending)} pending migration(s):")
+        for migration in pending:
+            print(f"   - {migration['filename']} ({migration['checksum'][:12]})")
+    return len(pending)
+
+async def run_migrations(check_only: bool = False):
+    try:
+        if check_only:
+            return await check_migrations()
+        await run_pg_migrations()
+        return 0
+    finally:
+        await close_db_pool()
+
 if __name__ == "__main__":
-    asyncio.run(run_migrations())
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Apply pending PostgreSQL migrations.")
+    parser.add_argument("--check", action="store_true", help="List pending migrations without applying them (exit code 1 if any are pending)")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_migrations(check_only=args.check))
+    if args.check and result != 0:
+        sys.exit(1)
@@ -0,0 +1,125 @@
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+from storage.invoice_repository import projection_columns
+from tools.search_tools.vector_search import vector_searcher
+
+logger = logging.getLogger(__name__)
+
+# Relative weight of each ranking in the fused score
+HYBRID_KEYWORD_WEIGHT = float(os.getenv("HYBRID_KEYWORD_WEIGHT", 1.0))
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", 1.0))
+# Candidates taken from each side before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 50))
+# RRF damping constant; 60 is the value from the original RRF paper
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", 60))
+HYBRID_RESULT_LIMIT = int(os.getenv("HYBRID_RESULT_LIMIT", 10))
+
+# Must match the config of the invoices.search_tsv generated column (migration 017)
+TS_CONFIG = "simple"
+
+# Summary projection plus the OCR text, which answers quote from
+RESULT_COLUMNS = ", ".join(projection_columns("summary", include=["raw_text"]))
+
+def reciprocal_rank_fusion(rankings: Dict[str, Sequence[Any]], weights: Dict[str, float],
+                           k: int = HYBRID_RRF_K) -> List[Dict[str, Any]]:
+    """
+    Fuses ranked id lists: score(id) = sum over lists of weight / (k + rank),
+    rank starting at 1. Returns [{"id", "score", "<name>_rank", ...}] best first.
+    Rank-based, so the keyword and vector scores never need a common scale.
+    """
+    fused: Dict[Any, Dict[str, Any]] = {}
+    for name, ids in rankings.items():
+        weight = weights.get(name, 1.0)
+        for rank, item_id in enumerate(ids, start=1):
+            entry = fused.setdefault(item_id, {"id": item_id, "score": 0.0})
+            entry["score"] += weight / (k + rank)
+            entry[f"{name}_rank"] = rank
+    # Ties (same ranks on both sides) keep first-seen order, i.e. keyword first
+    return sorted(fused.values(), key=lambda e: e["score"], reverse=True)
+
+# OR of the query's lexemes: 'simple' has no stop words, so requiring every
+# token ("coffee I bought last week") would match almost nothing. Invoices
+# matching more (and closer) lexemes rank higher through ts_rank_cd.
+ANY_LEXEME_TSQUERY = f"""
+    SELECT string_agg(quote_literal(lexeme), ' | ')::tsquery
+    FROM unnest(to_tsvector('{TS_CONFIG}', $1))
+"""
+
+async def keyword_candidates(conn, query: str, user_id: Optional[str], limit: int) -> List[Dict[str, Any]]:
+    """ Full-text matches of any query term over vendor_name + raw_text through the GIN index, best ts_rank_cd first. """
+    sql = f"""
+        SELECT i.invoice_id, ts_rank_cd(i.search_tsv, q) AS rank
+        FROM invoices i, ({ANY_LEXEME_TSQUERY}) AS t(q)
+        WHERE i.search_tsv @@ q
+    """
+    params: List[Any] = [query]
+    if user_id:
+        params.append(user_id)
+        sql += f" AND i.user_id = ${len(params)}"
+    params.append(limit)
+    sql += f" ORDER BY rank DESC, i.invoice_date DESC NULLS LAST LIMIT ${len(params)}"
+    return [dict(r) for r in await conn.fetch(sql, *params)]
+
+async def vector_candidates(conn, embedding: List[float], user_id: Optional[str], limit: int) -> List[Dict[str, Any]]:
+    """ Nearest invoices by cosine distance (exact scan for small tenants, tuned HNSW otherwise). """
+    return await vector_searcher.search(conn, embedding, user_id, limit)
+
+async def hybrid_search(conn, query: str, embedding: Optional[List[float]], user_id: Optional[str] = None,
+                        limit: int = HYBRID_RESULT_LIMIT, candidates: int = HYBRID_CANDIDATES,
+                        keyword_weight: float = HYBRID_KEYWORD_WEIGHT,
+                        vector_weight: float = HYBRID_VECTOR_WEIGHT) -> Dict[str, Any]:
+    """
+    Keyword + vector retrieval fused with reciprocal-rank fusion.
+
+    Each side contributes its top `candidates`; without an embedding (or with
+    vector_weight 0) it degrades to keyword-only, and vice versa. user_id
+    restricts both sides to that user's invoices.
+    Returns {"results": [...], "method": ..., "candidates": {...}}.
+    """
+    rankings: Dict[str, List[Any]] = {}
+    distances: Dict[Any, float] = {}
+
+    if keyword_weight > 0:
+        try:
+            rows = await keyword_candidates(conn, query, user_id, candidates)
+            rankings["keyword"] = [r["invoice_id"] for r in rows]
+        except Exception as e:
+            logger.error(f"Keyword search failed: {e}")
+
+    if embedding and vector_weight > 0:
+        try:
+            rows = await vector_candidates(conn, embedding, user_id, candidates)
+            rankings["vector"] = [r["invoice_id"] for r in rows]
+            distances = {r["invoice_id"]: r["distance"] for r in rows}
+        except Exception as e:
+            logger.error(f"Vector search failed: {e}")
+
+    fused = reciprocal_rank_fusion(rankings, {"keyword": keyword_weight, "vector": vector_weight})[:limit]
+    method = "hybrid_rrf" if len(rankings) == 2 else next(iter(rankings), "none")
+    meta = {"method": method, "candidates": {name: len(ids) for name, ids in rankings.items()}}
+    if not fused:
+        return {"results": [], **meta}
+
+    rows = await conn.fetch(f"""
+        SELECT {RESULT_COLUMNS}
+        FROM invoices i
+        LEFT JOIN system_users u ON i.user_id = u.phone
+        WHERE i.invoice_id = ANY($1::uuid[])
+    """, [e["id"] for e in fused])
+    by_id = {r["invoice_id"]: dict(r) for r in rows}
+
+    results = []
+    for entry in fused:
+        row = by_id.get(entry["id"])
+        if row is None:  # deleted between the candidate and detail queries
+            continue
+        row["score"] = round(entry["score"], 6)
+        row["keyword_rank"] = entry.get("keyword_rank")
+        row["vector_rank"] = entry.get("vector_rank")
+        if entry["id"] in distances:
+            row["distance"] = distances[entry["id"]]
+            row["similarity"] = max(0, min(100, (1 - row["distance"]) * 100))
+        results.append(row)
+    return {"results": results, **meta}
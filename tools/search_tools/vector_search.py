@@ -0,0 +1,192 @@
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# HNSW candidate list per query (pgvector default is 40); raised to the
+# result limit when smaller, capped at pgvector's maximum of 1000
+VECTOR_EF_SEARCH = int(os.getenv("VECTOR_EF_SEARCH", 100))
+# pgvector >= 0.8 keeps scanning the graph until enough rows pass the
+# user_id filter: "relaxed_order" (fast, re-sorted here), "strict_order" or "off"
+VECTOR_ITERATIVE_SCAN = os.getenv("VECTOR_ITERATIVE_SCAN", "relaxed_order")
+VECTOR_MAX_SCAN_TUPLES = int(os.getenv("VECTOR_MAX_SCAN_TUPLES", 20000))
+# Users with at most this many embedded invoices get an exact scan of their own rows
+VECTOR_EXACT_SCAN_THRESHOLD = int(os.getenv("VECTOR_EXACT_SCAN_THRESHOLD", 5000))
+# Users above this size get their own partial HNSW index (see build_tenant_indexes)
+VECTOR_TENANT_INDEX_MIN_ROWS = int(os.getenv("VECTOR_TENANT_INDEX_MIN_ROWS", 100_000))
+VECTOR_COUNT_TTL_SECONDS = float(os.getenv("VECTOR_COUNT_TTL_SECONDS", 300))
+
+TENANT_INDEX_PREFIX = "invoices_embedding_hnsw_u_"
+ITERATIVE_SCAN_MIN_VERSION = (0, 8, 0)
+
+def _version_tuple(version: str) -> tuple:
+    return tuple(int(p) for p in version.split(".")[:3] if p.isdigit())
+
+def tenant_index_name(user_id: str) -> str:
+    return TENANT_INDEX_PREFIX + hashlib.md5(user_id.encode()).hexdigest()[:16]
+
+class VectorSearcher:
+    """
+    Nearest-invoice lookup over invoices.embedding with per-query tuning.
+
+    - Small tenants (<= exact_threshold embedded rows): exact scan of the
+      user's own rows via idx_invoices_user_embedded. Perfect recall, and
+      cheaper than walking a graph built for every tenant.
+    - Everyone else: HNSW with hnsw.ef_search set for the query and, on
+      pgvector >= 0.8, iterative scans so the user_id filter can't starve
+      the result list. Settings are SET LOCAL inside a transaction, so they
+      never leak to the next user of the pooled connection.
+    """
+
+    def __init__(self, ef_search: int = VECTOR_EF_SEARCH, iterative_scan: str = VECTOR_ITERATIVE_SCAN,
+                 max_scan_tuples: int = VECTOR_MAX_SCAN_TUPLES,
+                 exact_threshold: int = VECTOR_EXACT_SCAN_THRESHOLD):
+        self.ef_search = ef_search
+        self.iterative_scan = iterative_scan
+        self.max_scan_tuples = max_scan_tuples
+        self.exact_threshold = exact_threshold
+        self._pgvector_version: Optional[tuple] = None
+        self._counts: Dict[str, tuple] = {}  # user_id -> (count, fetched_at)
+        self.stats = {"exact": 0, "hnsw": 0, "hnsw_iterative": 0, "errors": 0, "total_ms": 0.0}
+
+    async def pgvector_version(self, conn) -> tuple:
+        if self._pgvector_version is None:
+            version = await conn.fetchval("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            self._pgvector_version = _version_tuple(version or "0")
+        return self._pgvector_version
+
+    async def user_vector_count(self, conn, user_id: str) -> int:
+        """ Embedded invoices for the user; cached briefly, an approximate size is all the planner choice needs. """
+        cached = self._counts.get(user_id)
+        if cached and time.monotonic() - cached[1] < VECTOR_COUNT_TTL_SECONDS:
+            return cached[0]
+        count = await conn.fetchval(
+            "SELECT COUNT(*) FROM invoices WHERE user_id = $1 AND embedding IS NOT NULL", user_id
+        )
+        self._counts[user_id] = (count, time.monotonic())
+        return count
+
+    def invalidate(self, user_id: Optional[str] = None):
+        if user_id is None:
+            self._counts.clear()
+        else:
+            self._counts.pop(user_id, None)
+
+    async def search(self, conn, embedding: List[float], user_id: Optional[str] = None, limit: int = 10,
+                     ef_search: Optional[int] = None, exact: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """
+        Returns [{"invoice_id", "distance"}] nearest first (cosine distance).
+        exact=True/False forces the strategy; by default it is picked from the user's row count.
+        """
+        started = time.perf_counter()
+        try:
+            if exact is None:
+                exact = bool(user_id) and await self.user_vector_count(conn, user_id) <= self.exact_threshold
+            if exact:
+                rows = await self._exact(conn, embedding, user_id, limit)
+                self.stats["exact"] += 1
+            else:
+                rows = await self._hnsw(conn, embedding, user_id, limit, ef_search or self.ef_search)
+            return rows
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self.stats["total_ms"] += (time.perf_counter() - started) * 1000
+
+    async def _exact(self, conn, embedding: List[float], user_id: Optional[str], limit: int):
+        # MATERIALIZED keeps the planner from pushing the ORDER BY into the HNSW index
+        params: List[Any] = [str(embedding), limit]
+        where = "embedding IS NOT NULL"
+        if user_id:
+            params.append(user_id)
+            where += " AND user_id = $3"
+        rows = await conn.fetch(f"""
+            WITH mine AS MATERIALIZED (
+                SELECT invoice_id, embedding FROM invoices WHERE {where}
+            )
+            SELECT invoice_id, embedding <=> $1::vector AS distance
+            FROM mine ORDER BY distance LIMIT $2
+        """, *params)
+        return [dict(r) for r in rows]
+
+    async def _hnsw(self, conn, embedding: List[float], user_id: Optional[str], limit: int, ef_search: int):
+        iterative = self.iterative_scan != "off" and await self.pgvector_version(conn) >= ITERATIVE_SCAN_MIN_VERSION
+        params: List[Any] = [str(embedding), limit]
+        where = "embedding IS NOT NULL"
+        if user_id:
+            params.append(user_id)
+            where += " AND user_id = $3"
+
+        async with conn.transaction():
+            await conn.execute("SELECT set_config('hnsw.ef_search', $1, true)", str(max(min(ef_search, 1000), limit)))
+            if iterative:
+                await conn.execute("SELECT set_config('hnsw.iterative_scan', $1, true)", self.iterative_scan)
+                await conn.execute("SELECT set_config('hnsw.max_scan_tuples', $1, true)", str(self.max_scan_tuples))
+            if user_id:
+                # A generic plan can't prove "user_id = $3" matches a tenant's
+                # partial index predicate; a custom plan sees the literal value
+                await conn.execute("SELECT set_config('plan_cache_mode', 'force_custom_plan', true)")
+            # relaxed_order may return slightly out-of-order rows: re-sort the small result
+            rows = await conn.fetch(f"""
+                WITH nearest AS MATERIALIZED (
+                    SELECT invoice_id, embedding <=> $1::vector AS distance
+                    FROM invoices WHERE {where}
+                    ORDER BY distance LIMIT $2
+                )
+                SELECT invoice_id, distance FROM nearest ORDER BY distance
+            """, *params)
+        self.stats["hnsw_iterative" if iterative else "hnsw"] += 1
+        return [dict(r) for r in rows]
+
+    def get_stats(self) -> Dict[str, Any]:
+        searches = self.stats["exact"] + self.stats["hnsw"] + self.stats["hnsw_iterative"]
+        return {
+            **{k: v for k, v in self.stats.items() if k != "total_ms"},
+            "avg_ms": round(self.stats["total_ms"] / searches, 2) if searches else 0.0,
+            "pgvector": ".".join(map(str, self._pgvector_version)) if self._pgvector_version else None,
+            "ef_search": self.ef_search,
+            "exact_threshold": self.exact_threshold
+        }
+
+vector_searcher = VectorSearcher()
+
+async def build_tenant_indexes(conn, min_rows: int = VECTOR_TENANT_INDEX_MIN_ROWS, drop_stale: bool = True) -> Dict[str, List[str]]:
+    """
+    Creates a partial HNSW index (WHERE user_id = '<tenant>') for every user
+    with at least min_rows embedded invoices, and drops ones whose user fell
+    below half that. Built CONCURRENTLY, so conn must not be in a transaction.
+    """
+    rows = await conn.fetch("""
+        SELECT user_id, COUNT(*) AS n FROM invoices
+        WHERE embedding IS NOT NULL AND user_id IS NOT NULL
+        GROUP BY user_id
+    """)
+    sizes = {r["user_id"]: r["n"] for r in rows}
+    existing = {r["indexname"] for r in await conn.fetch(
+        "SELECT indexname FROM pg_indexes WHERE tablename = 'invoices' AND indexname LIKE $1",
+        TENANT_INDEX_PREFIX + "%"
+    )}
+
+    created, dropped = [], []
+    for user_id, n in sizes.items():
+        name = tenant_index_name(user_id)
+        if n >= min_rows and name not in existing:
+            literal = await conn.fetchval("SELECT quote_literal($1::text)", user_id)
+            print(f"🧱 Building partial HNSW index {name} for {n} invoices...")
+            await conn.execute(f"""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON invoices
+                USING hnsw (embedding vector_cosine_ops)
+                WHERE user_id = {literal} AND embedding IS NOT NULL
+            """)
+            created.append(name)
+
+    if drop_stale:
+        keep = {tenant_index_name(u) for u, n in sizes.items() if n >= min_rows // 2}
+        for name in sorted(existing - keep):
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            dropped.append(name)
+    return {"created": created, "dropped": dropped}
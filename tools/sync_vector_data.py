@@ -12,8 +12,9 @@ from storage.postgres_repository import (
     get_db_connection, 
 )
 from tools.document_tools.llama_cloud_parser import llama_cloud_extract
-from tools.document_tools.ocr_tools import render_pdf_to_images, preprocess_image, ocr_paddle
-from tools.document_tools.extraction_tools import generate_embedding
+from tools.document_tools.ocr_service import ocr_service
+from tools.document_tools.extraction_tools import generate_embeddings
+from tools.document_tools.embedding_service import EMBEDDING_BATCH_SIZE
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -62,15 +63,56 @@ async def extract_text_from_file(file_path, mime_type):
     else:
         # Fallback to standard OCR
         print(f"⚠️ Llama Cloud failed, falling back to standard OCR...")
-        images = render_pdf_to_images(file_path) if mime_type == "application/pdf" else [file_path]
-        for img in images:
-            proc = preprocess_image(img)
-            ocr_res = ocr_paddle(proc)
-            full_text += ocr_res["raw_text"] + "\n"
+        ocr_res = await ocr_service.ocr_document(file_path, mime_type)
+        full_text = ocr_res["raw_text"] + "\n"
     
     return full_text
 
-async def sync():
+async def resolve_raw_text(row):
+    """Returns the invoice's raw_text, extracting it from the stored file only when missing."""
+    if row['raw_text']:
+        return row['raw_text']
+
+    invoice_id = row['invoice_id']
+    file_url = row['file_url']
+
+    # Determine local path or download
+    local_path = None
+    is_temporary = False
+
+    if file_url.startswith("http"):
+        # Download to temp
+        filename = os.path.basename(file_url.split('?')[0])
+        local_path = os.path.join("uploads", "temp_sync", filename)
+        print(f"📥 Downloading {file_url}...")
+        success = await download_file(file_url, local_path)
+        if not success:
+            print(f"❌ Skipping {invoice_id} due to download failure.")
+            return None
+        is_temporary = True
+    else:
+        # Local path
+        path_part = file_url.lstrip('/')
+        if path_part.startswith("uploads/"):
+            local_path = path_part
+        else:
+            local_path = os.path.join("uploads", path_part)
+
+    if not os.path.exists(local_path):
+        print(f"❌ File not found at {local_path}. Skipping.")
+        return None
+
+    mime_type = "application/pdf" if local_path.lower().endswith(".pdf") else "image/jpeg"
+    try:
+        return await extract_text_from_file(local_path, mime_type)
+    except Exception as e:
+        logger.error(f"Failed to extract text for invoice {invoice_id}: {e}")
+        return None
+    finally:
+        if is_temporary and local_path and os.path.exists(local_path):
+            os.remove(local_path)
+
+async def sync(batch_size=EMBEDDING_BATCH_SIZE):
     print("🚀 Starting Retroactive RAG Sync Script...")
     
     conn = await get_db_connection()
@@ -81,79 +123,56 @@ async def sync():
     try:
         # 1. Identify invoices missing raw_text or embedding
         query = """
-            SELECT invoice_id, user_id, vendor_name, file_url 
+            SELECT invoice_id, user_id, vendor_name, file_url, raw_text
             FROM invoices 
             WHERE (raw_text IS NULL OR embedding IS NULL)
-            AND file_url IS NOT NULL
+            AND (file_url IS NOT NULL OR raw_text IS NOT NULL)
         """
         rows = await conn.fetch(query)
         print(f"📊 Found {len(rows)} invoices to sync.")
         
-        for i, row in enumerate(rows):
-            invoice_id = row['invoice_id']
-            file_url = row['file_url']
-            vendor_name = row['vendor_name'] or "Unknown"
-            
-            print(f"\n🔄 [{i+1}/{len(rows)}] Syncing: {vendor_name} ({invoice_id})")
-            
-            # 2. Determine local path or download
-            local_path = None
-            is_temporary = False
-            
-            if file_url.startswith("http"):
-                # Download to temp
-                filename = os.path.basename(file_url.split('?')[0])
-                local_path = os.path.join("uploads", "temp_sync", filename)
-                print(f"📥 Downloading {file_url}...")
-                success = await download_file(file_url, local_path)
-                if not success:
-                    print(f"❌ Skipping {invoice_id} due to download failure.")
-                    continue
-                is_temporary = True
-            else:
-                # Local path
-                path_part = file_url.lstrip('/')
-                if path_part.startswith("uploads/"):
-                    local_path = path_part
+        synced = 0
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            print(f"\n🔄 Batch {start // batch_size + 1}: invoices {start + 1}-{start + len(batch)} of {len(rows)}")
+
+            # 2. Extract text (only for invoices that lack it)
+            texts = {}
+            for row in batch:
+                raw_text = await resolve_raw_text(row)
+                if raw_text:
+                    texts[row['invoice_id']] = (row['vendor_name'] or "Unknown", raw_text)
                 else:
-                    local_path = os.path.join("uploads", path_part)
-            
-            if not os.path.exists(local_path):
-                print(f"❌ File not found at {local_path}. Skipping.")
+                    print(f"⚠️ No text extracted for {row['invoice_id']}.")
+            if not texts:
                 continue
 
-            # 3. Extract Text and Generate Embedding
-            mime_type = "application/pdf" if local_path.lower().endswith(".pdf") else "image/jpeg"
+            # 3. One embedding call per batch
+            print(f"🧠 Generating {len(texts)} embeddings...")
+            embeddings = await generate_embeddings(
+                [f"{vendor_name} {raw_text[:2000]}" for vendor_name, raw_text in texts.values()]
+            )
+
+            # 4. Update Database
             try:
-                raw_text = await extract_text_from_file(local_path, mime_type)
-                if not raw_text:
-                    print(f"⚠️ No text extracted for {invoice_id}.")
-                    continue
-                
-                print(f"🧠 Generating embedding...")
-                embedding_text = f"{vendor_name} {raw_text[:2000]}"
-                embedding = await generate_embedding(embedding_text)
-                
-                # 4. Update Database
-                await conn.execute("""
+                await conn.executemany("""
                     UPDATE invoices 
                     SET raw_text = $1, embedding = $2, updated_at = CURRENT_TIMESTAMP
                     WHERE invoice_id = $3
-                """, raw_text, str(embedding) if embedding else None, invoice_id)
-                
-                print(f"✅ Sync complete for {invoice_id}.")
-            
+                """, [
+                    (raw_text, str(embedding) if embedding else None, invoice_id)
+                    for (invoice_id, (_, raw_text)), embedding in zip(texts.items(), embeddings)
+                ])
+                synced += sum(1 for e in embeddings if e)
+                print(f"✅ Batch stored ({sum(1 for e in embeddings if e)}/{len(texts)} embedded).")
             except Exception as e:
-                logger.error(f"Failed to process invoice {invoice_id}: {e}")
-            
-            finally:
-                if is_temporary and local_path and os.path.exists(local_path):
-                    os.remove(local_path)
+                logger.error(f"Failed to store batch starting at {start + 1}: {e}")
 
     finally:
         await conn.close()
     
-    print("\n🎉 Retroactive sync completed!")
+    ocr_service.shutdown()
+    print(f"\n🎉 Retroactive sync completed! {synced} invoices embedded.")
 
 if __name__ == "__main__":
     asyncio.run(sync())
@@ -1,18 +1,28 @@
-from fastapi import FastAPI, Request, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
 import json
-import httpx
 from typing import List
-from agent_orchestrator.orchestrator import run_agent_loop
+from agent_orchestrator.ingest_queue import ingest_queue
+from agent_orchestrator.keyed_scheduler import agent_scheduler
 from api.admin_api import router as admin_router
 from api.analytics_api import router as analytics_router
 from api.auth_api import router as auth_router
 from api.automation_api import router as automation_router
-from tools.messaging_tools.whatsapp import send_whatsapp
 from tools.notification_engine import NotificationEngine
-from storage.postgres_repository import run_pg_migrations
+from tools.document_tools.ocr_service import ocr_service, OCR_WARM_ON_STARTUP
+from tools.document_tools.extraction_cache import extraction_cache
+from tools.document_tools.embedding_service import embedding_service
+from tools.search_tools.vector_search import vector_searcher
+from storage.vendor_registry import vendor_registry
+from agent_orchestrator.pipeline import pipeline_metrics
+from tools.messaging_tools.whatsapp import init_http_client, close_http_client
+from tools.messaging_tools.outbound_queue import outbound_queue
+from storage.session_cache import session_cache
+from storage.response_cache import response_cache
+from tools.export_jobs import export_jobs
+from storage.postgres_repository import run_pg_migrations, init_db_pool, close_db_pool
 
 class ConnectionManager:
     def __init__(self):
@@ -57,12 +67,16 @@ async def log_requests(request: Request, call_next):
     return response
 
 WHATSAPP_VERIFY_TOKEN = os.getenv("WHATSAPP_VERIFY_TOKEN", "agentic_token")
-WA_TOKEN = os.getenv("WA_TOKEN")
 
 @app.on_event("startup")
 async def startup():
+    await init_db_pool()
     await run_pg_migrations()
+    init_http_client()
+    outbound_queue.start()
     NotificationEngine.set_broadcaster(manager.broadcast)
+    export_jobs.set_broadcaster(manager.broadcast)
+    export_jobs.start()
     
     # Start Background Automation Scheduler
     import asyncio
@@ -73,20 +87,47 @@ async def startup():
             try:
                 print("⏰ Running background automation tasks...")
                 await workflow_service.run_scheduler_tasks()
+                await ingest_queue.purge_finished()
             except Exception as e:
                 print(f"❌ Automation loop error: {e}")
             await asyncio.sleep(3600) # Run every hour
             
     asyncio.create_task(run_automation_loop())
+    ingest_queue.start()
+
+    if OCR_WARM_ON_STARTUP:
+        ocr_service.start()
     print("🚀 Agentic Expense System Ready with Business Automation")
 
+@app.on_event("shutdown")
+async def shutdown():
+    await ingest_queue.stop()
+    await export_jobs.stop()
+    ocr_service.shutdown()
+    await outbound_queue.stop()
+    await close_http_client()
+    await close_db_pool()
+
 @app.get("/health")
 async def health_check():
-    from storage.postgres_repository import check_db_health
+    from storage.postgres_repository import check_db_health, get_pool_stats
     is_healthy, detail = await check_db_health()
     return {
         "status": "healthy" if is_healthy else "degraded",
         "database": detail,
+        "db_pool": get_pool_stats(),
+        "ingest_queue": {**ingest_queue.stats, "depth": await ingest_queue.get_depth()},
+        "agent_scheduler": agent_scheduler.get_stats(),
+        "ocr": ocr_service.get_stats(),
+        "extraction_cache": extraction_cache.get_stats(),
+        "embedding_cache": embedding_service.get_stats(),
+        "vector_search": vector_searcher.get_stats(),
+        "vendor_registry": vendor_registry.get_stats(),
+        "pipeline": pipeline_metrics.get_stats(),
+        "outbound": outbound_queue.get_stats(),
+        "auth_cache": session_cache.get_stats(),
+        "response_cache": response_cache.get_stats(),
+        "export_jobs": export_jobs.get_stats(),
         "environment": os.getenv("ENV", "production")
     }
 
@@ -119,113 +160,47 @@ async def verify_webhook(request: Request):
     return Response(content="Verification Failed", status_code=403)
 
 @app.post("/webhook")
-async def webhook_handler(request: Request, background_tasks: BackgroundTasks):
+async def webhook_handler(request: Request):
+    """
+    Validates the payload and enqueues each message into the durable ingest
+    queue (deduplicated by message id). Media download and the agent loop run
+    in the queue workers, so the ACK no longer waits on Meta's CDN.
+    """
+    from fastapi.responses import JSONResponse
+
     print(f"--- WEBHOOK HIT: {request.method} {request.url.path} ---")
     try:
         raw_body = await request.body()
         print(f"📦 RAW BODY: {raw_body.decode('utf-8')}")
         data = json.loads(raw_body)
+    except Exception as e:
+        print(f"❌ Webhook Handler Error: invalid payload ({e})")
+        return {"status": "error", "message": "invalid payload"}
         
-        if data.get("object") != "whatsapp_business_account":
-            return {"status": "ok"}
-
-        for entry in data.get("entry", []):
-            for change in entry.get("changes", []):
-                value = change.get("value", {})
-                if "messages" in value:
-                    for msg in value["messages"]:
-                        user_phone = msg.get("from")
-                        msg_id = msg.get("id", "TEST_ID")
-                        text_body = msg.get("text", {}).get("body", "") if "text" in msg else None
-                        print(f"📩 Processing message [{msg_id}] from {user_phone}: '{text_body}'")
-                        
-                        # Deduplication check
-                        from storage.postgres_repository import get_db_connection
-                        conn = await get_db_connection()
-                        if conn:
-                            try:
-                                existing = await conn.fetchval(
-                                    "SELECT message_id FROM processed_messages WHERE message_id = $1",
-                                    msg_id
-                                )
-                                if existing:
-                                    print(f"⏭️ Skipping duplicate message {msg_id}")
-                                    await conn.close()
-                                    continue
-                                
-                                # Mark as processed immediately
-                                await conn.execute(
-                                    "INSERT INTO processed_messages (message_id, user_phone, message_type) VALUES ($1, $2, $3) ON CONFLICT DO NOTHING",
-                                    msg_id, user_phone, msg.get("type", "unknown")
-                                )
-                            finally:
-                                await conn.close()
-                        
-                        # Handle Media
-                        media_path = None
-                        mime_type = None
-                        
-                        if "image" in msg:
-                            print(f"📸 Image detected in message {msg_id}")
-                            image_id = msg["image"]["id"]
-                            mime_type = msg["image"].get("mime_type", "image/jpeg")
-                            # Immediate feedback
-                            background_tasks.add_task(send_whatsapp, user_phone, "📸 I've received your receipt. Processing it now... ⏳")
-                            media_path = await download_wa_media(image_id, mime_type)
-                        elif "document" in msg:
-                            print(f"📄 Document detected in message {msg_id}")
-                            doc_id = msg["document"]["id"]
-                            mime_type = msg["document"].get("mime_type", "application/pdf")
-                            # Immediate feedback
-                            background_tasks.add_task(send_whatsapp, user_phone, "📄 I've received your document. Reading the details... ⏳")
-                            media_path = await download_wa_media(doc_id, mime_type)
-                        elif "audio" in msg:
-                            print(f"🔊 Audio detected (not supported yet) in {msg_id}")
-
-                        text_body = msg.get("text", {}).get("body", "") if "text" in msg else None
-                        
-                        # For images/docs with captions
-                        if not text_body:
-                            if "image" in msg: text_body = msg["image"].get("caption")
-                            elif "document" in msg: text_body = msg["document"].get("caption")
-
-                        document_id = None
-                        if "image" in msg: document_id = msg["image"]["id"]
-                        elif "document" in msg: document_id = msg["document"]["id"]
-
-                        print(f"🏃 Handing off to Agent: user={user_phone}, text='{text_body}', media={bool(media_path)}")
-                        background_tasks.add_task(run_agent_loop, user_phone, text_body, media_path, mime_type, document_id)
-        
+    if data.get("object") != "whatsapp_business_account":
         return {"status": "ok"}
-    except Exception as e:
-        print(f"❌ Webhook Handler Error: {e}")
-        return {"status": "error", "message": str(e)}
 
-async def download_wa_media(media_id, mime_type):
-    if not WA_TOKEN: return None
-    url = f"https://graph.facebook.com/v17.0/{media_id}"
-    headers = {"Authorization": f"Bearer {WA_TOKEN}"}
+    for entry in data.get("entry", []):
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            for msg in value.get("messages", []):
+                if not msg.get("from"):
+                    continue
+                try:
+                    job_id = await ingest_queue.enqueue_message(msg)
+                except Exception as e:
+                    print(f"❌ Webhook enqueue error for {msg.get('id')}: {e}")
+                    job_id = None
+
+                if job_id is None:
+                    # Not persisted: ask Meta to redeliver rather than dropping the message
+                    return JSONResponse(status_code=503, content={"status": "error", "message": "queue unavailable"})
+                if job_id == "":
+                    print(f"⏭️ Skipping duplicate message {msg.get('id')}")
+                else:
+                    print(f"📩 Queued message [{msg.get('id')}] from {msg.get('from')} as job {job_id}")
     
-    async with httpx.AsyncClient() as client:
-        res = await client.get(url, headers=headers)
-        if res.status_code != 200: return None
-        media_url = res.json().get("url")
-        
-        # Download actual file
-        res = await client.get(media_url, headers=headers)
-        if res.status_code != 200: return None
-        
-        # Determine extension
-        ext = "bin"
-        if "pdf" in mime_type: ext = "pdf"
-        elif "png" in mime_type: ext = "png"
-        elif "jpeg" in mime_type or "jpg" in mime_type: ext = "jpg"
-        
-        os.makedirs("uploads", exist_ok=True)
-        local_path = os.path.join("uploads", f"{media_id}.{ext}")
-        with open(local_path, "wb") as f:
-            f.write(res.content)
-        return local_path
+    return {"status": "ok"}
 
 # Serve Uploads
 os.makedirs("uploads", exist_ok=True)